@@ -2,22 +2,40 @@
 Module for processing and converting audio files.
 """
 import os
-import wave
 import tempfile
 import subprocess
 from pathlib import Path
 
+from bluetooth_audio_player import dsp
+from bluetooth_audio_player import utils
+from bluetooth_audio_player.config import DEFAULT_CONFIG
+from bluetooth_audio_player.sources import PcmPipeReader, open_wav
+
+_ffmpeg_warned = False
+
 def check_ffmpeg():
-    """Check if FFmpeg is installed and available."""
-    try:
-        subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    """Check if FFmpeg is installed and available; the probe runs once per process."""
+    global _ffmpeg_warned
+    if utils.tool_version("ffmpeg") is not None:
         return True
-    except (subprocess.SubprocessError, FileNotFoundError):
+    if not _ffmpeg_warned:
+        _ffmpeg_warned = True
         print("Warning: ffmpeg not found. Audio format conversion may not work properly.")
-        return False
+    return False
 
-def get_audio_info(audio_path):
-    """Get audio file information using FFmpeg."""
+def get_audio_info(audio_path, index=None):
+    """
+    Get audio file information using FFmpeg. With a MediaIndex given, the
+    indexed metadata is returned and FFmpeg only runs for files it does not
+    know yet.
+    """
+    if index is not None:
+        info = index.info(audio_path)
+        if "error" in info:
+            print(f"Error getting audio info: {info['error']}")
+            return None
+        return info
+    
     if not check_ffmpeg():
         return None
         
@@ -39,8 +57,8 @@ def get_audio_info(audio_path):
         print(f"Error getting audio info: {e}")
         return None
 
-def check_audio_file(audio_file):
-    """Check if an audio file exists and get its details."""
+def check_audio_file(audio_file, index=None):
+    """Check if an audio file exists and get its details, from the MediaIndex if one is given."""
     if not os.path.exists(audio_file):
         print(f"ERROR: Audio file not found: {audio_file}")
         return False
@@ -50,7 +68,7 @@ def check_audio_file(audio_file):
     
     if file_extension == '.wav':
         try:
-            with wave.open(audio_file, 'rb') as wf:
+            with open_wav(audio_file) as wf:
                 print(f"WAV file details: {audio_file}")
                 print(f"  Channels: {wf.getnchannels()}")
                 print(f"  Sample width: {wf.getsampwidth()} bytes")
@@ -63,7 +81,7 @@ def check_audio_file(audio_file):
             return False
     else:
         # For non-WAV files, use FFmpeg to gather information
-        info = get_audio_info(audio_file)
+        info = get_audio_info(audio_file, index)
         if info:
             print(f"Audio file details: {audio_file}")
             for key, value in info.items():
@@ -71,22 +89,58 @@ def check_audio_file(audio_file):
             return True
         return False
 
-def convert_audio_to_wav(input_path):
-    """Convert any audio file to WAV format using FFmpeg."""
+def _range_args(start=None, end=None):
+    """
+    FFmpeg input options limiting decoding to start..end seconds. Given
+    before ``-i`` they make FFmpeg seek in the input rather than decode and
+    discard everything up to start.
+    """
+    args = []
+    if start:
+        args += ["-ss", f"{start:.6f}"]
+    if end is not None:
+        args += ["-t", f"{end - (start or 0):.6f}"]
+    return args
+
+def convert_audio_to_wav(input_path, output_path=None, output_format=None, start=None, end=None):
+    """
+    Convert any audio file to WAV format using FFmpeg.
+    
+    Args:
+        input_path: Audio file to convert
+        output_path: Where to write the WAV (defaults to a temporary file)
+        output_format: Dict with sample_rate, sample_width and channels
+            (defaults to 16-bit stereo at 44.1kHz)
+        start: Seconds into the input to start converting at (optional)
+        end: Seconds into the input to stop converting at (optional)
+    """
     if not check_ffmpeg():
         print("FFmpeg not found. Cannot convert audio format.")
         return None
     
+    if output_format is None:
+        output_format = DEFAULT_CONFIG["output_format"]
+    sample_rate = output_format["sample_rate"]
+    sample_width = output_format["sample_width"]
+    codec = "pcm_u8" if sample_width == 1 else f"pcm_s{sample_width * 8}le"
+    
     try:
-        temp_dir = tempfile.gettempdir()
-        output_wav_path = os.path.join(temp_dir, f"converted_{os.path.basename(input_path)}.wav")
+        if output_path is None:
+            temp_dir = tempfile.gettempdir()
+            name = os.path.basename(input_path)
+            if start or end is not None:
+                # Excerpts of one file must not overwrite each other
+                name += f"_{start or 0:g}-" + ("end" if end is None else f"{end:g}")
+            output_path = os.path.join(temp_dir, f"converted_{name}.wav")
         
-        print(f"Converting audio to 16-bit PCM WAV at 44.1kHz...")
-        cmd = ["ffmpeg", "-i", input_path, "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2", "-y", output_wav_path]
+        print(f"Converting audio to {sample_width * 8}-bit PCM WAV at {sample_rate / 1000:g}kHz...")
+        cmd = ["ffmpeg", *_range_args(start, end), "-i", input_path, "-acodec", codec,
+               "-ar", str(sample_rate), "-ac", str(output_format["channels"]),
+               "-f", "wav", "-y", output_path]
         result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
         
-        print(f"Conversion successful: {output_wav_path}")
-        return output_wav_path
+        print(f"Conversion successful: {output_path}")
+        return output_path
     except subprocess.CalledProcessError as e:
         print(f"Error converting audio format: {e}")
         print(f"ffmpeg stderr: {e.stderr.decode('utf-8')}")
@@ -95,10 +149,74 @@ def convert_audio_to_wav(input_path):
         print(f"Unexpected error during conversion: {e}")
         return None
 
-def check_wav_format(wav_path):
-    """Check if a WAV file needs conversion to 16-bit PCM."""
+def convert_audio_to_wav_cached(input_path, cache, output_format=None, start=None, end=None):
+    """
+    Convert an audio file through the conversion cache.
+    A cache hit returns the stored file without running FFmpeg. Excerpts
+    are cached under their own key.
+    """
+    if output_format is None:
+        output_format = DEFAULT_CONFIG["output_format"]
+    
+    try:
+        key = cache.key_for(input_path, output_format, start, end)
+    except OSError as e:
+        print(f"Error hashing audio file: {e}")
+        return convert_audio_to_wav(input_path, output_format=output_format, start=start, end=end)
+    
+    cached_path = cache.lookup(key)
+    if cached_path:
+        print(f"Using cached conversion: {cached_path}")
+        return cached_path
+    return _convert_into_cache(input_path, cache, key, output_format, start, end)
+
+def _convert_into_cache(input_path, cache, key, output_format, start=None, end=None):
+    """Convert an audio file and store the result in the cache under key."""
+    temp_path = cache.temp_path_for(key)
+    if not convert_audio_to_wav(input_path, temp_path, output_format, start, end):
+        utils.clean_temp_files(temp_path)
+        return None
+    return cache.store(key, temp_path)
+
+def stream_audio_file(input_path, output_format=None, start=None, end=None):
+    """
+    Decode any audio file with FFmpeg straight into a pipe.
+    
+    Returns a reader with the same interface as a ``wave`` reader that
+    delivers PCM in output_format (16-bit stereo at 44.1kHz by default)
+    while FFmpeg is still decoding, so playback can start without waiting
+    for a full conversion and nothing is written to disk. With start or
+    end given (in seconds) only that range is decoded.
+    """
+    if not check_ffmpeg():
+        print("FFmpeg not found. Cannot decode audio format.")
+        return None
+    
+    if output_format is None:
+        output_format = DEFAULT_CONFIG["output_format"]
+    sample_rate = output_format["sample_rate"]
+    sample_width = output_format["sample_width"]
+    channels = output_format["channels"]
+    raw_format = "u8" if sample_width == 1 else f"s{sample_width * 8}le"
+    
+    try:
+        print(f"Streaming audio as {sample_width * 8}-bit PCM at {sample_rate / 1000:g}kHz...")
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", *_range_args(start, end), "-i", input_path,
+               "-f", raw_format, "-acodec", f"pcm_{raw_format}", "-ar", str(sample_rate),
+               "-ac", str(channels), "pipe:1"]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return PcmPipeReader(process.stdout, sample_width, channels, sample_rate, process=process)
+    except Exception as e:
+        print(f"Unexpected error starting audio stream: {e}")
+        return None
+
+def check_wav_format(wav_path, output_format=None):
+    """Check if a WAV file needs conversion to 16-bit PCM at the output sample rate."""
+    if output_format is None:
+        output_format = DEFAULT_CONFIG["output_format"]
+    target_rate = output_format["sample_rate"]
     try:
-        with wave.open(wav_path, 'rb') as wf:
+        with open_wav(wav_path) as wf:
             sample_width = wf.getsampwidth()
             sample_rate = wf.getframerate()
             channels = wf.getnchannels()
@@ -106,22 +224,48 @@ def check_wav_format(wav_path):
             print(f"Audio format check: Sample width={sample_width}, Sample rate={sample_rate}, Channels={channels}")
             
             # Check if conversion is needed
-            needs_conversion = sample_width != 2 or sample_rate != 44100 or channels > 2
+            needs_conversion = sample_width != 2 or sample_rate != target_rate or channels > 2
             
             if needs_conversion:
                 print(f"Conversion needed: Current format is {sample_width*8}-bit, {sample_rate} Hz, {channels} channels")
             else:
-                print("No conversion needed: Already 16-bit PCM at 44.1kHz with 1-2 channels")
+                print(f"No conversion needed: Already 16-bit PCM at {target_rate / 1000:g}kHz with 1-2 channels")
                 
             return needs_conversion
     except Exception as e:
         print(f"Error checking WAV format: {e}")
         return True  # Assume conversion needed if there's an error
 
-def prepare_audio_file(audio_path):
+def can_convert_in_process(wav_path, output_format=None, resample=False):
+    """
+    Check whether the DSP stage can make a WAV file playable during playback.
+    Sample format and channel count can be converted in process; the sample
+    rate still needs FFmpeg unless resample is set, i.e. playback resamples
+    to each device's native rate anyway.
+    """
+    if not dsp.available():
+        return False
+    if resample:
+        return True
+    if output_format is None:
+        output_format = DEFAULT_CONFIG["output_format"]
+    try:
+        with open_wav(wav_path) as wf:
+            return wf.getframerate() == output_format["sample_rate"]
+    except Exception:
+        return False
+
+def prepare_audio_file(audio_path, output_format=None, cache=None, resample=False,
+                       start=None, end=None):
     """
     Prepare any audio file for playback.
-    Returns the path to a playable WAV file.
+    Returns the path to a playable WAV file. When a ConversionCache is given,
+    converted files are kept in it and reused on later calls. With resample
+    set, WAV files at another sample rate are left to playback to resample.
+    
+    With start or end given (in seconds) a converted file only holds that
+    range. A WAV file used as it is still holds all of it, which the caller
+    recognises by the path it got back being audio_path, and seeks in it.
     """
     # Check if the file exists
     if not os.path.exists(audio_path):
@@ -130,14 +274,114 @@ def prepare_audio_file(audio_path):
         
     file_extension = Path(audio_path).suffix.lower()
     
-    # If not a WAV file, convert it
-    if file_extension != '.wav':
-        converted_path = convert_audio_to_wav(audio_path)
-        return converted_path
+    # WAV files that are already playable, or that the DSP stage can convert, are used as they are
+    if file_extension == '.wav':
+        if not check_wav_format(audio_path, output_format):
+            return audio_path
+        if can_convert_in_process(audio_path, output_format, resample):
+            print("Format will be converted in process during playback")
+            return audio_path
+    
+    if cache is not None:
+        return convert_audio_to_wav_cached(audio_path, cache, output_format, start, end)
+    return convert_audio_to_wav(audio_path, output_format=output_format, start=start, end=end)
+
+def prepare_audio_stream(audio_path, output_format=None, resample=False, start=None, end=None):
+    """
+    Open any audio file for streaming playback.
+    Returns an open reader; WAV files that are already playable are read
+    directly and everything else is decoded on the fly by FFmpeg. With
+    resample set, WAV files at another sample rate are read directly too.
+    With start or end given (in seconds) the reader only delivers that range.
+    """
+    if not os.path.exists(audio_path):
+        print(f"ERROR: Audio file not found: {audio_path}")
+        return None
+    
+    file_extension = Path(audio_path).suffix.lower()
+    
+    if file_extension == '.wav' and (not check_wav_format(audio_path, output_format)
+                                     or can_convert_in_process(audio_path, output_format, resample)):
+        try:
+            return open_wav(audio_path, start, end)
+        except Exception as e:
+            print(f"Error opening WAV file: {e}")
+            return None
+    
+    return stream_audio_file(audio_path, output_format, start, end)
+
+def _indexed_format(info):
+    """The (sample width, channels, rate) of indexed integer PCM, or None for anything else."""
+    if not info or "error" in info or not str(info.get("codec_name", "")).startswith(("pcm_s", "pcm_u")):
+        return None
+    return (info.get("sample_width"), info.get("channels"), info.get("sample_rate"))
+
+def open_playlist_track(audio_path, output_format=None, cache=None, stream=False, index=None,
+                        cache_executor=None):
+    """
+    Open one playlist track in exactly the output format.
+    
+    Every track of a gapless playlist has to share one format, so unlike
+    prepare_audio_file this converts anything that differs from output_format.
+    Returns a tuple of (reader, temporary file to delete after playback or
+    None), or None if the track cannot be opened. With a MediaIndex given,
+    tracks it knows to be unreadable are skipped and WAV files it knows to
+    be in another format go straight to conversion. With an executor given
+    as cache_executor, a track missing from the cache is streamed while the
+    executor converts it into the cache for the next time it is played.
+    """
+    if not os.path.exists(audio_path):
+        print(f"ERROR: Audio file not found: {audio_path}")
+        return None
+    
+    if output_format is None:
+        output_format = DEFAULT_CONFIG["output_format"]
+    target = (output_format["sample_width"], output_format["channels"], output_format["sample_rate"])
+    
+    info = index.lookup(audio_path) if index is not None else None
+    if info is not None and "error" in info:
+        print(f"Skipping unreadable track {audio_path}: {info['error']}")
+        return None
+    
+    if Path(audio_path).suffix.lower() == '.wav' and (info is None or _indexed_format(info) == target):
+        try:
+            wf = open_wav(audio_path)
+            if not wf.is_float and (wf.getsampwidth(), wf.getnchannels(), wf.getframerate()) == target:
+                return wf, None
+            wf.close()
+        except Exception:
+            pass
+    
+    if not stream and cache is not None and cache_executor is not None:
+        try:
+            key = cache.key_for(audio_path, output_format)
+        except OSError as e:
+            print(f"Error hashing audio file: {e}")
+            key = None
+        cached_path = cache.lookup(key) if key else None
+        if cached_path:
+            print(f"Using cached conversion: {cached_path}")
+            return open_wav(cached_path), None
+        if key:
+            reader = stream_audio_file(audio_path, output_format)
+            if reader:
+                cache_executor.submit(_convert_into_cache, audio_path, cache, key, output_format)
+                return reader, None
+    
+    if stream:
+        reader = stream_audio_file(audio_path, output_format)
+        return (reader, None) if reader else None
+    
+    if cache is not None:
+        wav_path = convert_audio_to_wav_cached(audio_path, cache, output_format)
+        temp_path = None
     else:
-        # Check if the WAV file needs conversion
-        if check_wav_format(audio_path):
-            converted_path = convert_audio_to_wav(audio_path)
-            return converted_path
-        else:
-            return audio_path
\ No newline at end of file
+        # A unique name, since the same file may be queued twice and converted while it plays
+        fd, temp_path = tempfile.mkstemp(prefix="converted_", suffix=".wav")
+        os.close(fd)
+        wav_path = convert_audio_to_wav(audio_path, temp_path, output_format)
+        if not wav_path:
+            utils.clean_temp_files(temp_path)
+    if not wav_path:
+        return None
+    return open_wav(wav_path), temp_path
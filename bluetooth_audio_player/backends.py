@@ -0,0 +1,385 @@
+"""
+Audio backends.
+
+A backend is any object offering the part of PyAudio's interface the player
+uses: ``get_device_count``, ``get_device_info_by_index``,
+``get_format_from_width``, ``open`` and ``terminate``, with streams that
+support blocking ``write`` as well as callback mode. PyAudio is the real
+backend; SimulatedBackend stands in for hardware in benchmarks and CI, with
+sinks that consume audio in real time and optional jitter, latency and
+injected failures.
+"""
+import time
+import random
+import threading
+
+BACKENDS = ("pyaudio", "simulated")
+
+# PyAudio's sample format and callback return constants
+paFloat32, paInt32, paInt24, paInt16, paUInt8 = 1, 2, 4, 8, 32
+paContinue, paComplete, paAbort = 0, 1, 2
+paOutputUnderflow = 4
+
+FORMAT_WIDTHS = {paUInt8: 1, paInt16: 2, paInt24: 3, paInt32: 4, paFloat32: 4}
+
+
+def open_backend(name="pyaudio", **options):
+    """
+    Create an audio backend by name.
+
+    Args:
+        name: One of BACKENDS
+        options: Keyword arguments for the simulated backend
+    """
+    if name == "pyaudio":
+        import pyaudio
+        return pyaudio.PyAudio()
+    if name == "simulated":
+        return SimulatedBackend(**options)
+    raise ValueError(f"Unknown audio backend: {name}")
+
+
+def backend_spec(p):
+    """
+    Return the (name, options) that open_backend needs to create another
+    backend like ``p``, e.g. in a worker process.
+    """
+    p = getattr(p, "backend", p)
+    if isinstance(p, SimulatedBackend):
+        return ("simulated", dict(p.options))
+    return ("pyaudio", {})
+
+
+class SimulatedStream:
+    """An output stream that plays into a simulated device at real-time rate."""
+
+    def __init__(self, backend, device_index, sample_width, channels, rate,
+                 frames_per_buffer=1024, stream_callback=None, start=True):
+        self.device_index = device_index
+        self.frame_size = sample_width * channels
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        # The host buffers one stream buffer on top of the device's own latency
+        self.latency = backend.latency + frames_per_buffer / rate
+        self._backend = backend
+        self._callback = stream_callback
+        self._active = False
+        self._thread = None
+        self._deadline = None
+        self.frames_written = 0
+        self.underruns = 0
+        self.first_write = None
+        self.failed = False
+
+        if start:
+            self.start_stream()
+
+    def _seconds(self, frames):
+        return frames / self.rate / self._backend.speed
+
+    def _check_failure(self):
+        fail_after = self._backend.fail_devices.get(self.device_index)
+        if fail_after is not None and self.frames_written >= fail_after * self.rate:
+            self.failed = True
+            raise OSError(f"Simulated failure of device {self.device_index}")
+
+    def write(self, frames, num_frames=None, exception_on_underflow=False):
+        """Queue audio on the device, blocking while its buffer is full."""
+        # PyAudio only accepts bytes here
+        if not isinstance(frames, bytes):
+            raise TypeError("a bytes object is required")
+        self._check_failure()
+
+        now = time.perf_counter()
+        if self.first_write is None:
+            self.first_write = now
+            self._deadline = now
+        elif now > self._deadline:
+            # Everything queued has already played: the device ran dry
+            self.underruns += 1
+            self._deadline = now
+
+        count = len(frames) // self.frame_size
+        self.frames_written += count
+        self._deadline += self._seconds(count)
+
+        # Return once no more than the device's latency worth of audio is queued
+        wait = self._deadline - self.latency - time.perf_counter() + self._backend.jitter()
+        if wait > 0:
+            time.sleep(wait)
+
+    def get_write_available(self):
+        """Frames that can be written without blocking."""
+        capacity = int(self.latency * self.rate)
+        if self._deadline is None:
+            return capacity
+        queued = (self._deadline - time.perf_counter()) * self._backend.speed * self.rate
+        return capacity - min(max(int(queued), 0), capacity)
+
+    def _run_callbacks(self):
+        due = time.perf_counter()
+        period = self._seconds(self.frames_per_buffer)
+        status = 0
+        while self._active:
+            try:
+                self._check_failure()
+                data, flag = self._callback(None, self.frames_per_buffer, {}, status)
+            except Exception:
+                self._active = False
+                break
+            if self.first_write is None:
+                self.first_write = time.perf_counter()
+            self.frames_written += len(data) // self.frame_size
+            if flag != paContinue:
+                self._active = False
+                break
+
+            due += period
+            now = time.perf_counter()
+            status = 0
+            if now > due + self.latency:
+                # The callback was later than the device's buffer could cover
+                self.underruns += 1
+                status = paOutputUnderflow
+                due = now
+            wait = due - now + self._backend.jitter()
+            if wait > 0:
+                time.sleep(wait)
+
+    def start_stream(self):
+        self._active = True
+        if self._callback is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run_callbacks, daemon=True)
+            self._thread.start()
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def is_active(self):
+        return self._active
+
+    def is_stopped(self):
+        return not self._active
+
+    def get_output_latency(self):
+        return self.latency
+
+    def close(self):
+        self.stop_stream()
+
+
+class SimulatedBackend:
+    """A PyAudio stand-in with a configurable number of simulated output devices."""
+
+    def __init__(self, devices=8, latency_ms=50.0, jitter_ms=0.0, fail_devices=None,
+                 speed=1.0, seed=None, rates=None, open_delay_ms=0.0):
+        """
+        Args:
+            devices: Number of output devices
+            latency_ms: Audio each device buffers ahead, in milliseconds
+            jitter_ms: Standard deviation of the random delay added to every
+                write or callback, in milliseconds
+            fail_devices: Dict of device index to seconds of audio after which
+                that device fails
+            speed: Playback speed relative to real time
+            seed: Seed for the jitter generator
+            rates: Dict of device index to native sample rate (44.1kHz if not listed)
+            open_delay_ms: Longest time opening a stream takes, in milliseconds;
+                every open takes a random share of it, like real devices do
+        """
+        self.options = {"devices": devices, "latency_ms": latency_ms, "jitter_ms": jitter_ms,
+                        "fail_devices": fail_devices, "speed": speed, "seed": seed, "rates": rates,
+                        "open_delay_ms": open_delay_ms}
+        self.devices = devices
+        self.latency = latency_ms / 1000
+        self.jitter_s = jitter_ms / 1000
+        self.fail_devices = dict(fail_devices or {})
+        self.speed = speed
+        self.rates = dict(rates or {})
+        self.open_delay_s = open_delay_ms / 1000
+        self.streams = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def jitter(self):
+        if not self.jitter_s:
+            return 0.0
+        with self._lock:
+            return self._random.gauss(0.0, self.jitter_s)
+
+    def get_device_count(self):
+        return self.devices
+
+    def get_device_info_by_index(self, index):
+        if not 0 <= index < self.devices:
+            raise IOError(f"Invalid device index: {index}")
+        return {
+            'index': index,
+            'name': f"Simulated Device {index}",
+            'hostApi': 0,
+            'maxInputChannels': 0,
+            'maxOutputChannels': 2,
+            'defaultSampleRate': float(self.rates.get(index, 44100)),
+            'defaultLowOutputLatency': self.latency,
+            'defaultHighOutputLatency': self.latency,
+        }
+
+    def get_format_from_width(self, width, unsigned=True):
+        if width == 1:
+            return paUInt8 if unsigned else paInt16
+        return {2: paInt16, 3: paInt24, 4: paFloat32}[width]
+
+    def get_sample_size(self, format):
+        return FORMAT_WIDTHS[format]
+
+    def open(self, rate, channels, format, input=False, output=False, output_device_index=None,
+             frames_per_buffer=1024, start=True, stream_callback=None, **kwargs):
+        if input or not output:
+            raise IOError("Simulated devices only support output")
+        index = 0 if output_device_index is None else output_device_index
+        self.get_device_info_by_index(index)
+        if self.open_delay_s:
+            with self._lock:
+                delay = self._random.uniform(0.0, self.open_delay_s)
+            time.sleep(delay)
+        stream = SimulatedStream(self, index, FORMAT_WIDTHS[format], channels, rate,
+                                 frames_per_buffer, stream_callback, start)
+        with self._lock:
+            self.streams.append(stream)
+        return stream
+
+    def terminate(self):
+        for stream in self.streams:
+            stream.close()
+
+
+class PooledStream:
+    """A blocking output stream that goes back to its StreamPool when closed."""
+
+    def __init__(self, pool, key, stream):
+        self._pool = pool
+        self._key = key
+        self._stream = stream
+        self.broken = False
+
+    def write(self, frames, *args, **kwargs):
+        try:
+            self._stream.write(frames, *args, **kwargs)
+        except Exception:
+            # Never hand a failed stream to the next session
+            self.broken = True
+            raise
+        self._pool._written()
+
+    def stop_stream(self):
+        # Keep the stream running between sessions so the device stays awake
+        pass
+
+    def close(self):
+        self._pool._release(self._key, self)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class StreamPool:
+    """
+    Backend wrapper that keeps device streams open between playback sessions.
+
+    Opening a stream, particularly on a Bluetooth device, can take longer
+    than the rest of starting playback. Blocking output streams opened
+    through the pool are parked when closed and handed out again to the next
+    session opening the same device with the same format and buffer size.
+    Callback streams are opened on the wrapped backend as usual.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.first_write = None
+        self.started = threading.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def open(self, rate, channels, format, output=False, output_device_index=None,
+             frames_per_buffer=None, stream_callback=None, **kwargs):
+        if stream_callback is not None or not output:
+            return self.backend.open(rate=rate, channels=channels, format=format, output=output,
+                                     output_device_index=output_device_index,
+                                     stream_callback=stream_callback,
+                                     **self._buffer_option(frames_per_buffer), **kwargs)
+        key = (output_device_index, rate, channels, format, frames_per_buffer)
+        with self._lock:
+            parked = self._idle.pop(output_device_index, None)
+        if parked is not None:
+            if parked._key == key:
+                return parked
+            parked._stream.close()
+        stream = self.backend.open(rate=rate, channels=channels, format=format, output=True,
+                                   output_device_index=output_device_index,
+                                   **self._buffer_option(frames_per_buffer), **kwargs)
+        return PooledStream(self, key, stream)
+
+    @staticmethod
+    def _buffer_option(frames_per_buffer):
+        return {"frames_per_buffer": frames_per_buffer} if frames_per_buffer else {}
+
+    def warm(self, device_indices, audio_format, buffer_sizes=None):
+        """
+        Open and park streams so the first session starts without opening any.
+
+        Args:
+            device_indices: Devices to open
+            audio_format: Tuple of (sample width, channels, frame rate)
+            buffer_sizes: Dict of device index to frames per buffer (optional)
+        """
+        width, channels, rate = audio_format
+        for idx in device_indices:
+            try:
+                stream = self.open(rate=rate, channels=channels,
+                                   format=self.backend.get_format_from_width(width), output=True,
+                                   output_device_index=idx,
+                                   frames_per_buffer=(buffer_sizes or {}).get(idx))
+                stream.close()
+            except Exception as e:
+                print(f"Error opening stream on device {idx}: {e}")
+
+    def mark(self):
+        """Start timing the next session: first_write is set by its first write to any device."""
+        self.first_write = None
+        self.started.clear()
+
+    def _written(self):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+            self.started.set()
+
+    def _release(self, key, stream):
+        if stream.broken:
+            stream._stream.close()
+            return
+        with self._lock:
+            previous = self._idle.get(key[0])
+            self._idle[key[0]] = stream
+        if previous is not None and previous is not stream:
+            previous._stream.close()
+
+    def close_idle(self):
+        """Close every parked stream."""
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+        for stream in idle:
+            try:
+                stream._stream.stop_stream()
+                stream._stream.close()
+            except Exception:
+                pass
+
+    def terminate(self):
+        self.close_idle()
+        self.backend.terminate()
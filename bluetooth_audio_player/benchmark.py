@@ -0,0 +1,600 @@
+"""
+Benchmarks for the playback hot path.
+
+These run without audio hardware. Use
+``python -m bluetooth_audio_player.benchmark <name> --help`` for options.
+"""
+import io
+import os
+import sys
+import time
+import wave
+import argparse
+import tempfile
+import subprocess
+import threading
+import contextlib
+import tracemalloc
+
+from bluetooth_audio_player import dsp
+from bluetooth_audio_player import playback
+from bluetooth_audio_player.backends import SimulatedBackend
+from bluetooth_audio_player.live import LIVE_RING_SLOTS, LiveSource
+from bluetooth_audio_player.metrics import DeviceMetrics, MetricsRegistry
+from bluetooth_audio_player.ring_buffer import ChunkRing
+from bluetooth_audio_player.sources import PcmPipeReader, open_wav
+from bluetooth_audio_player.sync import DriftMonitor
+
+
+def make_test_wav(path, seconds, rate=44100, channels=2, sample_width=2):
+    """Write a WAV file of the given length filled with noise."""
+    frames = int(seconds * rate)
+    block = os.urandom(rate * channels * sample_width)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(rate)
+        for _ in range(frames // rate):
+            wf.writeframes(block)
+        wf.writeframes(block[:(frames % rate) * channels * sample_width])
+
+
+def _read_chunks(reader, chunk_size, consumers, materialize):
+    """
+    Pull every chunk from reader and hand it to a number of consumers.
+    Returns (audio buffers allocated, bytes allocated).
+    """
+    buffers = 0
+    allocated = 0
+    data = reader.readframes(chunk_size)
+    while data:
+        if materialize and type(data) is not bytes:
+            data = bytes(data)
+        if type(data) is bytes:
+            buffers += 1
+            allocated += len(data)
+        for _ in range(consumers):
+            len(data)
+        data = reader.readframes(chunk_size)
+    return buffers, allocated
+
+
+def bench_wav_source(seconds=60, sinks=8, chunk_size=1024):
+    """
+    Compare ways of feeding one WAV file to several sinks.
+
+    Reports CPU time and audio buffer allocations per device-second, i.e.
+    per second of audio delivered to one device.
+    """
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        make_test_wav(path, seconds)
+        device_seconds = seconds * sinks
+
+        def wave_per_device():
+            totals = [0, 0]
+            for _ in range(sinks):
+                with wave.open(path, 'rb') as wf:
+                    buffers, allocated = _read_chunks(wf, chunk_size, 1, True)
+                totals[0] += buffers
+                totals[1] += allocated
+            return totals
+
+        def wave_shared():
+            with wave.open(path, 'rb') as wf:
+                return _read_chunks(wf, chunk_size, sinks, True)
+
+        def mmap_shared():
+            with open_wav(path) as wf:
+                return _read_chunks(wf, chunk_size, sinks, True)
+
+        def mmap_views():
+            with open_wav(path) as wf:
+                return _read_chunks(wf, chunk_size, sinks, False)
+
+        cases = [
+            ("wave reader per device", wave_per_device),
+            ("shared wave reader", wave_shared),
+            ("shared mmap reader, bytes for PyAudio", mmap_shared),
+            ("shared mmap reader, views only", mmap_views),
+        ]
+
+        print(f"{seconds}s of audio to {sinks} sinks, {chunk_size}-frame chunks")
+        print(f"{'case':<40} {'CPU us/dev-s':>13} {'buffers/dev-s':>14} {'KiB alloc/dev-s':>16}")
+        for name, case in cases:
+            start = time.process_time()
+            buffers, allocated = case()
+            cpu = time.process_time() - start
+            print(f"{name:<40} {cpu * 1e6 / device_seconds:>13.1f} "
+                  f"{buffers / device_seconds:>14.1f} {allocated / 1024 / device_seconds:>16.1f}")
+    finally:
+        os.remove(path)
+
+
+def _children_cpu():
+    """CPU seconds used by finished child processes, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextlib.contextmanager
+def _quiet_stdout_fd():
+    """Send file descriptor 1 to the null device, silencing worker processes too."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+
+def _run_simulated_playback(path, backend, sinks, chunk_size, engine, memory, metrics=None,
+                            processes=None):
+    """
+    Play a file to simulated sinks and return (wall seconds, CPU seconds, peak traced bytes).
+    CPU includes worker processes; memory is only traced in this one.
+    """
+    if memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time() + _children_cpu()
+    try:
+        # The player reports every device opening and closing; keep the table readable
+        quiet_workers = _quiet_stdout_fd() if engine == "processes" else contextlib.nullcontext()
+        with contextlib.redirect_stdout(io.StringIO()), quiet_workers:
+            playback.play_audio_to_multiple_devices(
+                path, list(range(sinks)), engine=engine, p=backend, sync=DriftMonitor(),
+                chunk_size=chunk_size, metrics=metrics, processes=processes)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() + _children_cpu() - cpu_start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return wall, cpu, peak
+
+
+def bench_playback(sink_counts=(1, 2, 4, 8, 16, 32, 64), chunk_sizes=(256, 1024, 4096), seconds=5,
+                   engine="threads", latency_ms=50.0, jitter_ms=0.0, fail_sinks=0, speed=1.0,
+                   memory=True, open_delay_ms=0.0):
+    """
+    Play a test file to simulated sinks for every combination of sink count
+    and chunk size.
+
+    Reports throughput in device-seconds of audio delivered per second, CPU
+    per sink as a percentage of one core, underruns, the spread of the sinks'
+    first writes and the peak memory traced during playback. Tracing memory
+    slows Python down, so CPU figures are lower with ``memory=False``.
+
+    Args:
+        fail_sinks: Number of sinks that fail halfway through the file
+        speed: Playback speed relative to real time
+        open_delay_ms: Longest time opening a sink takes, to see the start skew
+            that uneven device start-up would cause
+    """
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        make_test_wav(path, seconds)
+
+        print(f"{seconds}s of audio, {engine} engine, {latency_ms:g} ms sink latency, "
+              f"{jitter_ms:g} ms jitter, {fail_sinks} failing sink(s), {speed:g}x speed, "
+              f"up to {open_delay_ms:g} ms to open a sink")
+        print(f"{'sinks':>5} {'chunk':>6} {'dev-s/s':>8} {'CPU %/sink':>11} {'underruns':>10} "
+              f"{'skew ms':>8} {'peak MiB':>9} {'failed':>7}")
+        for sinks in sink_counts:
+            for chunk_size in chunk_sizes:
+                backend = SimulatedBackend(
+                    devices=sinks, latency_ms=latency_ms, jitter_ms=jitter_ms, speed=speed,
+                    fail_devices={idx: seconds / 2 for idx in range(min(fail_sinks, sinks))},
+                    open_delay_ms=open_delay_ms)
+                wall, cpu, peak = _run_simulated_playback(path, backend, sinks, chunk_size,
+                                                          engine, memory)
+
+                streams = backend.streams
+                delivered = sum(stream.frames_written for stream in streams) / 44100
+                underruns = sum(stream.underruns for stream in streams)
+                starts = [stream.first_write for stream in streams if stream.first_write is not None]
+                skew_ms = (max(starts) - min(starts)) * 1000 if starts else 0.0
+                failed = sum(stream.failed for stream in streams)
+                peak_text = f"{peak / 1048576:.1f}" if peak is not None else "-"
+                print(f"{sinks:>5} {chunk_size:>6} {delivered / wall:>8.2f} "
+                      f"{cpu * 100 / wall / sinks:>11.2f} {underruns:>10} {skew_ms:>8.2f} "
+                      f"{peak_text:>9} {failed:>7}")
+    finally:
+        os.remove(path)
+
+
+def bench_processes(sinks=32, worker_counts=None, seconds=5, chunk_size=1024, latency_ms=50.0,
+                    jitter_ms=0.0, speed=1.0):
+    """
+    Scale the processes engine from one worker to one per core on the same
+    set of simulated sinks, with the threads engine as the baseline.
+
+    Reports throughput, total CPU as a percentage of one core including the
+    workers, underruns and the spread of the sinks' first writes. Worker
+    start-up is part of the wall time, so use a few seconds of audio at least.
+
+    Args:
+        worker_counts: Worker process counts to run (defaults to powers of two up to the core count)
+    """
+    if worker_counts is None:
+        cores = os.cpu_count() or 1
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= cores:
+            worker_counts.append(worker_counts[-1] * 2)
+        if worker_counts[-1] != cores:
+            worker_counts.append(cores)
+
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        make_test_wav(path, seconds)
+        print(f"{seconds}s of audio to {sinks} sinks, {chunk_size}-frame chunks, "
+              f"{latency_ms:g} ms sink latency, {jitter_ms:g} ms jitter, {speed:g}x speed, "
+              f"{os.cpu_count()} core(s)")
+        print(f"{'engine':>9} {'workers':>8} {'dev-s/s':>8} {'CPU %':>7} {'underruns':>10} {'skew ms':>8}")
+        for engine, workers in [("threads", None)] + [("processes", count) for count in worker_counts]:
+            backend = SimulatedBackend(devices=sinks, latency_ms=latency_ms, jitter_ms=jitter_ms,
+                                       speed=speed)
+            wall, cpu, _ = _run_simulated_playback(path, backend, sinks, chunk_size, engine,
+                                                   False, processes=workers)
+            streams = backend.streams
+            delivered = sum(stream.frames_written for stream in streams) / 44100
+            underruns = sum(stream.underruns for stream in streams)
+            starts = [stream.first_write for stream in streams if stream.first_write is not None]
+            skew_ms = (max(starts) - min(starts)) * 1000 if starts else 0.0
+            print(f"{engine:>9} {workers or '-':>8} {delivered / wall:>8.2f} {cpu * 100 / wall:>7.1f} "
+                  f"{underruns:>10} {skew_ms:>8.2f}")
+    finally:
+        os.remove(path)
+
+
+def bench_metrics(seconds=10, sinks=8, chunk_size=1024, speed=20.0, iterations=200000):
+    """
+    Measure what per-device metrics add to the playback write loop.
+
+    Times the recording done around each write on its own, then plays to
+    simulated sinks with and without metrics and compares the CPU spent per
+    chunk and device. Overhead is reported against the time one loop
+    iteration spans (the chunk's duration) and against the CPU it uses; the
+    simulated sinks use far less CPU per write than a real device stream.
+    """
+    ring = ChunkRing()
+    reader = ring.add_reader("bench")
+    metrics = DeviceMetrics(0)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fill = reader.pending()
+        started = time.perf_counter()
+        metrics.record_write(time.perf_counter() - started, 4096, fill)
+    record_us = (time.perf_counter() - start) * 1e6 / iterations
+
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        make_test_wav(path, seconds)
+        chunks = -(-int(seconds * 44100) // chunk_size) * sinks
+        loop_us = {}
+        for name, registry in (("off", None), ("on", MetricsRegistry())):
+            backend = SimulatedBackend(devices=sinks, speed=speed)
+            _, cpu, _ = _run_simulated_playback(path, backend, sinks, chunk_size, "threads",
+                                                False, registry)
+            loop_us[name] = cpu * 1e6 / chunks
+    finally:
+        os.remove(path)
+
+    print(f"{seconds}s of audio to {sinks} simulated sinks, {chunk_size}-frame chunks, {speed:g}x speed")
+    print(f"Recording per write:            {record_us:.2f} us")
+    print(f"Loop CPU per chunk without:     {loop_us['off']:.2f} us")
+    print(f"Loop CPU per chunk with:        {loop_us['on']:.2f} us")
+    print(f"Loop period per chunk:          {chunk_size * 1e6 / 44100:.0f} us")
+    print(f"Overhead:                       {record_us * 100 / (chunk_size * 1e6 / 44100):.3f} % of the loop period, "
+          f"{record_us * 100 / loop_us['off']:.1f} % of its CPU")
+
+
+def write_pcm(out, seconds, burst_ms=20.0, skew=1.0, rate=44100, channels=2, sample_width=2):
+    """
+    Write noise as raw PCM at real-time pace, like a live source would.
+
+    Args:
+        out: Binary file object to write to
+        burst_ms: Milliseconds of audio written at a time
+        skew: Speed of the producer's clock relative to real time
+    """
+    frame_size = channels * sample_width
+    burst_frames = max(int(rate * burst_ms / 1000), 1)
+    block = os.urandom(burst_frames * frame_size)
+    start = time.perf_counter()
+    written = 0
+    while written < seconds * rate:
+        out.write(block)
+        out.flush()
+        written += burst_frames
+        wait = start + written / rate / skew - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+
+
+def bench_live(seconds=10, sinks=4, chunk_size=512, burst_ms=20.0, skew=1.0, target_ms=60,
+               max_ms=250, latency_ms=50.0, jitter_ms=0.0):
+    """
+    Pipe generated PCM through live mode to simulated sinks.
+
+    Reports how far the sinks were behind the input, measured from the
+    moment each chunk was captured to its write on the sink plus the sink's
+    own latency, together with jitter buffer drops and underruns. A skew
+    above 1 makes the input run ahead of the sinks, which forces drops.
+    """
+    read_fd, write_fd = os.pipe()
+    pipe = os.fdopen(read_fd, 'rb')
+    producer_out = os.fdopen(write_fd, 'wb')
+
+    def produce():
+        try:
+            write_pcm(producer_out, seconds, burst_ms, skew)
+        finally:
+            producer_out.close()
+
+    reader = PcmPipeReader(pipe, 2, 2, 44100)
+    source = LiveSource(lambda: reader.readframes(chunk_size), 2, 2, 44100, chunk_size,
+                        target_ms, max_ms, reader.close)
+    backend = SimulatedBackend(devices=sinks, latency_ms=latency_ms, jitter_ms=jitter_ms)
+    registry = MetricsRegistry()
+    samples = []
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.25):
+            for device in list(registry.devices.values()):
+                latency = source.latency_ms(device.writes)
+                if latency is not None:
+                    samples.append(latency)
+
+    threading.Thread(target=produce, daemon=True).start()
+    threading.Thread(target=sample, daemon=True).start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            playback.play_audio_to_multiple_devices(
+                source, list(range(sinks)), preroll_ms=0, p=backend, chunk_size=chunk_size,
+                metrics=registry, ring_slots=LIVE_RING_SLOTS)
+    finally:
+        done.set()
+        source.close()
+
+    stats = source.stats()
+    sink_ms = latency_ms + chunk_size * 1000 / 44100
+    underruns = sum(stream.underruns for stream in backend.streams)
+    print(f"{seconds}s of live input to {sinks} simulated sinks, {chunk_size}-frame chunks, "
+          f"{burst_ms:g} ms bursts, {skew:g}x input clock, jitter buffer {target_ms}-{max_ms} ms")
+    if samples:
+        samples.sort()
+        print(f"Input to sink output:  {samples[len(samples) // 2] + sink_ms:.0f} ms median, "
+              f"{samples[-1] + sink_ms:.0f} ms max")
+    print(f"Jitter buffer wait:    {stats['buffer_wait_ms']:.0f} ms avg, "
+          f"{stats['max_buffer_wait_ms']:.0f} ms max")
+    print(f"Dropped input:         {stats['dropped_chunks']} chunks ({stats['dropped_ms']:.0f} ms)")
+    print(f"Jitter buffer underruns: {stats['underruns']}, sink underruns: {underruns}")
+
+
+def bench_resample(seconds=10, sinks=8, chunk_size=1024, in_rate=44100, out_rate=48000):
+    """
+    Compare resampling once per rate group with resampling once per device.
+
+    Converts the same audio for sinks devices running at out_rate, first
+    with one Resampler shared by all of them, as playback does, then with
+    one per device, as happens when every stream resamples on its own.
+    """
+    if not dsp.available():
+        print("NumPy is required for this benchmark")
+        return
+    data = os.urandom(chunk_size * 4)
+    chunks = int(seconds * in_rate / chunk_size)
+    results = {}
+    for name, resamplers in (("per group", 1), ("per device", sinks)):
+        converters = [dsp.Resampler(in_rate, out_rate, 2) for _ in range(resamplers)]
+        start = time.process_time()
+        for _ in range(chunks):
+            for converter in converters:
+                converter.process(data)
+        results[name] = time.process_time() - start
+
+    print(f"{seconds}s of audio from {in_rate} Hz to {out_rate} Hz for {sinks} sinks, "
+          f"{chunk_size}-frame chunks")
+    for name, cpu in results.items():
+        print(f"Resampling {name + ':':12} {cpu * 1000:8.1f} ms CPU, {cpu * 100 / seconds:.2f} % of a core")
+
+
+# Runs the CLI with the first write to a simulated device reported on stderr
+_FIRST_SAMPLE_BOOTSTRAP = """
+import sys
+from bluetooth_audio_player import backends
+write = backends.SimulatedStream.write
+def first_write(self, *args, **kwargs):
+    if not getattr(backends, "_first_written", False):
+        backends._first_written = True
+        sys.stderr.write("first-sample\\n")
+        sys.stderr.flush()
+    return write(self, *args, **kwargs)
+backends.SimulatedStream.write = first_write
+sys.argv = ["bt-audio-multiplexer"] + sys.argv[1:]
+from bluetooth_audio_player import main
+sys.exit(main.main())
+"""
+
+
+def _time_command(argv, env, marker=None):
+    """
+    Run a command and return the wall time in seconds until it exits, or
+    until it prints marker on stderr if one is given.
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(argv, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE if marker else subprocess.DEVNULL)
+    if marker is None:
+        proc.wait()
+        return time.perf_counter() - start
+    elapsed = None
+    for line in proc.stderr:
+        if line.strip() == marker.encode():
+            elapsed = time.perf_counter() - start
+            break
+    proc.kill()
+    proc.wait()
+    proc.stderr.close()
+    return elapsed
+
+
+def bench_startup(runs=5, sinks=2):
+    """
+    Measure how long the CLI takes to start, in fresh processes.
+
+    Times importing the entry point, --list-devices and time-to-first-sample:
+    from launching the player on a WAV file to its first write to a simulated
+    device. Each run starts in
+    an empty home directory, so the first run is cold and later ones reuse
+    the discovery and tool caches the first one wrote.
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home,
+                   PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+        wav_path = os.path.join(home, "startup.wav")
+        make_test_wav(wav_path, 1)
+        devices = ",".join(str(index) for index in range(sinks))
+        python = [sys.executable, "-m", "bluetooth_audio_player.main"]
+        cases = [
+            ("Import entry point", [sys.executable, "-c", "import bluetooth_audio_player.main"], None),
+            ("--list-devices", python + ["--list-devices", "--backend", "simulated"], None),
+            ("Time to first sample",
+             [sys.executable, "-c", _FIRST_SAMPLE_BOOTSTRAP, wav_path, "--backend", "simulated",
+              "--device-indices", devices], "first-sample"),
+        ]
+        results = [(name, [_time_command(argv, env, marker) for _ in range(runs)])
+                   for name, argv, marker in cases]
+
+    print(f"CLI start-up, {runs} fresh processes per case, simulated backend")
+    for name, times in results:
+        if None in times:
+            print(f"{name + ':':28} no sample written")
+            continue
+        rest = sorted(times[1:]) or times
+        print(f"{name + ':':28} {times[0] * 1000:6.0f} ms first run, "
+              f"{rest[len(rest) // 2] * 1000:6.0f} ms median of the rest")
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Playback hot path benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    wav_parser = subparsers.add_parser("wav-source", help="WAV reader allocations and CPU")
+    wav_parser.add_argument("--seconds", type=float, default=60)
+    wav_parser.add_argument("--sinks", type=int, default=8)
+    wav_parser.add_argument("--chunk-size", type=int, default=1024)
+
+    play_parser = subparsers.add_parser("playback", help="Multi-device playback on simulated sinks")
+    play_parser.add_argument("--sinks", type=_int_list, default=[1, 2, 4, 8, 16, 32, 64],
+                             help="Comma-separated sink counts")
+    play_parser.add_argument("--chunk-sizes", type=_int_list, default=[256, 1024, 4096],
+                             help="Comma-separated chunk sizes in frames")
+    play_parser.add_argument("--seconds", type=float, default=5)
+    play_parser.add_argument("--engine", choices=playback.ENGINES, default="threads")
+    play_parser.add_argument("--latency-ms", type=float, default=50.0)
+    play_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    play_parser.add_argument("--fail-sinks", type=int, default=0)
+    play_parser.add_argument("--speed", type=float, default=1.0)
+    play_parser.add_argument("--no-memory", action="store_true",
+                             help="Skip memory tracing for more accurate CPU figures")
+    play_parser.add_argument("--open-delay-ms", type=float, default=0.0,
+                             help="Longest time opening a sink takes")
+
+    processes_parser = subparsers.add_parser(
+        "processes", help="Scaling of the processes engine over worker counts")
+    processes_parser.add_argument("--sinks", type=int, default=32)
+    processes_parser.add_argument("--workers", type=_int_list, default=None,
+                                  help="Comma-separated worker process counts")
+    processes_parser.add_argument("--seconds", type=float, default=5)
+    processes_parser.add_argument("--chunk-size", type=int, default=1024)
+    processes_parser.add_argument("--latency-ms", type=float, default=50.0)
+    processes_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    processes_parser.add_argument("--speed", type=float, default=1.0)
+
+    metrics_parser = subparsers.add_parser("metrics", help="Overhead of per-device metrics")
+    metrics_parser.add_argument("--seconds", type=float, default=10)
+    metrics_parser.add_argument("--sinks", type=int, default=8)
+    metrics_parser.add_argument("--chunk-size", type=int, default=1024)
+    metrics_parser.add_argument("--speed", type=float, default=20.0)
+
+    live_parser = subparsers.add_parser("live", help="Latency and drops of live input")
+    live_parser.add_argument("--seconds", type=float, default=10)
+    live_parser.add_argument("--sinks", type=int, default=4)
+    live_parser.add_argument("--chunk-size", type=int, default=512)
+    live_parser.add_argument("--burst-ms", type=float, default=20.0,
+                             help="Milliseconds of audio the input delivers at a time")
+    live_parser.add_argument("--skew", type=float, default=1.0,
+                             help="Speed of the input clock relative to the sinks")
+    live_parser.add_argument("--target-ms", type=int, default=60)
+    live_parser.add_argument("--max-ms", type=int, default=250)
+    live_parser.add_argument("--latency-ms", type=float, default=50.0)
+    live_parser.add_argument("--jitter-ms", type=float, default=0.0)
+
+    pcm_parser = subparsers.add_parser(
+        "pcm", help="Write real-time paced 16-bit stereo PCM to stdout, for piping into --live -")
+    pcm_parser.add_argument("--seconds", type=float, default=10)
+    pcm_parser.add_argument("--burst-ms", type=float, default=20.0)
+    pcm_parser.add_argument("--skew", type=float, default=1.0)
+
+    resample_parser = subparsers.add_parser(
+        "resample", help="Resampling once per rate group against once per device")
+    resample_parser.add_argument("--seconds", type=float, default=10)
+    resample_parser.add_argument("--sinks", type=int, default=8)
+    resample_parser.add_argument("--chunk-size", type=int, default=1024)
+    resample_parser.add_argument("--in-rate", type=int, default=44100)
+    resample_parser.add_argument("--out-rate", type=int, default=48000)
+
+    startup_parser = subparsers.add_parser(
+        "startup", help="CLI start-up, --list-devices and time-to-first-sample")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--sinks", type=int, default=2)
+
+    args = parser.parse_args()
+    if args.benchmark == "wav-source":
+        bench_wav_source(args.seconds, args.sinks, args.chunk_size)
+    elif args.benchmark == "playback":
+        bench_playback(args.sinks, args.chunk_sizes, args.seconds, args.engine, args.latency_ms,
+                       args.jitter_ms, args.fail_sinks, args.speed, not args.no_memory,
+                       args.open_delay_ms)
+    elif args.benchmark == "processes":
+        bench_processes(args.sinks, args.workers, args.seconds, args.chunk_size, args.latency_ms,
+                        args.jitter_ms, args.speed)
+    elif args.benchmark == "metrics":
+        bench_metrics(args.seconds, args.sinks, args.chunk_size, args.speed)
+    elif args.benchmark == "live":
+        bench_live(args.seconds, args.sinks, args.chunk_size, args.burst_ms, args.skew,
+                   args.target_ms, args.max_ms, args.latency_ms, args.jitter_ms)
+    elif args.benchmark == "pcm":
+        try:
+            write_pcm(sys.stdout.buffer, args.seconds, args.burst_ms, args.skew)
+        except BrokenPipeError:
+            pass
+    elif args.benchmark == "resample":
+        bench_resample(args.seconds, args.sinks, args.chunk_size, args.in_rate, args.out_rate)
+    elif args.benchmark == "startup":
+        bench_startup(args.runs, args.sinks)
+
+
+if __name__ == "__main__":
+    main()
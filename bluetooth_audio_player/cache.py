@@ -0,0 +1,141 @@
+"""
+Persistent, content-addressed cache of converted audio files.
+
+Entries are keyed by a hash of the source file contents plus the target
+output format and live under the configuration directory. The cache is kept
+within a byte budget by evicting the least recently used entries; a file
+lock makes stores and evictions safe across concurrent processes.
+Conversions write to a temporary file first; ones left behind by an
+interrupted conversion are removed once they are older than any conversion
+takes.
+"""
+import os
+import json
+import time
+import hashlib
+
+from bluetooth_audio_player import config
+from bluetooth_audio_player.utils import file_lock
+
+LOCK_NAME = ".lock"
+
+# Seconds after which a temporary file can only be left over from an interrupted conversion
+CONVERSION_TIMEOUT_S = 3600
+
+
+def hash_file(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Size-bounded LRU cache of converted WAV files."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(cache_dir, LOCK_NAME)
+        with file_lock(self._lock_path):
+            self._sweep_temp_files()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Create the cache described by the "cache" config section, or None if disabled."""
+        options = cfg.get("cache", config.DEFAULT_CONFIG["cache"])
+        if not options.get("enabled", True):
+            return None
+        cache_dir = os.path.join(config.get_config_dir(), "cache")
+        return cls(cache_dir, options["max_bytes"])
+
+    def key_for(self, input_path, output_format, start=None, end=None):
+        """
+        Build the cache key for converting input_path to output_format, or
+        only its start..end seconds.
+        """
+        digest = hashlib.sha256(hash_file(input_path).encode())
+        digest.update(json.dumps(output_format, sort_keys=True).encode())
+        if start or end is not None:
+            # Whole-file keys stay as they were, so existing entries remain valid
+            digest.update(json.dumps([start or 0, end]).encode())
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def temp_path_for(self, key):
+        """A private path to convert into before the result is published."""
+        return os.path.join(self.cache_dir, f"{key}.{os.getpid()}.tmp")
+
+    def is_cached_path(self, path):
+        """Check whether a path points into this cache."""
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.cache_dir)
+
+    def lookup(self, key):
+        """Return the cached file for key, marking it as recently used, or None."""
+        path = self.path_for(key)
+        with file_lock(self._lock_path):
+            try:
+                # The modification time doubles as the last-use time for LRU eviction
+                os.utime(path, None)
+            except FileNotFoundError:
+                return None
+        return path
+
+    def store(self, key, temp_path):
+        """
+        Atomically publish a converted file and evict old entries.
+        Returns the path of the cached file.
+        """
+        path = self.path_for(key)
+        with file_lock(self._lock_path):
+            os.replace(temp_path, path)
+            self._evict(keep=path)
+        return path
+
+    def _sweep_temp_files(self):
+        """Remove temporary files of conversions that were interrupted; call under the lock."""
+        cutoff = time.time() - CONVERSION_TIMEOUT_S
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                # Gone already, or still open on Windows
+                pass
+
+    def _evict(self, keep):
+        self._sweep_temp_files()
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".wav"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                # Typically a file still open for playback on Windows
+                print(f"Could not evict cached file {path}: {e}")
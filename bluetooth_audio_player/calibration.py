@@ -0,0 +1,153 @@
+"""
+Latency calibration for output devices using a test tone.
+
+Each device plays a short tone burst which is picked up by an input device
+(usually the default microphone). The time between handing the tone to the
+output stream and hearing it gives the device's latency; offsets are then
+chosen so that every device lines up with the slowest one. Any fixed delay of
+the input path is the same for every device and cancels out.
+"""
+import math
+import time
+import array
+import struct
+import threading
+
+from bluetooth_audio_player import backends
+
+RATE = 44100
+TONE_HZ = 1000
+TONE_MS = 50
+LEAD_IN_S = 0.3
+LISTEN_S = 1.5
+INPUT_CHUNK = 256
+
+
+def make_tone_burst(rate=RATE, freq=TONE_HZ, duration_ms=TONE_MS, amplitude=0.5):
+    """Return a stereo 16-bit sine burst with short fades to avoid clicks."""
+    frames = int(rate * duration_ms / 1000)
+    fade = max(frames // 10, 1)
+    samples = []
+    for i in range(frames):
+        envelope = min(1.0, i / fade, (frames - i) / fade)
+        value = int(32767 * amplitude * envelope * math.sin(2 * math.pi * freq * i / rate))
+        samples.extend((value, value))
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def find_onset(samples, rate, window=32, threshold_ratio=8.0, min_level=300):
+    """
+    Return the index of the first sample where the signal rises clearly
+    above the noise floor of the first 100 ms, or None if it never does.
+    """
+    noise_len = min(len(samples), rate // 10)
+    if noise_len == 0:
+        return None
+    noise = sum(abs(s) for s in samples[:noise_len]) / noise_len
+    threshold = max(noise * threshold_ratio, min_level) * window
+
+    level = sum(abs(s) for s in samples[:window])
+    for i in range(window, len(samples)):
+        if level > threshold:
+            return i - window
+        level += abs(samples[i]) - abs(samples[i - window])
+    return None
+
+
+def measure_device_latency(p, device_index, input_device_index=None):
+    """
+    Measure the output latency of a device in milliseconds.
+    Returns None if the tone could not be detected.
+    """
+    recorded = []
+    recording = threading.Event()
+    recording.set()
+
+    # Bluetooth devices take a while to open; the input only records from the
+    # moment it is started, so that time cannot shift the recording
+    out_stream = p.open(format=backends.paInt16, channels=2, rate=RATE, output=True,
+                        output_device_index=device_index)
+    in_stream = None
+    try:
+        in_stream = p.open(format=backends.paInt16, channels=1, rate=RATE, input=True,
+                           input_device_index=input_device_index,
+                           frames_per_buffer=INPUT_CHUNK, start=False)
+
+        def record():
+            while recording.is_set():
+                recorded.append(in_stream.read(INPUT_CHUNK, exception_on_overflow=False))
+
+        recorder = threading.Thread(target=record, daemon=True)
+        record_start = time.monotonic()
+        in_stream.start_stream()
+        recorder.start()
+
+        # Fill the output buffer first so the tone goes through it like normal playback
+        out_stream.write(bytes(int(RATE * LEAD_IN_S) * 4))
+        tone_sent = time.monotonic()
+        out_stream.write(make_tone_burst())
+        out_stream.write(bytes(int(RATE * LISTEN_S) * 4))
+
+        recording.clear()
+        recorder.join()
+    finally:
+        recording.clear()
+        if in_stream:
+            in_stream.stop_stream()
+            in_stream.close()
+        out_stream.stop_stream()
+        out_stream.close()
+
+    samples = array.array('h', b''.join(recorded))
+    # Only look for the tone after it was sent; earlier sound is background noise
+    skip = int((tone_sent - record_start) * RATE)
+    onset = find_onset(samples[skip:], RATE)
+    if onset is None:
+        return None
+    return onset * 1000.0 / RATE
+
+
+def calibrate_latency_offsets(devices, p=None, input_device_index=None, repeats=3):
+    """
+    Measure every device and compute the offset that aligns it with the slowest.
+
+    Args:
+        devices: List of (device index, device name) tuples
+        p: PyAudio instance (optional)
+        input_device_index: Microphone to listen with (defaults to the system default)
+        repeats: Measurements per device; the median is used
+
+    Returns:
+        Dict of device name to latency offset in milliseconds
+    """
+    own_pyaudio = p is None
+    if own_pyaudio:
+        p = backends.open_backend()
+
+    latencies = {}
+    try:
+        for idx, name in devices:
+            results = []
+            for _ in range(repeats):
+                try:
+                    latency = measure_device_latency(p, idx, input_device_index)
+                except Exception as e:
+                    print(f"Error calibrating device {idx}: {e}")
+                    break
+                if latency is not None:
+                    results.append(latency)
+
+            if not results:
+                print(f"  Device index: {idx}, Name: {name} - TONE NOT DETECTED (SKIPPED)")
+                continue
+            results.sort()
+            latencies[name] = results[len(results) // 2]
+            print(f"  Device index: {idx}, Name: {name} - latency {latencies[name]:.1f} ms")
+    finally:
+        if own_pyaudio:
+            p.terminate()
+
+    if not latencies:
+        return {}
+    slowest = max(latencies.values())
+    return {name: round(slowest - latency, 1) for name, latency in latencies.items()}
@@ -0,0 +1,208 @@
+"""
+Callback-driven playback engine.
+
+Instead of one thread per device blocking in ``stream.write``, every device
+stream is opened in PyAudio's non-blocking callback mode. The single decoder
+thread keeps the shared ring filled ahead of time and each stream callback
+only takes ready chunks from its own cursor, so no callback ever waits on
+I/O or on another device.
+"""
+import time
+import threading
+
+from bluetooth_audio_player import dsp
+from bluetooth_audio_player.backends import paComplete, paContinue, paOutputUnderflow
+
+
+class CallbackSink:
+    """Feeds one callback-mode output stream from a ring reader."""
+
+    def __init__(self, device_index, reader, frame_size, clock=None, gain=None, metrics=None,
+                 tuner=None, control=None, rate=None):
+        self.device_index = device_index
+        self.reader = reader
+        self.frame_size = frame_size
+        self.clock = clock
+        self.gain = gain
+        self.metrics = metrics
+        self.tuner = tuner
+        self.control = control
+        self.rate = rate
+        self.underruns = 0
+        self._skipped = 0
+        self._skip = 0
+        self.done = threading.Event()
+        self.stream = None
+        # A latency offset is simply played first
+        self._pending = reader.delay
+
+    def skip_frames(self, frames):
+        """Drop the first frames of the audio, for a stream that started late."""
+        skip = frames * self.frame_size
+        self._pending, self._skip = self._pending[skip:], max(skip - len(self._pending), 0)
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio stream callback; never blocks."""
+        if status & paOutputUnderflow and self.tuner is not None:
+            # Applied to the next run; resizing a running callback stream would glitch anyway
+            self.tuner.record_underflow()
+        if self.metrics is None:
+            return self._fill(frame_count)
+        fill = self.reader.pending()
+        started = time.perf_counter()
+        result = self._fill(frame_count)
+        self.metrics.record_write(time.perf_counter() - started, len(result[0]), fill)
+        return result
+
+    def _fill(self, frame_count):
+        needed = frame_count * self.frame_size
+        if self.control is not None:
+            if self.control.paused:
+                if self.clock:
+                    # Silence played while paused is not clock drift
+                    self.clock.reset()
+                return (b'\x00' * needed, paContinue)
+            self.gain = self.control.gain(self.device_index, self.gain)
+        data = self._pending
+        while len(data) < needed:
+            chunk = self.reader.get_nowait()
+            if chunk is None:
+                break
+            if self._skip:
+                chunk, self._skip = chunk[self._skip:], max(self._skip - len(chunk), 0)
+                if not chunk:
+                    continue
+            if self.gain is not None:
+                chunk = dsp.apply_gain(chunk, self.gain)
+            if self.clock:
+                if self.reader.dropped_chunks != self._skipped:
+                    # Audio skipped after falling behind is not clock drift
+                    self._skipped = self.reader.dropped_chunks
+                    self.clock.reset()
+                chunk, frames = self.clock.apply(chunk, self.frame_size)
+                self.clock.update(frames)
+            data = data + chunk if data else chunk
+
+        if len(data) >= needed:
+            # When chunks match the buffer size the shared chunk is returned as is
+            if len(data) > needed:
+                self._pending = data[needed:]
+                data = data[:needed]
+            else:
+                self._pending = b''
+            if self.control is not None:
+                self.control.advance(self.device_index, frame_count, self.rate)
+            return (data, paContinue)
+
+        self._pending = b''
+        padding = b'\x00' * (needed - len(data))
+        if self.reader.exhausted():
+            self.done.set()
+            return (data + padding, paComplete)
+
+        self.underruns += 1
+        if self.metrics is not None:
+            self.metrics.record_underrun()
+        if self.clock:
+            # Silence played while starved is not clock drift
+            self.clock.reset()
+        return (data + padding, paContinue)
+
+
+def run_callback_engine(p, readers, audio_format, chunk_size, sync=None, gains=None, metrics=None,
+                        buffer_sizes=None, tuners=None, formats=None, control=None,
+                        start_gate=None):
+    """
+    Play a shared ring on all devices using callback-mode streams.
+
+    Args:
+        p: PyAudio instance (or a compatible fake for testing)
+        readers: List of (device index, ring reader) tuples
+        audio_format: Tuple of (sample width, channels, frame rate)
+        chunk_size: Frames per ring chunk, also the default stream buffer size
+        sync: DriftMonitor that keeps the devices' clocks in line (optional)
+        gains: Dict of device index to linear gain (optional)
+        metrics: MetricsRegistry collecting per-device metrics (optional)
+        buffer_sizes: Dict of device index to frames per stream buffer (optional)
+        tuners: Dict of device index to BufferTuner recording underflows (optional)
+        formats: Dict of device index to the format its ring carries, for
+            devices opened at another rate than audio_format (optional)
+        control: PlaybackControl for pausing, live gain and progress (optional)
+        start_gate: StartGate the streams are started at together once all
+            are open (optional)
+    """
+    gains = gains or {}
+    buffer_sizes = buffer_sizes or {}
+    tuners = tuners or {}
+    formats = formats or {}
+    sinks = []
+
+    for idx, reader in readers:
+        width, channels, rate = formats.get(idx, audio_format)
+        sink = CallbackSink(idx, reader, width * channels, gain=gains.get(idx),
+                            metrics=metrics.device(idx) if metrics is not None else None,
+                            tuner=tuners.get(idx), control=control, rate=rate)
+        try:
+            sink.stream = p.open(
+                format=p.get_format_from_width(width),
+                channels=channels,
+                rate=rate,
+                output=True,
+                output_device_index=idx,
+                frames_per_buffer=buffer_sizes.get(idx) or chunk_size,
+                start=False,
+                stream_callback=sink.callback
+            )
+            print(f"Stream opened successfully for device {idx}")
+            if sync is not None:
+                sink.clock = sync.add_device(idx, rate)
+                sink.clock.set_latency(sink.stream.get_output_latency())
+            sinks.append(sink)
+        except Exception as e:
+            print(f"Error creating stream for device {idx}: {e}")
+            sink.reader.detach()
+            if start_gate is not None:
+                start_gate.leave(idx)
+        else:
+            if start_gate is not None:
+                start_gate.arrive(idx, wait=False)
+
+    try:
+        print(f"Starting playback on {len(sinks)} devices...")
+        if start_gate is not None:
+            start_gate.wait()
+        for sink in sinks:
+            if start_gate is not None:
+                # Streams started after the tolerance skip what the first ones have played
+                sink.skip_frames(start_gate.started(sink.device_index, sink.rate))
+            try:
+                sink.stream.start_stream()
+            except Exception as e:
+                print(f"Error starting stream on device {sink.device_index}: {e}")
+                sink.reader.detach()
+                sink.done.set()
+
+        print("Waiting for playback to complete...")
+        for sink in sinks:
+            # A stream aborted by its device stops calling back, so also watch its state
+            while not sink.done.wait(0.5):
+                if sync is not None:
+                    sync.maybe_report()
+                if not sink.stream.is_active():
+                    break
+    finally:
+        for sink in sinks:
+            sink.reader.detach()
+            try:
+                # stop_stream lets buffers already handed to the device play out
+                sink.stream.stop_stream()
+                sink.stream.close()
+            except:
+                pass
+
+            if sink.underruns:
+                print(f"Device {sink.device_index} had {sink.underruns} buffer underruns")
+            if sink.reader.stalls:
+                print(f"Device {sink.device_index} fell behind {sink.reader.stalls} time(s), "
+                      f"{sink.reader.dropped_chunks} chunks skipped")
+            print(f"Playback completed on device {sink.device_index}")
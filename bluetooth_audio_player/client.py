@@ -0,0 +1,86 @@
+"""
+Thin command-line client for the player daemon.
+
+Only the standard library is imported, so a command reaches the daemon
+within a few milliseconds of the process starting.
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+
+from bluetooth_audio_player import config
+
+COMMANDS = ("play", "queue", "stop", "status")
+
+
+def send_command(request, socket_path, timeout=10.0):
+    """
+    Send one request to the daemon and return its response.
+
+    Args:
+        request: Dict with a "command" and its arguments
+        socket_path: Path of the daemon's Unix socket
+        timeout: Seconds to wait for the response
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    return json.loads(response)
+
+
+def print_status(response):
+    """Print a daemon status response."""
+    print(f"State: {response['state']}")
+    if response["track"]:
+        print(f"Playing: {response['track']}")
+    for position, track in enumerate(response["queue"], 1):
+        print(f"  {position}. {track}")
+    devices = ", ".join(f"{device['name']} ({device['index']})" for device in response["devices"])
+    print(f"Devices: {devices}")
+    if response["first_sample_ms"] is not None:
+        print(f"Last start: first sample {response['first_sample_ms']:.0f} ms after the play command")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Control a running bt-audio-multiplexer daemon"
+    )
+    parser.add_argument("command", choices=COMMANDS, help="Command to send")
+    parser.add_argument("paths", nargs="*", help="Audio files or directories for play and queue")
+    parser.add_argument("--socket", help="Path of the daemon's control socket")
+    args = parser.parse_args()
+
+    if args.command in ("play", "queue") and not args.paths:
+        print(f"Error: {args.command} needs at least one audio file")
+        return 1
+
+    socket_path = args.socket or config.get_socket_path(config.load_config())
+    request = {"command": args.command}
+    if args.paths:
+        # The daemon resolves paths relative to its own working directory
+        request["paths"] = [os.path.abspath(path) for path in args.paths]
+
+    try:
+        response = send_command(request, socket_path)
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not reach the daemon at {socket_path}: {e}")
+        return 1
+
+    if not response["ok"]:
+        print(f"Error: {response['error']}")
+        return 1
+    print_status(response)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@
 Configuration settings for the Bluetooth audio player.
 """
 import os
+import copy
 import json
 from pathlib import Path
 
@@ -13,22 +14,82 @@ DEFAULT_CONFIG = {
         "channels": 2       # stereo
     },
     "playback": {
-        "chunk_size": 1024,
-        "buffer_size": 4096
+        "chunk_size": 1024,   # frames per decoded chunk
+        "buffer_size": 4096,  # frames per device stream buffer
+        "adaptive_buffer": False,  # tune buffer_size per device, see buffer_sizes
+        "min_buffer_size": 256,
+        "max_buffer_size": 16384,
+        "preroll_ms": 200,
+        "engine": "threads",  # or "callback", or "processes" for many devices
+        "backend": "pyaudio",  # or "simulated" to play without audio hardware
+        "channel_map": None,  # e.g. [1, 0] to swap left and right
+        "native_rates": True,  # open devices at their own sample rate, resampling once per rate
+        "processes": 0,  # worker processes for the processes engine, 0 for one per core
+        "start_tolerance_ms": 5.0  # devices starting later than this skip ahead to stay in line
     },
     "detection": {
         "prefer_stereo": True,
-        "avoid_hands_free": True
+        "avoid_hands_free": True,
+        "verify_timeout": 2.0,  # seconds for all devices
+        "cache_ttl": 300        # seconds to reuse discovery results, 0 disables
+    },
+    "sync": {
+        "enabled": True,
+        "correct": True,
+        "max_drift_ms": 2.0,
+        "warmup_s": 2.0
+    },
+    "recovery": {
+        "enabled": True,
+        "max_attempts": 5,          # reopen attempts before a failed device is given up
+        "initial_backoff_s": 0.5,   # doubled after every failed attempt
+        "max_backoff_s": 8.0,
+        "hotplug_interval_s": 0     # seconds between looks for new devices, 0 disables
+    },
+    "latency_offsets": {},  # device name -> milliseconds, see --calibrate
+    "device_gains": {},     # device name -> linear gain
+    "buffer_sizes": {},     # device name -> tuned buffer size, see adaptive_buffer
+    "cache": {
+        "enabled": True,
+        "max_bytes": 1024 * 1024 * 1024,  # 1 GiB
+        "probe_tools": True  # remember ffmpeg probes in tools.json across runs
+    },
+    "library": {
+        "index": True,     # keep probed file metadata in library.json, see --scan
+        "scan_workers": 0  # probes run at once by --scan, 0 for a default based on the core count
+    },
+    "metrics": {
+        "path": None,       # file to export per-device metrics to, see --metrics-file
+        "format": "json",   # or "prometheus"
+        "interval_s": 5.0
+    },
+    "live": {
+        "target_ms": 60,         # input buffered before playback starts or resumes
+        "max_ms": 250,           # older input is dropped beyond this
+        "report_interval_s": 5.0
+    },
+    "daemon": {
+        "socket_path": None  # defaults to daemon.sock in the config directory
     },
     "debug": False
 }
 
-def get_config_path():
-    """Get the path to the configuration file."""
+def get_config_dir():
+    """Get the configuration directory, creating it if necessary."""
     config_dir = os.path.join(str(Path.home()), ".bluetooth_audio_player")
     if not os.path.exists(config_dir):
         os.makedirs(config_dir)
-    return os.path.join(config_dir, "config.json")
+    return config_dir
+
+def get_config_path():
+    """Get the path to the configuration file."""
+    return os.path.join(get_config_dir(), "config.json")
+
+def get_socket_path(config=None):
+    """Get the path of the daemon's control socket."""
+    if config and config["daemon"]["socket_path"]:
+        return os.path.expanduser(config["daemon"]["socket_path"])
+    return os.path.join(get_config_dir(), "daemon.sock")
 
 def load_config():
     """Load configuration from file or create default."""
@@ -40,9 +101,9 @@ def load_config():
                 user_config = json.load(f)
                 
             # Merge with defaults to ensure all options are present
-            config = DEFAULT_CONFIG.copy()
+            config = copy.deepcopy(DEFAULT_CONFIG)
             for category, options in user_config.items():
-                if category in config:
+                if isinstance(config.get(category), dict) and isinstance(options, dict):
                     config[category].update(options)
                 else:
                     config[category] = options
@@ -50,11 +111,11 @@ def load_config():
             return config
         except Exception as e:
             print(f"Error loading config: {e}")
-            return DEFAULT_CONFIG
+            return copy.deepcopy(DEFAULT_CONFIG)
     else:
         # Create default config
         save_config(DEFAULT_CONFIG)
-        return DEFAULT_CONFIG
+        return copy.deepcopy(DEFAULT_CONFIG)
 
 def save_config(config):
     """Save configuration to file."""
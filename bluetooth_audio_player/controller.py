@@ -0,0 +1,359 @@
+"""
+Controlling a playback run while it plays, from threads or from asyncio.
+
+play_audio_to_multiple_devices blocks until every device is done. A
+PlaybackControl passed to it is the handle for everything else: the engine
+checks it for pause, volume and seek requests as it decodes and writes, and
+reports back through events, so nothing has to poll. Events are dicts with
+an "event" name and a monotonic "time":
+
+    started   the first chunk reached a device
+    progress  every progress interval of audio, with "position_s"
+    paused, resumed
+    seeked    a seek took effect, with "position_s"
+    volume    with "device" and "gain"
+    error     a request could not be carried out, with "message"
+    finished  playback ended, with "completed" False if it was stopped
+
+AsyncPlaybackSession wraps a run for asyncio. Its controls are awaitable and
+its events arrive on the event loop through ``call_soon_threadsafe``, so one
+loop can run many sessions without blocking.
+"""
+import time
+import asyncio
+import threading
+
+from bluetooth_audio_player import dsp
+from bluetooth_audio_player import playback
+
+DECODED_MESSAGE = "The audio has been decoded to the end, it can no longer seek"
+
+
+class PlaybackControl:
+    """Thread-safe controls and events for one playback run."""
+
+    def __init__(self, on_event=None, progress_interval=0.5):
+        """
+        Args:
+            on_event: Callable taking each event dict; it is called from
+                playback threads, so it must not block (optional)
+            progress_interval: Seconds of audio between progress events
+        """
+        self.on_event = on_event
+        self.progress_interval = progress_interval
+        self.cancel = threading.Event()
+        self.position = 0.0
+        self._running = threading.Event()
+        self._running.set()
+        self._gains = {}
+        self._seek = None
+        self._rings = []
+        self._base = 0.0
+        self._played = {}
+        self._next_progress = progress_interval
+        self._started = False
+        self._finished = False
+        self._unsupported = None
+        self._decoded = False
+        self._lock = threading.Lock()
+
+    def emit(self, name, **data):
+        if self.on_event is not None:
+            self.on_event(dict(data, event=name, time=time.monotonic()))
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def _refuse(self):
+        """Emit an error and return True if this run cannot be controlled."""
+        if self._unsupported is None:
+            return False
+        self.emit("error", message=self._unsupported)
+        return True
+
+    def pause(self):
+        """
+        Hold every device at the chunk it is at; the device streams stay open
+        and the decoder waits once the rings are full.
+        """
+        if self._refuse() or not self._running.is_set():
+            return
+        with self._lock:
+            self._running.clear()
+            rings = list(self._rings)
+        for ring in rings:
+            ring.hold(True)
+        self.emit("paused", position_s=self.position)
+
+    def resume(self):
+        if self._refuse() or self._running.is_set():
+            return
+        with self._lock:
+            self._running.set()
+            rings = list(self._rings)
+        for ring in rings:
+            ring.hold(False)
+        self.emit("resumed", position_s=self.position)
+
+    def stop(self):
+        """Stop playback on every device, discarding audio already buffered."""
+        self.cancel.set()
+        with self._lock:
+            rings = list(self._rings)
+        for ring in rings:
+            # Wakes a decoder waiting on paused devices
+            ring.abort()
+        self._running.set()
+
+    def seek(self, seconds):
+        """
+        Ask the decoder to continue from a position in seconds. Positions,
+        here and in events, count from the start of the range being played,
+        so with a start offset 0 is that offset rather than the file's start.
+        """
+        if self._refuse():
+            return
+        with self._lock:
+            if self._decoded:
+                rings = None
+            else:
+                self._seek = max(seconds, 0.0)
+                rings = list(self._rings)
+        if rings is None:
+            self.emit("error", message=DECODED_MESSAGE)
+            return
+        for ring in rings:
+            # Makes room for the decoder if it is waiting on paused devices
+            ring.discard()
+
+    def set_gain(self, device_index, gain):
+        """Change a device's linear gain from its next chunk on (needs NumPy)."""
+        if self._refuse():
+            return
+        if not dsp.available():
+            raise RuntimeError("NumPy is required for volume control")
+        with self._lock:
+            self._gains[device_index] = gain
+        self.emit("volume", device=device_index, gain=gain)
+
+    # The rest is called by the playback engine
+
+    def unsupported(self, reason):
+        """Mark the run as one the controls cannot act on; requests then emit an error event."""
+        self._unsupported = reason
+        self._running.set()
+
+    def decoded(self):
+        """Called by the decoder when it stops; a seek still pending fails."""
+        with self._lock:
+            self._decoded = True
+            pending, self._seek = self._seek, None
+        if pending is not None:
+            self.emit("error", message=DECODED_MESSAGE)
+
+    def bind(self, rings):
+        """Register the rings of a run, which pause, seek and stop act on directly."""
+        with self._lock:
+            self._rings = list(rings)
+            held = not self._running.is_set()
+        for ring in self._rings:
+            ring.hold(held)
+        if self.cancel.is_set():
+            self.stop()
+
+    def gain(self, device_index, default=None):
+        """The gain a device's next chunk is played at."""
+        gain = self._gains.get(device_index, default)
+        return None if gain == 1.0 else gain
+
+    def wait_if_paused(self):
+        """Block while paused. Returns True if it had to wait."""
+        if self._running.is_set():
+            return False
+        self._running.wait()
+        return True
+
+    def take_seek(self):
+        """Return a pending seek position and clear it, or None."""
+        with self._lock:
+            seek, self._seek = self._seek, None
+        return seek
+
+    def seeked(self, position):
+        """Called by the decoder once audio from ``position`` seconds on is published."""
+        with self._lock:
+            self._base = position
+            self._played = {}
+            self.position = position
+            self._next_progress = position + self.progress_interval
+        self.emit("seeked", position_s=position)
+
+    def started(self):
+        """Called when the first audio reaches a device; emits the started event once."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self.emit("started", position_s=self._base)
+
+    def advance(self, device_index, frames, rate):
+        """Account for audio handed to a device, emitting start and progress events."""
+        with self._lock:
+            played = self._played.get(device_index, 0.0) + frames / rate
+            self._played[device_index] = played
+            position = self._base + played
+            events = []
+            if not self._started:
+                self._started = True
+                events.append(("started", self._base))
+            if position > self.position:
+                self.position = position
+                if position >= self._next_progress:
+                    self._next_progress = position + self.progress_interval
+                    events.append(("progress", position))
+        for name, position in events:
+            self.emit(name, position_s=position)
+
+    def finish(self):
+        """Called once playback has returned; emits the final event."""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.emit("finished", completed=not self.cancel.is_set(), position_s=self.position)
+
+
+class AsyncPlaybackSession:
+    """
+    One playback run controlled from asyncio.
+
+    The blocking playback call runs on a thread of its own, next to the
+    decoder and device threads it starts anyway; the event loop only
+    receives events and never waits on playback.
+    """
+
+    def __init__(self, source, device_indices, progress_interval=0.5, **play_options):
+        """
+        Args:
+            source: Path of a WAV file or an open reader to play
+            device_indices: List of device indices to play on
+            progress_interval: Seconds of audio between progress events
+            play_options: Keyword arguments for playback.play_audio_to_multiple_devices
+        """
+        self.source = source
+        self.device_indices = list(device_indices)
+        self.play_options = play_options
+        self.control = PlaybackControl(progress_interval=progress_interval)
+        self.state = "idle"
+        self.position = 0.0
+        self.error = None
+        self._loop = None
+        self._thread = None
+        self._done = None
+        self._queues = []
+        self._waiters = []
+
+    async def start(self):
+        """Start playback; returns once the first chunk reached a device, or playback ended."""
+        if self._thread is not None:
+            raise RuntimeError("Session already started")
+        self._loop = asyncio.get_running_loop()
+        self._done = self._loop.create_future()
+        self.control.on_event = lambda event: self._loop.call_soon_threadsafe(self._publish, event)
+        started = self._expect("started", "finished")
+        self.state = "starting"
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        await started
+
+    def _run(self):
+        try:
+            playback.play_audio_to_multiple_devices(self.source, self.device_indices,
+                                                    control=self.control, **self.play_options)
+        except Exception as e:
+            self.error = e
+            self.control.emit("error", message=str(e))
+        finally:
+            self.control.finish()
+
+    def _publish(self, event):
+        """Runs on the event loop for every event from the playback threads."""
+        name = event["event"]
+        if "position_s" in event:
+            self.position = event["position_s"]
+        if name == "started":
+            # Pausing before the first chunk arrives holds it back, so the run may start paused
+            self.state = "paused" if self.control.paused else "playing"
+        elif name == "resumed":
+            self.state = "playing"
+        elif name == "paused":
+            self.state = "paused"
+        elif name == "finished":
+            self.state = "finished" if event["completed"] else "stopped"
+            if not self._done.done():
+                self._done.set_result(event["completed"])
+
+        for queue in self._queues:
+            queue.put_nowait(event)
+        for names, future in list(self._waiters):
+            if name in names:
+                self._waiters.remove((names, future))
+                if not future.done():
+                    future.set_result(event)
+
+    def _expect(self, *names):
+        """A future resolved by the next event with one of the names."""
+        future = self._loop.create_future()
+        self._waiters.append((names, future))
+        return future
+
+    async def pause(self):
+        self.control.pause()
+        if self.control.paused and self.state == "playing":
+            self.state = "paused"
+
+    async def resume(self):
+        self.control.resume()
+        if not self.control.paused and self.state == "paused":
+            self.state = "playing"
+
+    async def seek(self, seconds):
+        """
+        Continue from a position in seconds, counted from the start of the
+        range being played; returns the seeked or error event.
+        """
+        if self.state in ("finished", "stopped"):
+            raise RuntimeError("Session has ended")
+        applied = self._expect("seeked", "error", "finished")
+        self.control.seek(seconds)
+        return await applied
+
+    async def set_volume(self, device_index, gain):
+        """Set a device's linear gain (needs NumPy)."""
+        self.control.set_gain(device_index, gain)
+
+    async def stop(self):
+        """Stop playback and wait until every device has stopped."""
+        self.control.stop()
+        if self._done is not None:
+            await self.wait()
+
+    async def wait(self):
+        """Wait until playback ends; returns True if it played to the end."""
+        return await asyncio.shield(self._done)
+
+    async def events(self):
+        """Yield every event from now on, ending after the finished event."""
+        if self._done is not None and self._done.done():
+            return
+        queue = asyncio.Queue()
+        self._queues.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] == "finished":
+                    return
+        finally:
+            self._queues.remove(queue)
@@ -0,0 +1,243 @@
+"""
+Resident player daemon.
+
+Running the CLI for every play pays each time for Python start-up, importing
+PyAudio, probing ffmpeg, Bluetooth discovery and opening every device
+stream. The daemon does all of that once and then waits for commands on a
+Unix socket, keeping the audio backend, the selected devices and their
+streams open between sessions, so a play command only has to open the track.
+
+The protocol is one JSON object per line in each direction. A request has a
+"command" of "play", "queue", "stop" or "status"; play and queue also take
+"paths", a list of audio files or directories. Every response has "ok" and
+either an "error" message or the daemon's status.
+"""
+import os
+import json
+import time
+import signal
+import socket
+import asyncio
+import threading
+
+from bluetooth_audio_player import playback
+from bluetooth_audio_player.backends import StreamPool
+from bluetooth_audio_player.client import COMMANDS
+from bluetooth_audio_player.playlist import PlaylistReader, expand_tracks
+
+# How long a play command waits for the first sample before it replies
+FIRST_SAMPLE_TIMEOUT_S = 2.0
+
+
+class PlayerDaemon:
+    """Plays queued tracks on a fixed set of devices whose streams stay open."""
+
+    def __init__(self, backend, devices, play_options, open_track, make_sync=None):
+        """
+        Args:
+            backend: Audio backend, kept open for the daemon's lifetime
+            devices: List of (device_index, device_name) to play on
+            play_options: Keyword arguments for playback.play_audio_to_multiple_devices
+            open_track: Callable taking a path and returning (reader, temporary
+                file or None), or None if the track cannot be played
+            make_sync: Callable returning a new DriftMonitor for each session (optional)
+        """
+        self.pool = StreamPool(backend)
+        self.devices = devices
+        self.play_options = play_options
+        self.open_track = open_track
+        self.make_sync = make_sync
+        self.queue = []
+        self.first_sample_ms = None
+        self._playlist = None
+        self._running = False
+        self._thread = None
+        self._cancel = None
+        self._lock = threading.Lock()
+
+    def play(self, tracks, received=None):
+        """
+        Replace whatever is playing or queued and start the tracks at once.
+        Returns once the first sample reached a device, or after a timeout.
+
+        Args:
+            tracks: List of audio file paths
+            received: perf_counter time the command arrived, for timing (optional)
+        """
+        received = received or time.perf_counter()
+        self.stop()
+        self.pool.mark()
+        with self._lock:
+            self.queue = list(tracks)
+        self._start()
+        if self.pool.started.wait(FIRST_SAMPLE_TIMEOUT_S):
+            self.first_sample_ms = (self.pool.first_write - received) * 1000
+            print(f"First sample {self.first_sample_ms:.0f} ms after the play command")
+
+    def enqueue(self, tracks):
+        """Add tracks after the ones already queued, starting playback if idle."""
+        with self._lock:
+            playlist = self._playlist
+            if playlist is not None and playlist.append(tracks):
+                return
+            self.queue.extend(tracks)
+            if self._running:
+                return
+        self.pool.mark()
+        self._start()
+
+    def stop(self):
+        """Stop playback and clear the queue; the device streams stay open."""
+        with self._lock:
+            self.queue = []
+            thread, cancel = self._thread, self._cancel
+        if cancel is not None:
+            cancel.set()
+        if thread is not None:
+            thread.join()
+
+    def status(self):
+        with self._lock:
+            playlist = self._playlist
+            queue = list(self.queue)
+            running = self._running
+        return {
+            "state": "playing" if running else "idle",
+            "track": playlist.current_track if playlist is not None else None,
+            "queue": (playlist.queued() if playlist is not None else []) + queue,
+            "devices": [{"index": idx, "name": name} for idx, name in self.devices],
+            "first_sample_ms": self.first_sample_ms,
+        }
+
+    def _start(self):
+        cancel = threading.Event()
+        thread = threading.Thread(target=self._run, args=(cancel,), daemon=True)
+        with self._lock:
+            self._running = True
+            self._cancel = cancel
+            self._thread = thread
+        thread.start()
+
+    def _run(self, cancel):
+        """Play queued tracks until the queue is empty or playback is stopped."""
+        while True:
+            with self._lock:
+                tracks, self.queue = self.queue, []
+                if cancel.is_set() or not tracks:
+                    self._running = False
+                    return
+            try:
+                self._play_tracks(tracks, cancel)
+            except Exception as e:
+                print(f"Error during playback: {e}")
+
+    def _play_tracks(self, tracks, cancel):
+        try:
+            playlist = PlaylistReader(tracks, self.open_track)
+        except ValueError as e:
+            print(f"Failed to open playlist: {e}")
+            return
+
+        options = dict(self.play_options, p=self.pool, cancel=cancel)
+        if self.make_sync is not None:
+            options["sync"] = self.make_sync()
+        with self._lock:
+            self._playlist = playlist
+        try:
+            playback.play_audio_to_multiple_devices(
+                playlist, [idx for idx, _ in self.devices], **options)
+        finally:
+            with self._lock:
+                self._playlist = None
+            playlist.close()
+
+    async def _dispatch(self, line):
+        received = time.perf_counter()
+        try:
+            request = json.loads(line)
+            command = request["command"]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "Malformed request"}
+        if command not in COMMANDS:
+            return {"ok": False, "error": f"Unknown command: {command}"}
+
+        loop = asyncio.get_running_loop()
+        # Commands run one at a time, off the event loop since they block on playback threads
+        async with self._command_lock:
+            if command in ("play", "queue"):
+                paths = request.get("paths") or []
+                missing = [path for path in paths if not os.path.exists(path)]
+                if missing:
+                    return {"ok": False, "error": f"Audio file not found: {missing[0]}"}
+                tracks = expand_tracks(paths)
+                if not tracks:
+                    return {"ok": False, "error": "No audio files found"}
+                if command == "play":
+                    await loop.run_in_executor(None, self.play, tracks, received)
+                else:
+                    await loop.run_in_executor(None, self.enqueue, tracks)
+            elif command == "stop":
+                await loop.run_in_executor(None, self.stop)
+        return dict(self.status(), ok=True)
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self._dispatch(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            writer.close()
+
+    async def _serve(self, socket_path):
+        self._command_lock = asyncio.Lock()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+
+        server = await asyncio.start_unix_server(self._handle_client, path=socket_path)
+        os.chmod(socket_path, 0o600)
+        print(f"Daemon listening on {socket_path}")
+        async with server:
+            await stopping.wait()
+        print("Daemon shutting down")
+
+    def serve(self, socket_path):
+        """
+        Accept commands on a Unix socket until interrupted.
+        Returns an exit code.
+        """
+        if os.path.exists(socket_path):
+            if _socket_in_use(socket_path):
+                print(f"Error: A daemon is already listening on {socket_path}")
+                return 1
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+
+        try:
+            asyncio.run(self._serve(socket_path))
+        finally:
+            self.stop()
+            self.pool.close_idle()
+            try:
+                os.unlink(socket_path)
+            except OSError:
+                pass
+        return 0
+
+
+def _socket_in_use(socket_path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
@@ -2,9 +2,13 @@
 Module for detecting and filtering Bluetooth audio devices.
 """
 import re
+import json
+import time
 import platform
+import threading
 import subprocess
-import pyaudio
+
+from bluetooth_audio_player import backends
 
 def get_windows_bluetooth_devices():
     """Get list of active Bluetooth device names on Windows."""
@@ -28,29 +32,171 @@ def get_windows_bluetooth_devices():
         print(f"Unexpected error: {e}")
         return []
 
-def match_with_pyaudio(bt_device_names):
+def _run_tool(cmd):
+    """Run a command and return its output, or None if it is missing or failed."""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=5)
+        return result.stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+def parse_pactl_sinks(output):
     """
-    Matches Bluetooth device names with PyAudio output devices.
-    Returns list of tuples with (device_index, device_name)
+    Get the names of Bluetooth sinks from the output of ``pactl -f json list sinks``.
+    Works with PulseAudio as well as PipeWire's pulse server.
     """
-    p = pyaudio.PyAudio()
-    matching_devices = []
+    names = []
+    for sink in json.loads(output):
+        properties = sink.get("properties", {})
+        if properties.get("device.bus") != "bluetooth" and not sink.get("name", "").startswith("bluez_"):
+            continue
+        name = sink.get("description") or properties.get("device.description")
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def parse_bluetoothctl_devices(output):
+    """Get device names from the output of ``bluetoothctl devices Connected``."""
+    names = []
+    for line in output.splitlines():
+        match = re.match(r'\s*Device\s+(?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}\s+(.+)$', line)
+        if match and match.group(1).strip() not in names:
+            names.append(match.group(1).strip())
+    return names
+
+def get_linux_bluetooth_devices(run=None):
+    """
+    Get list of connected Bluetooth audio device names on Linux.
+    
+    All sinks are listed with one ``pactl`` call, which only reports audio
+    devices; without PulseAudio or PipeWire one ``bluetoothctl`` call lists
+    every connected device instead.
+    
+    Args:
+        run: Callable taking a command line and returning its output, or
+            None if it failed; recorded output can stand in for the live tools
+    """
+    run = run or _run_tool
+    output = run(["pactl", "-f", "json", "list", "sinks"])
+    if output:
+        try:
+            return parse_pactl_sinks(output)
+        except (ValueError, AttributeError) as e:
+            print(f"Error parsing pactl output: {e}")
+    
+    output = run(["bluetoothctl", "devices", "Connected"])
+    if output:
+        return parse_bluetoothctl_devices(output)
+    
+    print("Error getting Linux Bluetooth devices: neither pactl nor bluetoothctl answered")
+    return []
+
+def parse_system_profiler_bluetooth(output):
+    """Get connected device names from the output of ``system_profiler SPBluetoothDataType -json``."""
+    names = []
+    for controller in json.loads(output).get("SPBluetoothDataType", []):
+        # Recent releases list connected devices on their own, older ones flag them
+        for entry in controller.get("device_connected", []):
+            names.extend(name for name in entry if name not in names)
+        for entry in controller.get("device_title", []):
+            for name, properties in entry.items():
+                if properties.get("device_isconnected") == "attrib_Yes" and name not in names:
+                    names.append(name)
+    return names
+
+def get_macos_bluetooth_devices(run=None):
+    """
+    Get list of connected Bluetooth device names on macOS, with one
+    ``system_profiler`` call.
     
+    Args:
+        run: Callable taking a command line and returning its output, or
+            None if it failed; recorded output can stand in for the live tool
+    """
+    run = run or _run_tool
+    output = run(["system_profiler", "SPBluetoothDataType", "-json"])
+    if not output:
+        print("Error getting macOS Bluetooth devices: system_profiler failed")
+        return []
+    try:
+        return parse_system_profiler_bluetooth(output)
+    except (ValueError, AttributeError) as e:
+        print(f"Error parsing system_profiler output: {e}")
+        return []
+
+def describe_output_devices(p):
+    """
+    List the host's output devices as (index, name, channels, host API) tuples.
+    This is cheap compared to a full discovery and changes whenever a device
+    is added or removed.
+    """
+    devices = []
     for i in range(p.get_device_count()):
         dev = p.get_device_info_by_index(i)
-        if dev['maxOutputChannels'] > 0: 
-            dev_name = dev['name']
-            
-            for bt_name in bt_device_names:
-                if bt_name.lower() in dev_name.lower():
-                    matching_devices.append((i, dev_name))
-                    print(f"  -> Matched with Bluetooth device: {bt_name}")
-                    break
+        if dev['maxOutputChannels'] > 0:
+            devices.append((i, dev['name'], dev['maxOutputChannels'], dev.get('hostApi')))
+    return devices
+
+def _name_tokens(name):
+    return re.findall(r'\w+', name.lower())
+
+def _whole_tokens(name):
+    """
+    Words of a name that any name containing it must hold as whole words:
+    the first and last word may be cut off, as "AirPod" in "AirPods".
+    """
+    name = name.lower()
+    return [match.group() for match in re.finditer(r'\w+', name)
+            if match.start() > 0 and match.end() < len(name)]
+
+def match_with_pyaudio(bt_device_names, p=None):
+    """
+    Matches Bluetooth device names with PyAudio output devices.
+    Returns list of tuples with (device_index, device_name)
+    
+    Output devices are indexed by the words in their names, so each
+    Bluetooth name is only compared with the devices holding the words it
+    has whole rather than with every device. Names without such a word,
+    such as a single word, are compared with every device, so the matches
+    are the same as a plain substring scan.
+    
+    Args:
+        bt_device_names: Names reported by the operating system
+        p: Shared PyAudio instance (optional)
+    """
+    own_pyaudio = p is None
+    if own_pyaudio:
+        p = backends.open_backend()
+    
+    outputs = describe_output_devices(p)
+    index = {}
+    for position, device in enumerate(outputs):
+        for token in _name_tokens(device[1]):
+            index.setdefault(token, set()).add(position)
+    
+    matches = {}
+    for bt_name in bt_device_names:
+        tokens = _whole_tokens(bt_name)
+        if tokens:
+            candidates = set.intersection(*(index.get(token, set()) for token in tokens))
+        else:
+            candidates = range(len(outputs))
+        for position in candidates:
+            idx, dev_name = outputs[position][:2]
+            if idx not in matches and bt_name.lower() in dev_name.lower():
+                matches[idx] = (dev_name, bt_name)
+    
+    matching_devices = []
+    for idx in sorted(matches):
+        dev_name, bt_name = matches[idx]
+        matching_devices.append((idx, dev_name))
+        print(f"  -> Matched with Bluetooth device: {bt_name}")
     
-    p.terminate()
+    if own_pyaudio:
+        p.terminate()
     return matching_devices
 
-def get_bluetooth_devices():
+def get_bluetooth_devices(p=None):
     """Detect Bluetooth devices across different operating systems."""
     system = platform.system()
     
@@ -64,7 +210,7 @@ def get_bluetooth_devices():
         print(f"System {system} not currently supported")
         return []
         
-    return match_with_pyaudio(bt_device_names)
+    return match_with_pyaudio(bt_device_names, p)
 
 def extract_base_device_name(device_name):
     """Extract the base name of a device from its full name."""
@@ -110,36 +256,93 @@ def filter_best_device_instances(devices):
     
     return list(unique_devices.values())
 
-def verify_device_connection(device_index):
-    """Verify that a device is actually connected and responsive."""
+def get_native_rate(device_index, p):
+    """
+    Get the sample rate a device runs at natively, as reported by the host
+    API. Opening it at any other rate makes the system resample every write.
+    Returns None if the device does not report one.
+    """
+    try:
+        rate = int(p.get_device_info_by_index(device_index)['defaultSampleRate'])
+    except Exception:
+        return None
+    return rate if rate > 0 else None
+
+def verify_device_connection(device_index, p=None, rate=None):
+    """
+    Verify that a device is actually connected and responsive.
+    
+    Args:
+        device_index: Index of the audio device
+        p: Shared PyAudio instance (optional)
+        rate: Sample rate to test (defaults to the device's native rate, or 44.1kHz)
+    """
+    own_pyaudio = p is None
     try:
-        p = pyaudio.PyAudio()
+        if own_pyaudio:
+            p = backends.open_backend()
         
         test_stream = p.open(
-            format=pyaudio.paInt16,
+            format=backends.paInt16,
             channels=2,
-            rate=44100,
+            rate=rate or get_native_rate(device_index, p) or 44100,
             output=True,
             output_device_index=device_index,
             frames_per_buffer=1024,
             start=False  
         )
         test_stream.close()
-        p.terminate()
         return True
     except:
-        p.terminate()
         return False
+    finally:
+        if own_pyaudio and p:
+            p.terminate()
 
-def verify_connected_devices(filtered_devices):
-    """Verify all devices are connected and responding."""
-    connected_devices = []
+def verify_connected_devices(filtered_devices, p=None, timeout=2.0):
+    """
+    Verify all devices are connected and responding.
+    
+    Devices are checked concurrently on one shared PyAudio session, and a
+    device that has not answered within ``timeout`` seconds is skipped, so a
+    single hung endpoint cannot hold up startup.
+    """
+    own_pyaudio = p is None
+    if own_pyaudio:
+        p = backends.open_backend()
+    
+    start = time.perf_counter()
+    results = {}
+    
+    def check(idx):
+        results[idx] = verify_device_connection(idx, p)
     
+    # Daemon threads, so an endpoint that never answers cannot keep the process alive
+    threads = []
+    for idx, _ in filtered_devices:
+        thread = threading.Thread(target=check, args=(idx,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    
+    deadline = start + timeout
+    for thread in threads:
+        thread.join(max(deadline - time.perf_counter(), 0))
+    
+    connected_devices = []
     for idx, name in filtered_devices:
-        if verify_device_connection(idx):
+        if idx not in results:
+            print(f"  Device index: {idx}, Name: {name} - TIMED OUT (SKIPPED)")
+        elif results[idx]:
             connected_devices.append((idx, name))
             print(f"  Device index: {idx}, Name: {name} - CONNECTION VERIFIED")
         else:
             print(f"  Device index: {idx}, Name: {name} - NOT RESPONDING (SKIPPED)")
-            
+    
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Verified {len(filtered_devices)} devices in {elapsed_ms:.0f} ms")
+    
+    # A timed-out check may still be using the session, so only release it when all finished
+    if own_pyaudio and len(results) == len(filtered_devices):
+        p.terminate()
+    
     return connected_devices
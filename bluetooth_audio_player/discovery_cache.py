@@ -0,0 +1,73 @@
+"""
+Persistent cache of Bluetooth device discovery results.
+
+Discovery runs a platform query, matches it against PyAudio and verifies
+every candidate, which for back-to-back plays costs more than the playback.
+Results are stored together with a fingerprint of the host's output device
+list; they are reused while they are younger than the configured TTL and the
+fingerprint still matches, so any device being added or removed triggers a
+fresh discovery.
+"""
+import os
+import json
+import time
+import hashlib
+
+from bluetooth_audio_player import config
+
+CACHE_NAME = "discovery.json"
+
+
+def fingerprint_devices(devices):
+    """Hash a list of (index, name, ...) device descriptions."""
+    return hashlib.sha256(json.dumps(devices).encode()).hexdigest()
+
+
+class DiscoveryCache:
+    """Discovery results on disk, keyed by the host output device list."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Create the cache described by the "detection" config section, or None if disabled."""
+        ttl = cfg["detection"]["cache_ttl"]
+        if not ttl:
+            return None
+        return cls(os.path.join(config.get_config_dir(), CACHE_NAME), ttl)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, entry):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(entry, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving discovery cache: {e}")
+
+    def lookup(self, fingerprint):
+        """Return cached selected devices if still valid for this device list, else None."""
+        entry = self._load()
+        if entry is None or time.time() - entry.get("timestamp", 0) >= self.ttl:
+            return None
+        if entry.get("fingerprint") != fingerprint:
+            return None
+        return [tuple(device) for device in entry["selected_devices"]]
+
+    def store(self, fingerprint, output_devices, selected_devices):
+        """Record the devices selected for the given host output device list."""
+        self._save({
+            "timestamp": time.time(),
+            "fingerprint": fingerprint,
+            "output_devices": [list(device) for device in output_devices],
+            "selected_devices": [list(device) for device in selected_devices],
+        })
@@ -0,0 +1,252 @@
+"""
+In-process DSP stage between the audio source and the device sinks.
+
+Converts 8/24/32-bit integer and float samples to 16-bit, remaps channels,
+downmixes to mono or stereo, resamples to a device's native rate and applies
+per-device gain, one whole block at a time with NumPy. This covers the
+common cases that would otherwise need a full FFmpeg round-trip. NumPy is
+optional; without it ``available()`` is False and callers fall back to
+FFmpeg. It is only imported by the first call to ``available()``, since
+loading it takes longer than starting the rest of the player and most files
+never need the DSP stage.
+"""
+from math import gcd
+
+np = None
+_numpy_checked = False
+
+# Input samples weighted for every resampled output sample
+RESAMPLE_TAPS = 32
+
+# Largest filter matrix, in coefficients, used to resample a whole period at once
+MAX_RESAMPLE_MATRIX = 1 << 20
+
+# Standard 5.1 (FL FR FC LFE BL BR) to stereo coefficients; LFE is dropped
+SURROUND_TO_STEREO = [
+    [1.0, 0.0, 0.7071, 0.0, 0.7071, 0.0],
+    [0.0, 1.0, 0.7071, 0.0, 0.0, 0.7071],
+]
+
+
+def available():
+    """Check whether the in-process DSP stage can be used, importing NumPy if needed."""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+    return np is not None
+
+
+def downmix_matrix(in_channels, out_channels):
+    """
+    Build an out_channels x in_channels mixing matrix.
+    Rows are normalised so the mix cannot clip more than any single input.
+    """
+    if in_channels == out_channels:
+        matrix = np.eye(in_channels)
+    elif in_channels == 6 and out_channels == 2:
+        matrix = np.array(SURROUND_TO_STEREO)
+    elif in_channels == 1:
+        matrix = np.ones((out_channels, 1))
+    elif out_channels == 1:
+        matrix = np.ones((1, in_channels))
+    else:
+        # Fold extra channels onto the outputs in turn (3rd to left, 4th to right, ...)
+        matrix = np.zeros((out_channels, in_channels))
+        for ch in range(in_channels):
+            matrix[ch % out_channels, ch] = 1.0
+    return matrix / matrix.sum(axis=1, keepdims=True)
+
+
+class DspStage:
+    """Converts blocks of one source format to interleaved 16-bit PCM."""
+
+    def __init__(self, sample_width, channels, is_float=False, out_channels=None,
+                 channel_map=None):
+        """
+        Args:
+            sample_width: Bytes per source sample
+            channels: Source channel count
+            is_float: Whether source samples are IEEE floats
+            out_channels: Output channel count (defaults to the source, at most 2)
+            channel_map: Source channel index for each channel before mixing,
+                e.g. [1, 0] swaps left and right
+        """
+        if np is None:
+            raise RuntimeError("NumPy is required for the DSP stage")
+        self.sample_width = sample_width
+        self.channels = channels
+        self.is_float = is_float
+        self.channel_map = list(channel_map) if channel_map else None
+        mapped = len(self.channel_map) if self.channel_map else channels
+        self.out_channels = out_channels or min(mapped, 2)
+        self._matrix = None
+        if mapped != self.out_channels:
+            self._matrix = downmix_matrix(mapped, self.out_channels).T.astype(np.float32)
+
+    def _to_float(self, data):
+        width = self.sample_width
+        if self.is_float:
+            dtype = np.float32 if width == 4 else np.float64
+            return np.frombuffer(data, dtype=dtype).astype(np.float32, copy=False)
+        if width == 1:
+            return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        if width == 2:
+            return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+        if width == 3:
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            samples = np.where(samples & 0x800000, samples - 0x1000000, samples)
+            return samples.astype(np.float32) / 8388608.0
+        if width == 4:
+            return np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648.0
+        raise ValueError(f"Unsupported sample width: {width}")
+
+    def process(self, data):
+        """Convert one block (bytes or memoryview) to 16-bit PCM bytes."""
+        frames = self._to_float(data).reshape(-1, self.channels)
+        if self.channel_map:
+            frames = frames[:, self.channel_map]
+        if self._matrix is not None:
+            frames = frames @ self._matrix
+        return to_int16(frames)
+
+
+def to_int16(frames):
+    """Clip float samples to [-1, 1] and pack them as 16-bit PCM bytes."""
+    return (np.clip(frames, -1.0, 32767 / 32768) * 32768.0).astype('<i2').tobytes()
+
+
+def apply_gain(data, gain):
+    """Scale a block of 16-bit PCM by a linear gain, clipping at full scale."""
+    samples = np.frombuffer(data, dtype='<i2').astype(np.float32) * gain
+    return np.clip(samples, -32768, 32767).astype('<i2').tobytes()
+
+
+class Resampler:
+    """
+    Streaming sample rate converter for interleaved 16-bit PCM.
+
+    Every output sample is interpolated from the RESAMPLE_TAPS nearest input
+    samples with a Blackman-windowed sinc, low-passed below the lower of the
+    two Nyquist frequencies. The rates' ratio is reduced to up/down, so the
+    filter has ``up`` distinct phases and the pattern repeats every ``down``
+    input samples. For the usual rate pairs one such period is a small
+    matrix and whole periods are converted with a single matrix product;
+    unusual ratios fall back to interpolating sample by sample. Input not
+    yet needed is carried over between blocks.
+    """
+
+    def __init__(self, in_rate, out_rate, channels, taps=RESAMPLE_TAPS):
+        """
+        Args:
+            in_rate: Source frame rate
+            out_rate: Frame rate to convert to
+            channels: Number of interleaved channels
+            taps: Filter length in input samples (even)
+        """
+        if np is None:
+            raise RuntimeError("NumPy is required for the DSP stage")
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.channels = channels
+        divisor = gcd(in_rate, out_rate)
+        self._up = out_rate // divisor
+        self._down = in_rate // divisor
+        self._taps = taps
+        half = taps // 2
+
+        # Distance from each phase's output position to each input sample, in input samples
+        x = np.arange(-half + 1, half + 1)[np.newaxis, :] - np.arange(self._up)[:, np.newaxis] / self._up
+        cutoff = min(1.0, out_rate / in_rate)
+        window = 0.42 + 0.5 * np.cos(np.pi * x / half) + 0.08 * np.cos(2 * np.pi * x / half)
+        filters = cutoff * np.sinc(cutoff * x) * np.where(np.abs(x) < half, window, 0.0)
+        self._filters = (filters / filters.sum(axis=1, keepdims=True)).astype(np.float32)
+
+        self._matrix = None
+        if self._up * (self._down + taps) <= MAX_RESAMPLE_MATRIX:
+            # Row k holds output k of a period, over the input samples it spans
+            self._matrix = np.zeros((self._up, self._down + taps - 1), dtype=np.float32)
+            for k in range(self._up):
+                base, phase = divmod(k * self._down, self._up)
+                self._matrix[k, base:base + taps] = self._filters[phase]
+
+        self.reset()
+
+    def reset(self):
+        """Forget the audio seen so far, e.g. after a seek, and start afresh."""
+        # Silence before the first sample, so the first output is centred on it
+        self._buffer = np.zeros((self._taps // 2 - 1, self.channels), dtype=np.float32)
+        # Offset of the next output from the first sample its filter spans, in 1/up input samples
+        self._position = 0
+        self._frames_in = 0
+        self._frames_out = 0
+
+    def process(self, data):
+        """Convert one block (bytes or memoryview) of 16-bit PCM, returning 16-bit PCM bytes."""
+        frames = np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+        self._frames_in += len(frames)
+        return self._convert(frames.astype(np.float32) / 32768.0)
+
+    def flush(self):
+        """Return the output still held back by the filter at the end of the audio."""
+        return self._convert(np.zeros((self._down + self._taps, self.channels), dtype=np.float32))
+
+    def _convert(self, frames):
+        self._buffer = np.concatenate((self._buffer, frames))
+        out = self._convert_periods() if self._matrix is not None else self._convert_samples()
+
+        # Never produce more than the input's duration, which the padding of a flush would
+        total = -(-self._frames_in * self._up // self._down)
+        out = out[:total - self._frames_out]
+        self._frames_out += len(out)
+        return to_int16(out)
+
+    def _convert_periods(self):
+        length = self._matrix.shape[1]
+        periods = (len(self._buffer) - length) // self._down + 1
+        if periods <= 0:
+            return self._buffer[:0]
+        windows = np.lib.stride_tricks.sliding_window_view(
+            self._buffer, (length, self.channels))[:periods * self._down:self._down, 0]
+        out = (self._matrix @ windows).reshape(-1, self.channels)
+        self._buffer = self._buffer[periods * self._down:]
+        return out
+
+    def _convert_samples(self):
+        last = (len(self._buffer) - self._taps) * self._up
+        if self._position > last:
+            return self._buffer[:0]
+        positions = self._position + np.arange((last - self._position) // self._down + 1) * self._down
+        bases, phases = np.divmod(positions, self._up)
+        windows = self._buffer[bases[:, np.newaxis] + np.arange(self._taps)[np.newaxis, :]]
+        out = np.einsum('nt,ntc->nc', self._filters[phases], windows)
+
+        self._position = positions[-1] + self._down
+        consumed = self._position // self._up
+        self._buffer = self._buffer[consumed:]
+        self._position -= consumed * self._up
+        return out
+
+
+def needs_processing(reader, max_channels=2):
+    """Check whether a reader's format has to pass through the DSP stage to be playable."""
+    return (reader.getsampwidth() != 2 or getattr(reader, 'is_float', False)
+            or reader.getnchannels() > max_channels)
+
+
+def stage_for(reader, out_channels=2, channel_map=None):
+    """
+    Return a DspStage converting reader's format for playback, or None if the
+    audio can be played as it is.
+    """
+    if not channel_map and not needs_processing(reader, out_channels):
+        return None
+    in_channels = reader.getnchannels()
+    mapped = len(channel_map) if channel_map else in_channels
+    return DspStage(reader.getsampwidth(), in_channels, getattr(reader, 'is_float', False),
+                    min(mapped, out_channels), channel_map)
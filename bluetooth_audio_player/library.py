@@ -0,0 +1,256 @@
+"""
+Media library scanning with a persistent metadata index.
+
+Checking a directory of clips used to start one ``ffprobe`` after the other
+and forget the results. A scan probes every file through a bounded pool of
+workers and keeps what it found in an index on disk, keyed by path and
+validated by size and modification time, so a rescan only probes files that
+were added or changed. WAV files are described from their header, in
+process; everything else goes to ffprobe.
+
+Playlists and format decisions read from the same index, so tracks that are
+known to be unplayable are skipped and a known format needs no probe.
+"""
+import os
+import json
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bluetooth_audio_player import config
+from bluetooth_audio_player.playlist import AUDIO_EXTENSIONS
+from bluetooth_audio_player.sources import open_wav
+
+INDEX_NAME = "library.json"
+INDEX_VERSION = 1
+
+
+def walk_audio_files(paths):
+    """Expand files and directories, recursively, into the audio files they hold, in name order."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if Path(name).suffix.lower() in AUDIO_EXTENSIONS:
+                    files.append(os.path.join(root, name))
+    return files
+
+
+def probe_wav(path):
+    """Describe a WAV file from its header, without starting a process."""
+    with open_wav(path) as wf:
+        width = wf.getsampwidth()
+        return {
+            "codec_name": f"pcm_f{width * 8}le" if wf.is_float else
+                          "pcm_u8" if width == 1 else f"pcm_s{width * 8}le",
+            "channels": wf.getnchannels(),
+            "sample_rate": wf.getframerate(),
+            "sample_width": width,
+            "duration": wf.getnframes() / wf.getframerate(),
+        }
+
+
+def probe_ffprobe(path):
+    """Describe the first audio stream of any file FFmpeg can read."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a:0",
+           "-show_entries", "stream=codec_name,channels,sample_rate,bits_per_sample:format=duration",
+           "-of", "json", path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=30)
+    output = json.loads(result.stdout)
+    streams = output.get("streams") or []
+    if not streams:
+        raise ValueError("no audio stream")
+    stream = streams[0]
+    info = {
+        "codec_name": stream.get("codec_name"),
+        "channels": int(stream.get("channels", 0)),
+        "sample_rate": int(stream.get("sample_rate", 0)),
+    }
+    bits = int(stream.get("bits_per_sample") or 0)
+    if bits:
+        info["sample_width"] = (bits + 7) // 8
+    duration = output.get("format", {}).get("duration")
+    if duration is not None:
+        info["duration"] = float(duration)
+    return info
+
+
+def probe_file(path):
+    """
+    Probe one audio file. Returns its metadata, or a dict with an "error"
+    entry if it cannot be read, so that failures are indexed too. Failures
+    that say nothing about the file, such as ffprobe missing or timing out,
+    are flagged with "retry" and not indexed.
+    """
+    try:
+        if Path(path).suffix.lower() == '.wav':
+            try:
+                return probe_wav(path)
+            except Exception:
+                # Formats the header parser does not know may still be readable by FFmpeg
+                pass
+        return probe_ffprobe(path)
+    except subprocess.CalledProcessError as e:
+        return {"error": (e.stderr or "").strip() or f"ffprobe exited with code {e.returncode}"}
+    except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+        return {"error": f"ffprobe failed: {e}", "retry": True}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+class MediaIndex:
+    """Probed metadata of audio files on disk, keyed by absolute path."""
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path: JSON file the index is kept in (None keeps it in memory only)
+        """
+        self.path = path
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Create the index described by the "library" config section, or None if disabled."""
+        options = cfg.get("library", config.DEFAULT_CONFIG["library"])
+        if not options["index"]:
+            return None
+        return cls(os.path.join(config.get_config_dir(), INDEX_NAME))
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        if self.path is None:
+            self._entries = {}
+            return self._entries
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self._entries = data["files"] if data.get("version") == INDEX_VERSION else {}
+        except (OSError, ValueError, KeyError):
+            self._entries = {}
+        return self._entries
+
+    def save(self):
+        """Write the index to disk if anything changed."""
+        with self._lock:
+            if not self._dirty or self.path is None:
+                return
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump({"version": INDEX_VERSION, "files": self._entries}, f)
+                os.replace(temp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                print(f"Error saving media index: {e}")
+
+    @staticmethod
+    def _signature(stat):
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def lookup(self, path, stat=None):
+        """
+        Return the indexed metadata of a file, or None if it is not indexed
+        or has changed since it was probed.
+        """
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._load().get(os.path.abspath(path))
+        if entry is None or entry["signature"] != self._signature(stat):
+            return None
+        return entry["info"]
+
+    def update(self, path, stat, info):
+        if info.get("retry"):
+            return
+        with self._lock:
+            self._load()[os.path.abspath(path)] = {"signature": self._signature(stat), "info": info}
+            self._dirty = True
+
+    def info(self, path):
+        """Return a file's metadata, probing and indexing it if needed."""
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            return {"error": str(e)}
+        info = self.lookup(path, stat)
+        if info is None:
+            info = probe_file(path)
+            self.update(path, stat, info)
+        return info
+
+    def prune(self):
+        """Forget files that no longer exist; returns how many were dropped."""
+        with self._lock:
+            entries = self._load()
+            missing = [path for path in entries if not os.path.exists(path)]
+            for path in missing:
+                del entries[path]
+            self._dirty = self._dirty or bool(missing)
+        return len(missing)
+
+
+def scan_library(paths, index, workers=0):
+    """
+    Probe every audio file under paths, reusing index entries for files
+    that did not change, and save the index.
+
+    Returns a list of (path, metadata) tuples in name order.
+
+    Args:
+        paths: Audio files and directories to scan
+        index: MediaIndex to read from and update
+        workers: Probes to run at once (0 for a default based on the core count)
+    """
+    started = time.perf_counter()
+    files = walk_audio_files(paths)
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+
+    results = {}
+    to_probe = []
+    indexed = 0
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            results[path] = {"error": str(e)}
+            continue
+        info = index.lookup(path, stat)
+        if info is None:
+            to_probe.append((path, stat))
+        else:
+            results[path] = info
+            indexed += 1
+
+    def probe(item):
+        path, stat = item
+        info = probe_file(path)
+        index.update(path, stat, info)
+        return path, info
+
+    # ffprobe runs in its own process, so threads are enough to keep the workers busy
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, info in executor.map(probe, to_probe):
+            results[path] = info
+
+    pruned = index.prune()
+    index.save()
+
+    failed = sum(1 for info in results.values() if "error" in info)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"Scanned {len(files)} files in {elapsed_ms:.0f} ms: {len(to_probe)} probed "
+          f"with {workers} workers, {indexed} from the index, {failed} unreadable"
+          + (f", {pruned} removed files forgotten" if pruned else ""))
+    return [(path, results[path]) for path in files]
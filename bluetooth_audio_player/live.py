@@ -0,0 +1,287 @@
+"""
+Live audio input.
+
+Raw PCM read from stdin, a named pipe or an audio input device is fanned out
+to the devices like any other source. A capture thread reads the input in
+chunks and pushes them into a bounded jitter buffer that absorbs bursty
+delivery: playback starts once it holds ``target_ms`` of audio, and if the
+input gets ahead of the devices the oldest chunks are dropped so that the
+delay never grows past ``max_ms``. If the input falls behind until the
+devices run dry, the buffer refills to ``target_ms`` before playback carries
+on.
+"""
+import os
+import sys
+import time
+import stat
+import threading
+from collections import deque
+
+from bluetooth_audio_player.sources import PcmPipeReader
+
+# Ring slots used for live input; the jitter buffer does the buffering, so
+# the ring only needs to decouple the capture from the device writes
+LIVE_RING_SLOTS = 4
+
+# Capture times kept for measuring how long chunks take to reach the devices
+LATENCY_HISTORY = 4096
+
+
+class JitterBuffer:
+    """Bounded FIFO of captured chunks, filled by the capture thread and drained by playback."""
+
+    def __init__(self, chunk_seconds, target_chunks, max_chunks):
+        """
+        Args:
+            chunk_seconds: Duration of one chunk
+            target_chunks: Chunks to hold before playback starts or resumes after an underrun
+            max_chunks: Chunks to hold at most; older ones are dropped beyond this
+        """
+        self.chunk_seconds = chunk_seconds
+        self.target_chunks = max(target_chunks, 1)
+        self.max_chunks = max(max_chunks, self.target_chunks)
+        self.dropped = 0
+        self.underruns = 0
+        self.closed = False
+        self._chunks = deque()
+        self._filling = True
+        self._started = None
+        self._handed_out = 0
+        self._ready = threading.Condition()
+
+    def put(self, chunk, captured_at):
+        with self._ready:
+            self._chunks.append((chunk, captured_at))
+            if len(self._chunks) > self.max_chunks:
+                # The input is ahead of the devices: skip forward to the target delay
+                while len(self._chunks) > self.target_chunks:
+                    self._chunks.popleft()
+                    self.dropped += 1
+            self._ready.notify()
+
+    def get(self):
+        """
+        Return the next (chunk, capture time), blocking while the buffer fills.
+        Returns None once the input has ended and the buffer is empty.
+
+        The devices pull chunks as fast as their own buffers allow, so the
+        target delay ends up buffered downstream and this buffer is usually
+        empty. Devices play what they were given in real time, though, so
+        the next chunk is due once everything handed out since playback
+        (re)started has been played; if it has not arrived by then the
+        devices ran dry and the buffer refills to the target.
+        """
+        with self._ready:
+            if not self._chunks and not self._filling:
+                deadline = self._started + self._handed_out * self.chunk_seconds
+                while not self._chunks and not self.closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._filling = True
+                        break
+                    self._ready.wait(remaining)
+            if self._filling:
+                while len(self._chunks) < self.target_chunks and not self.closed:
+                    self._ready.wait()
+                if self._started is not None and not self.closed:
+                    # Running out at the end of the input is no underrun
+                    self.underruns += 1
+                self._filling = False
+                self._started = time.perf_counter()
+                self._handed_out = 0
+            if not self._chunks:
+                return None
+            self._handed_out += 1
+            return self._chunks.popleft()
+
+    def depth(self):
+        return len(self._chunks)
+
+    def close(self):
+        """Mark the end of the input; what is buffered is still played."""
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class LiveSource:
+    """
+    A wave-style reader over live input, with a capture thread and a jitter buffer.
+    Each readframes call returns one captured chunk, whatever the requested size.
+    """
+
+    def __init__(self, read_chunk, sample_width, channels, rate, chunk_frames=1024,
+                 target_ms=60, max_ms=250, on_close=None):
+        """
+        Args:
+            read_chunk: Callable returning the next block of up to chunk_frames
+                frames of raw PCM, blocking until it is captured; b'' at end of input
+            sample_width: Bytes per sample
+            channels: Number of interleaved channels
+            rate: Frames per second
+            chunk_frames: Frames per captured chunk
+            target_ms: Audio to buffer before playback starts or resumes
+            max_ms: Most audio to buffer before the oldest is dropped
+            on_close: Called to release the input on close (optional)
+        """
+        self._read_chunk = read_chunk
+        self._format = (sample_width, channels, rate)
+        self.chunk_frames = chunk_frames
+        chunk_ms = chunk_frames * 1000 / rate
+        self.buffer = JitterBuffer(chunk_ms / 1000, round(target_ms / chunk_ms), round(max_ms / chunk_ms))
+        self._on_close = on_close
+        self.captured = 0
+        self.delivered = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._capture_times = deque(maxlen=LATENCY_HISTORY)
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._capture, daemon=True)
+        self._thread.start()
+
+    def _capture(self):
+        try:
+            while True:
+                data = self._read_chunk()
+                if not data:
+                    break
+                self.captured += 1
+                self.buffer.put(data, time.perf_counter())
+        except Exception as e:
+            print(f"Error reading live input: {e}")
+        finally:
+            self.buffer.close()
+
+    def getsampwidth(self):
+        return self._format[0]
+
+    def getnchannels(self):
+        return self._format[1]
+
+    def getframerate(self):
+        return self._format[2]
+
+    def readframes(self, n):
+        item = self.buffer.get()
+        if item is None:
+            return b''
+        chunk, captured_at = item
+        now = time.perf_counter()
+        waited = now - captured_at
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._capture_times.append(captured_at)
+        self.delivered += 1
+        return chunk
+
+    def latency_ms(self, chunks_played):
+        """
+        Milliseconds since the last of chunks_played chunks was captured, i.e.
+        how long input takes to reach a device that has written that many
+        chunks, not counting the device's own output latency. None if that
+        chunk is no longer remembered.
+        """
+        index = chunks_played - 1 - (self.delivered - len(self._capture_times))
+        if chunks_played <= 0 or not 0 <= index < len(self._capture_times):
+            return None
+        return (time.perf_counter() - self._capture_times[index]) * 1000
+
+    def stats(self):
+        """Capture, drop and buffering statistics, with durations in milliseconds."""
+        chunk_ms = self.chunk_frames * 1000 / self._format[2]
+        return {
+            "seconds": time.perf_counter() - self._started,
+            "captured_chunks": self.captured,
+            "dropped_chunks": self.buffer.dropped,
+            "dropped_ms": self.buffer.dropped * chunk_ms,
+            "underruns": self.buffer.underruns,
+            "buffered_ms": self.buffer.depth() * chunk_ms,
+            "buffer_wait_ms": self._wait_total * 1000 / self.delivered if self.delivered else 0.0,
+            "max_buffer_wait_ms": self._wait_max * 1000,
+        }
+
+    def report(self, metrics=None):
+        """
+        Print the current statistics.
+
+        Args:
+            metrics: MetricsRegistry of the thread engine, whose per-device write
+                counts give the latency from capture to each device (optional)
+        """
+        stats = self.stats()
+        print(f"Live input: {stats['seconds']:.0f} s, {stats['captured_chunks']} chunks captured, "
+              f"{stats['dropped_chunks']} dropped ({stats['dropped_ms']:.0f} ms), "
+              f"{stats['underruns']} underrun(s), {stats['buffered_ms']:.0f} ms buffered, "
+              f"buffer wait {stats['buffer_wait_ms']:.0f} ms avg / {stats['max_buffer_wait_ms']:.0f} ms max")
+        if metrics is None:
+            return
+        for idx, device in sorted(metrics.devices.items()):
+            latency = self.latency_ms(device.writes)
+            if latency is not None:
+                print(f"  Device {idx}: {latency:.0f} ms from capture to device write")
+
+    def start_reporting(self, interval, metrics=None):
+        """Report every interval seconds until the input has ended and been played."""
+        def run():
+            while not self.buffer.closed or self.buffer.depth():
+                time.sleep(interval)
+                self.report(metrics)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+
+def open_live_source(spec, audio_format, chunk_frames=1024, target_ms=60, max_ms=250, p=None):
+    """
+    Open live PCM input.
+
+    Args:
+        spec: "-" for stdin, the path of a named pipe or file, or "device:N"
+            for audio input device N
+        audio_format: Tuple of (sample width, channels, frame rate) of the input
+        chunk_frames: Frames per captured chunk
+        target_ms: Audio to buffer before playback starts or resumes
+        max_ms: Most audio to buffer before the oldest is dropped
+        p: Audio backend, needed for input devices
+
+    Returns:
+        LiveSource, or None if the input could not be opened
+    """
+    width, channels, rate = audio_format
+    on_close = None
+    try:
+        if spec.startswith("device:"):
+            stream = p.open(format=p.get_format_from_width(width), channels=channels, rate=rate,
+                            input=True, input_device_index=int(spec[len("device:"):]),
+                            frames_per_buffer=chunk_frames)
+
+            def read_chunk():
+                return stream.read(chunk_frames, exception_on_overflow=False)
+
+            def on_close():
+                stream.stop_stream()
+                stream.close()
+        else:
+            if spec == "-":
+                pipe = sys.stdin.buffer
+            else:
+                if stat.S_ISFIFO(os.stat(spec).st_mode):
+                    print(f"Waiting for a writer on {spec}...")
+                pipe = open(spec, 'rb')
+            reader = PcmPipeReader(pipe, width, channels, rate)
+
+            def read_chunk():
+                return reader.readframes(chunk_frames)
+
+            on_close = reader.close
+    except Exception as e:
+        print(f"Error opening live input {spec}: {e}")
+        return None
+
+    print(f"Live input from {'stdin' if spec == '-' else spec}: "
+          f"{width * 8}-bit, {channels} channel(s), {rate} Hz")
+    return LiveSource(read_chunk, width, channels, rate, chunk_frames, target_ms, max_ms, on_close)
@@ -2,14 +2,25 @@
 Main application entry point for the Bluetooth audio player.
 """
 import os
+import time
 import argparse
 from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from bluetooth_audio_player import device_discovery
 from bluetooth_audio_player import audio_processor
 from bluetooth_audio_player import playback
 from bluetooth_audio_player import utils
 from bluetooth_audio_player import config
+from bluetooth_audio_player import backends
+from bluetooth_audio_player.cache import ConversionCache
+from bluetooth_audio_player.metrics import MetricsRegistry
+from bluetooth_audio_player.discovery_cache import DiscoveryCache, fingerprint_devices
+from bluetooth_audio_player.library import MediaIndex, scan_library
+from bluetooth_audio_player.playlist import PlaylistReader, expand_tracks
+from bluetooth_audio_player.sync import DriftMonitor
+from bluetooth_audio_player.tuning import BufferTuner
 
 def parse_arguments():
     """Parse command line arguments."""
@@ -18,8 +29,16 @@ def parse_arguments():
     )
     
     parser.add_argument(
-        "audio_file", 
-        help="Path to the audio file to play"
+        "audio_files", 
+        nargs="*",
+        help="Audio file to play; several files or a directory are played as a gapless playlist"
+    )
+    
+    parser.add_argument(
+        "--scan",
+        action="store_true",
+        help="Probe the given audio files and directories into the media index, report "
+             "unreadable ones and exit"
     )
     
     parser.add_argument(
@@ -28,12 +47,80 @@ def parse_arguments():
         help="List all detected audio output devices and exit"
     )
     
+    parser.add_argument(
+        "--refresh-devices",
+        action="store_true",
+        help="Ignore cached discovery results and detect devices again"
+    )
+    
     parser.add_argument(
         "--device-indices", 
         type=str,
         help="Comma-separated list of device indices to play on (overrides auto-detection)"
     )
     
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Decode compressed audio on the fly instead of converting to a temporary WAV first"
+    )
+    
+    parser.add_argument(
+        "--start",
+        type=utils.parse_time,
+        metavar="TIME",
+        help="Start playing at this position, in seconds or as [h:]m:ss"
+    )
+    
+    parser.add_argument(
+        "--end",
+        type=utils.parse_time,
+        metavar="TIME",
+        help="Stop playing at this position, in seconds or as [h:]m:ss"
+    )
+    
+    parser.add_argument(
+        "--engine",
+        choices=playback.ENGINES,
+        help="Playback engine: one thread per device, non-blocking callback streams, "
+             "or device threads spread over worker processes"
+    )
+    
+    parser.add_argument(
+        "--backend",
+        choices=backends.BACKENDS,
+        help="Audio backend; \"simulated\" plays to virtual devices without audio hardware"
+    )
+    
+    parser.add_argument(
+        "--metrics-file",
+        help="Periodically write per-device playback metrics to this file"
+    )
+    
+    parser.add_argument(
+        "--live",
+        metavar="SOURCE",
+        help="Play live raw PCM in the configured output format from \"-\" (stdin), "
+             "a named pipe, or \"device:N\" for audio input device N"
+    )
+    
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Stay resident with devices and streams open, taking commands from bt-audio-ctl"
+    )
+    
+    parser.add_argument(
+        "--socket",
+        help="Control socket path for --daemon (default: daemon.sock in the config directory)"
+    )
+    
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Measure each device's latency with a test tone, save the offsets and exit"
+    )
+    
     parser.add_argument(
         "--debug", 
         action="store_true",
@@ -42,8 +129,302 @@ def parse_arguments():
     
     return parser.parse_args()
 
+def select_devices(args, cfg, p):
+    """
+    Resolve the devices to play on, either from --device-indices or by
+    detecting connected Bluetooth devices.
+    
+    Returns a tuple of (list of (device_index, device_name), exit code to
+    use when the list is empty).
+    """
+    # Use specified device indices if provided
+    if args.device_indices:
+        try:
+            device_indices = [int(idx.strip()) for idx in args.device_indices.split(',')]
+        except ValueError:
+            print("Error: Device indices must be comma-separated integers")
+            return [], 1
+        
+        # Create list of devices with names for display
+        selected_devices = []
+        for idx in device_indices:
+            try:
+                info = p.get_device_info_by_index(idx)
+                selected_devices.append((idx, info['name']))
+            except:
+                print(f"Warning: Device index {idx} not found")
+        
+        if not selected_devices:
+            print("No valid device indices specified")
+            return [], 1
+            
+        utils.print_devices_info(selected_devices, "Using specified devices")
+        return selected_devices, 0
+    
+    # Reuse a recent discovery if the host's device list has not changed since
+    discovery_cache = DiscoveryCache.from_config(cfg)
+    output_devices = device_discovery.describe_output_devices(p)
+    fingerprint = fingerprint_devices(output_devices)
+    if discovery_cache is not None and not args.refresh_devices:
+        selected_devices = discovery_cache.lookup(fingerprint)
+        if selected_devices:
+            utils.print_devices_info(selected_devices, "Selected devices for playback (cached)")
+            return selected_devices, 0
+    
+    # Auto-detect Bluetooth devices
+    print("Detecting active Bluetooth audio devices...")
+    bt_devices = device_discovery.get_bluetooth_devices(p)
+    
+    if not bt_devices:
+        print("No active Bluetooth audio devices detected.")
+        return [], 0
+        
+    utils.print_devices_info(bt_devices, "All detected Bluetooth audio devices")
+    
+    # Filter best device instances
+    filtered_devices = device_discovery.filter_best_device_instances(bt_devices)
+    utils.print_devices_info(filtered_devices, "Filtered active Bluetooth audio devices")
+    
+    # Verify devices are connected
+    selected_devices = device_discovery.verify_connected_devices(
+        filtered_devices, p, cfg["detection"]["verify_timeout"])
+    
+    if not selected_devices:
+        print("\nNo connected Bluetooth audio devices found for playback.")
+        print("Please ensure your devices are properly connected.")
+        return [], 1
+        
+    utils.print_devices_info(selected_devices, "Selected devices for playback")
+    if discovery_cache is not None:
+        discovery_cache.store(fingerprint, output_devices, selected_devices)
+    return selected_devices, 0
+
+def discover_new_devices(cfg, p, known):
+    """Detect connected Bluetooth devices that are not playing yet, for hot-plug joins."""
+    bt_devices = device_discovery.get_bluetooth_devices(p)
+    candidates = [device for device in device_discovery.filter_best_device_instances(bt_devices)
+                  if device[0] not in known]
+    if not candidates:
+        return []
+    connected = device_discovery.verify_connected_devices(
+        candidates, p, cfg["detection"]["verify_timeout"])
+    return [idx for idx, _ in connected]
+
+def list_devices(args, cfg):
+    """Print all audio output devices."""
+    p = backends.open_backend(args.backend or cfg["playback"]["backend"])
+    output_devices = device_discovery.describe_output_devices(p)
+    p.terminate()
+    
+    print("\nAll Audio Output Devices:")
+    for device in output_devices:
+        print(f"  Device index: {device[0]}, Name: {device[1]}")
+
+def run_scan(args, cfg):
+    """Probe audio files into the media index and report what was found."""
+    index = MediaIndex.from_config(cfg)
+    if index is None:
+        print("Note: the media index is disabled, scan results are not kept")
+        index = MediaIndex()
+    
+    results = scan_library(args.audio_files, index, cfg["library"]["scan_workers"])
+    unreadable = [(path, info["error"]) for path, info in results if "error" in info]
+    for path, error in unreadable:
+        print(f"  UNREADABLE {path}: {error}")
+    
+    formats = Counter(f"{info.get('codec_name')}, {info.get('sample_rate')} Hz, "
+                      f"{info.get('channels')} ch" for _, info in results if "error" not in info)
+    for description, count in formats.most_common():
+        print(f"  {count:>6} x {description}")
+    duration = sum(info.get("duration", 0) for _, info in results if "error" not in info)
+    print(f"{len(results) - len(unreadable)} playable files, {utils.format_time(duration)} in total")
+    return 1 if unreadable else 0
+
+def save_buffer_sizes(selected_devices, buffer_tuners):
+    """Store the buffer size each device should start with next time."""
+    saved_cfg = config.load_config()
+    print("\nTuned buffer sizes:")
+    for idx, name in selected_devices:
+        entry = buffer_tuners[idx].to_config()
+        saved_cfg["buffer_sizes"][name] = entry
+        print(f"  {name}: {entry['frames']} frames")
+    config.save_config(saved_cfg)
+
+def negotiate_output_format(cfg, p, selected_devices):
+    """
+    Get the format to decode audio to. With native_rates enabled this is the
+    configured format at the native rate most of the devices share, so that
+    only the remaining devices need the audio resampled.
+    """
+    output = dict(cfg["output_format"])
+    if not cfg["playback"]["native_rates"]:
+        return output
+    rates = Counter(device_discovery.get_native_rate(idx, p) or output["sample_rate"]
+                    for idx, _ in selected_devices)
+    # Ties go to the configured rate, then to the higher one
+    rate, count = max(rates.items(), key=lambda item: (item[1], item[0] == output["sample_rate"], item[0]))
+    if rate != output["sample_rate"]:
+        print(f"Converting to {rate} Hz where needed, the native rate of {count} of {len(selected_devices)} device(s)")
+        output["sample_rate"] = rate
+    return output
+
+def build_play_options(args, cfg, p, selected_devices):
+    """
+    Collect the keyword arguments for playback.play_audio_to_multiple_devices
+    from the config and command line.
+    
+    Returns a tuple of (options, buffer tuners or None, MetricsRegistry or None).
+    """
+    # Per-device settings are stored by device name since indices change between sessions;
+    # all output devices are mapped so that devices joining mid-session get theirs too
+    named_devices = [device[:2] for device in device_discovery.describe_output_devices(p)]
+    latency_offsets = {idx: cfg["latency_offsets"][name]
+                       for idx, name in named_devices if name in cfg["latency_offsets"]}
+    device_gains = {idx: cfg["device_gains"][name]
+                    for idx, name in named_devices if name in cfg["device_gains"]}
+    
+    # Adaptive buffering starts each device from its last tuned size
+    buffer_tuners = None
+    if cfg["playback"]["adaptive_buffer"]:
+        buffer_tuners = {idx: BufferTuner.from_config(cfg, idx, name)
+                         for idx, name in selected_devices}
+    
+    metrics = MetricsRegistry.from_config(cfg, args.metrics_file)
+    play_options = {
+        "preroll_ms": cfg["playback"]["preroll_ms"],
+        "engine": args.engine or cfg["playback"]["engine"],
+        "p": p,
+        "sync": DriftMonitor.from_config(cfg, report_interval=10.0 if cfg["debug"] else None),
+        "latency_offsets": latency_offsets,
+        "device_gains": device_gains,
+        "channel_map": cfg["playback"]["channel_map"],
+        "metrics": metrics,
+        "chunk_size": cfg["playback"]["chunk_size"],
+        "buffer_size": cfg["playback"]["buffer_size"],
+        "buffer_tuners": buffer_tuners,
+        "recovery": cfg["recovery"],
+        "native_rates": cfg["playback"]["native_rates"],
+        "processes": cfg["playback"]["processes"],
+        "start_tolerance_ms": cfg["playback"]["start_tolerance_ms"],
+    }
+    if not args.device_indices:
+        play_options["discover"] = lambda known: discover_new_devices(cfg, p, known)
+    return play_options, buffer_tuners, metrics
+
+def run_live(args, cfg):
+    """Fan live input out to the devices until the input ends."""
+    from bluetooth_audio_player.live import LIVE_RING_SLOTS, open_live_source
+    
+    p = backends.open_backend(args.backend or cfg["playback"]["backend"])
+    metrics = None
+    try:
+        selected_devices, exit_code = select_devices(args, cfg, p)
+        if not selected_devices:
+            return exit_code or 1
+        play_options, buffer_tuners, metrics = build_play_options(args, cfg, p, selected_devices)
+        
+        output = cfg["output_format"]
+        options = cfg["live"]
+        source = open_live_source(
+            args.live, (output["sample_width"], output["channels"], output["sample_rate"]),
+            cfg["playback"]["chunk_size"], options["target_ms"], options["max_ms"], p)
+        if source is None:
+            return 1
+        
+        # Per-device write counts tell how far each device is behind the input
+        latency_metrics = None
+        if play_options["engine"] == "threads":
+            if metrics is None:
+                play_options["metrics"] = MetricsRegistry()
+            latency_metrics = play_options["metrics"]
+        
+        # The jitter buffer already holds back target_ms, so devices start on the first chunk
+        play_options["preroll_ms"] = 0
+        play_options["ring_slots"] = LIVE_RING_SLOTS
+        if options["report_interval_s"]:
+            source.start_reporting(options["report_interval_s"], latency_metrics)
+        
+        print("\nStarting live playback, end the input to stop...")
+        try:
+            playback.play_audio_to_multiple_devices(
+                source, [idx for idx, _ in selected_devices], **play_options)
+        finally:
+            source.close()
+        source.report(latency_metrics)
+        
+        if buffer_tuners:
+            save_buffer_sizes(selected_devices, buffer_tuners)
+    except RuntimeError as e:
+        print(f"Playback failed: {e}")
+        return 1
+    finally:
+        if metrics is not None:
+            metrics.stop_exporter()
+        p.terminate()
+    
+    print("Live playback ended")
+    return 0
+
+def run_daemon(args, cfg):
+    """Select devices and open their streams once, then serve play commands until stopped."""
+    from bluetooth_audio_player.daemon import PlayerDaemon
+    
+    conversion_cache = ConversionCache.from_config(cfg)
+    # Converts uncached tracks into the cache while they play streamed; one at a
+    # time, since conversions of the same file would share a temporary path
+    cache_executor = ThreadPoolExecutor(max_workers=1) if conversion_cache is not None else None
+    p = backends.open_backend(args.backend or cfg["playback"]["backend"])
+    metrics = None
+    daemon = None
+    try:
+        selected_devices, exit_code = select_devices(args, cfg, p)
+        if not selected_devices:
+            return exit_code or 1
+        play_options, buffer_tuners, metrics = build_play_options(args, cfg, p, selected_devices)
+        
+        media_index = MediaIndex.from_config(cfg)
+        
+        def open_track(path):
+            return audio_processor.open_playlist_track(
+                path, cfg["output_format"], conversion_cache, args.stream, media_index, cache_executor)
+        
+        def make_sync():
+            return DriftMonitor.from_config(cfg, report_interval=10.0 if cfg["debug"] else None)
+        
+        daemon = PlayerDaemon(p, selected_devices, play_options, open_track, make_sync)
+        
+        # Open the device streams now so that the first play does not wait for them
+        if play_options["engine"] == "threads":
+            buffer_sizes = {idx: buffer_tuners[idx].frames if buffer_tuners else play_options["buffer_size"]
+                            for idx, _ in selected_devices}
+            output = cfg["output_format"]
+            indices = [idx for idx, _ in selected_devices]
+            # The rates each play will open the devices at, so the warm streams get reused
+            rates = {idx: output["sample_rate"] for idx in indices}
+            if play_options["native_rates"]:
+                rates = playback._negotiate_rates(p, indices, output["sample_rate"])
+            for idx in indices:
+                daemon.pool.warm([idx], (output["sample_width"], output["channels"], rates[idx]), buffer_sizes)
+        
+        exit_code = daemon.serve(args.socket or config.get_socket_path(cfg))
+        if buffer_tuners:
+            save_buffer_sizes(selected_devices, buffer_tuners)
+        return exit_code
+    finally:
+        if metrics is not None:
+            metrics.stop_exporter()
+        if daemon is not None:
+            daemon.pool.terminate()
+        else:
+            p.terminate()
+        if cache_executor is not None:
+            # A conversion already running finishes so that its result is kept
+            cache_executor.shutdown(cancel_futures=True)
+
 def main():
     """Main application function."""
+    started = time.perf_counter()
+    
     # Parse command line arguments
     args = parse_arguments()
     
@@ -53,6 +434,9 @@ def main():
     # Set debug mode
     if args.debug:
         cfg["debug"] = True
+
+    if cfg["cache"]["probe_tools"]:
+        utils.set_probe_cache(os.path.join(config.get_config_dir(), "tools.json"))
     
     # Print system info in debug mode
     if cfg["debug"]:
@@ -60,93 +444,145 @@ def main():
     
     # List devices if requested
     if args.list_devices:
-        p = __import__('pyaudio').PyAudio()
-        print("\nAll Audio Output Devices:")
-        
-        for i in range(p.get_device_count()):
-            dev = p.get_device_info_by_index(i)
-            if dev['maxOutputChannels'] > 0:
-                print(f"  Device index: {i}, Name: {dev['name']}")
-                
-        p.terminate()
+        list_devices(args, cfg)
         return
     
-    # Validate the audio file
-    if not os.path.exists(args.audio_file):
-        print(f"Error: Audio file not found: {args.audio_file}")
-        return 1
+    if args.daemon:
+        return run_daemon(args, cfg)
     
-    print(f"Processing audio file: {args.audio_file}")
+    if args.live:
+        return run_live(args, cfg)
     
-    # Check and prepare the audio file
-    converted_audio_file = audio_processor.prepare_audio_file(args.audio_file)
-    if not converted_audio_file:
-        print("Failed to prepare audio file for playback")
+    if not args.audio_files:
+        print("Error: No audio file given")
         return 1
     
-    # Use specified device indices if provided
-    if args.device_indices:
-        try:
-            device_indices = [int(idx.strip()) for idx in args.device_indices.split(',')]
-            
-            # Create list of devices with names for display
-            p = __import__('pyaudio').PyAudio()
-            selected_devices = []
-            
-            for idx in device_indices:
-                try:
-                    info = p.get_device_info_by_index(idx)
-                    selected_devices.append((idx, info['name']))
-                except:
-                    print(f"Warning: Device index {idx} not found")
-            
-            p.terminate()
-            
-            if not selected_devices:
-                print("No valid device indices specified")
-                return 1
-                
-            utils.print_devices_info(selected_devices, "Using specified devices")
-            
-        except ValueError:
-            print("Error: Device indices must be comma-separated integers")
+    if args.scan:
+        return run_scan(args, cfg)
+    
+    # Validate the audio files
+    for audio_file in args.audio_files:
+        if not os.path.exists(audio_file):
+            print(f"Error: Audio file not found: {audio_file}")
             return 1
+    
+    tracks = expand_tracks(args.audio_files)
+    if not tracks:
+        print("Error: No audio files found")
+        return 1
+    playlist_mode = len(tracks) > 1 or tracks[0] != args.audio_files[0]
+    audio_file = tracks[0]
+    
+    if args.start is not None and args.end is not None and args.start >= args.end:
+        print("Error: --end must be after --start")
+        return 1
+    
+    media_index = MediaIndex.from_config(cfg)
+    if playlist_mode:
+        print(f"Processing playlist of {len(tracks)} tracks")
+        # Known from an earlier --scan; unknown tracks are not probed just for this
+        known = [media_index.lookup(track) for track in tracks] if media_index is not None else []
+        if known and all(info and "duration" in info for info in known):
+            print(f"Playlist length: {utils.format_time(sum(info['duration'] for info in known))}")
+        if args.start is not None or args.end is not None:
+            print("Note: --start and --end only apply to single files, playing whole tracks")
     else:
-        # Auto-detect Bluetooth devices
-        print("Detecting active Bluetooth audio devices...")
-        bt_devices = device_discovery.get_bluetooth_devices()
+        print(f"Processing audio file: {audio_file}")
+        if args.start is not None or args.end is not None:
+            end = utils.format_time(args.end) if args.end is not None else "the end"
+            print(f"Playing from {utils.format_time(args.start or 0)} to {end}")
+    
+    converted_audio_file = None
+    conversion_cache = ConversionCache.from_config(cfg)
+    
+    # One audio backend session serves discovery, verification and playback
+    p = backends.open_backend(args.backend or cfg["playback"]["backend"])
+    metrics = None
+    try:
+        selected_devices, exit_code = select_devices(args, cfg, p)
+        if not selected_devices:
+            return exit_code
+        device_indices = [idx for idx, _ in selected_devices]
         
-        if not bt_devices:
-            print("No active Bluetooth audio devices detected.")
+        if args.calibrate:
+            from bluetooth_audio_player.calibration import calibrate_latency_offsets
+            print("\nCalibrating device latencies (keep a microphone near the speakers)...")
+            offsets = calibrate_latency_offsets(selected_devices, p)
+            if not offsets:
+                print("Calibration failed: the test tone was not detected")
+                return 1
+            saved_cfg = config.load_config()
+            saved_cfg["latency_offsets"].update(offsets)
+            config.save_config(saved_cfg)
+            for name, offset_ms in offsets.items():
+                print(f"  {name}: offset {offset_ms} ms")
             return 0
-            
-        utils.print_devices_info(bt_devices, "All detected Bluetooth audio devices")
         
-        # Filter best device instances
-        filtered_devices = device_discovery.filter_best_device_instances(bt_devices)
-        utils.print_devices_info(filtered_devices, "Filtered active Bluetooth audio devices")
+        # Check and prepare the audio file, decoding at the devices' rate; streamed audio
+        # and playlists are opened just before playback, and playlist tracks keep the
+        # configured format since they all have to share one
+        resample = cfg["playback"]["native_rates"]
+        output = negotiate_output_format(cfg, p, selected_devices)
+        if not args.stream and not playlist_mode:
+            converted_audio_file = audio_processor.prepare_audio_file(
+                audio_file, output, conversion_cache, resample, args.start, args.end)
+            if not converted_audio_file:
+                print("Failed to prepare audio file for playback")
+                return 1
         
-        # Verify devices are connected
-        selected_devices = device_discovery.verify_connected_devices(filtered_devices)
+        play_options, buffer_tuners, metrics = build_play_options(args, cfg, p, selected_devices)
         
-        if not selected_devices:
-            print("\nNo connected Bluetooth audio devices found for playback.")
-            print("Please ensure your devices are properly connected.")
-            return 1
+        print(f"\nStartup took {(time.perf_counter() - started) * 1000:.0f} ms")
+        
+        # Start playback
+        print("\nStarting playback process...")
+        if playlist_mode:
+            # Device streams stay open across tracks; the next one is prepared while the current plays
+            def open_track(path):
+                return audio_processor.open_playlist_track(
+                    path, cfg["output_format"], conversion_cache, args.stream, media_index)
+            try:
+                playlist = PlaylistReader(tracks, open_track)
+            except ValueError as e:
+                print(f"Failed to open playlist: {e}")
+                return 1
+            try:
+                playback.play_audio_to_multiple_devices(playlist, device_indices, **play_options)
+            finally:
+                playlist.close()
+        elif args.stream:
+            audio_stream = audio_processor.prepare_audio_stream(audio_file, output, resample,
+                                                                args.start, args.end)
+            if not audio_stream:
+                print("Failed to open audio file for playback")
+                return 1
+            try:
+                playback.play_audio_to_multiple_devices(audio_stream, device_indices, **play_options)
+            finally:
+                audio_stream.close()
+        else:
+            # A converted file holds just the requested range; an original WAV is seeked in
+            if converted_audio_file == audio_file:
+                play_options.update(start=args.start, end=args.end)
+            playback.play_audio_to_multiple_devices(converted_audio_file, device_indices, **play_options)
             
-        utils.print_devices_info(selected_devices, "Selected devices for playback")
-        device_indices = [idx for idx, _ in selected_devices]
-    
-    # Start playback
-    print("\nStarting playback process...")
-    playback.play_audio_to_multiple_devices(converted_audio_file, device_indices)
-    
-    # Clean up temporary files
-    if converted_audio_file != args.audio_file:
-        utils.clean_temp_files(converted_audio_file)
+            # Clean up temporary files; cached conversions are kept for the next run
+            cached = conversion_cache is not None and conversion_cache.is_cached_path(converted_audio_file)
+            if converted_audio_file != audio_file and not cached:
+                utils.clean_temp_files(converted_audio_file)
+        
+        if buffer_tuners:
+            save_buffer_sizes(selected_devices, buffer_tuners)
+    except RuntimeError as e:
+        print(f"Playback failed: {e}")
+        return 1
+    finally:
+        if metrics is not None:
+            metrics.stop_exporter()
+        p.terminate()
     
     print("Playback completed successfully")
     return 0
 
 if __name__ == "__main__":
-    exit(main())
\ No newline at end of file
+    exit(main())
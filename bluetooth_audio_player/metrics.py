@@ -0,0 +1,219 @@
+"""
+Per-device playback metrics.
+
+Every device sink records what happens in its write loop into its own
+DeviceMetrics: writes, bytes delivered, underruns, errors, and histograms of
+write duration and of how many chunks were buffered ahead of the device.
+Recording is a few integer increments with no locking or I/O; a background
+exporter periodically writes a snapshot of all devices as JSON or in the
+Prometheus text format.
+"""
+import os
+import json
+import time
+import bisect
+import threading
+
+FORMATS = ("json", "prometheus")
+
+# Upper bounds of the histogram buckets; a final bucket catches everything above
+WRITE_SECONDS_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BUFFER_FILL_BOUNDS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Histogram:
+    """Fixed-bucket histogram of observed values."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        counts = list(self.counts)
+        return {
+            "bounds": list(self.bounds),
+            "counts": counts,
+            "count": sum(counts),
+            "sum": self.sum,
+        }
+
+
+class DeviceMetrics:
+    """Counters and histograms of one device's write loop."""
+
+    def __init__(self, device_index):
+        self.device_index = device_index
+        self.writes = 0
+        self.bytes_delivered = 0
+        self.underruns = 0
+        self.errors = 0
+        self.rejoins = 0
+        self.rejoin_seconds = None
+        self.write_seconds = Histogram(WRITE_SECONDS_BOUNDS)
+        self.buffer_fill = Histogram(BUFFER_FILL_BOUNDS)
+
+    def record_write(self, duration, nbytes, fill):
+        """
+        Record one write to the device.
+
+        Args:
+            duration: Seconds the write (or stream callback) took
+            nbytes: Bytes handed to the device
+            fill: Chunks buffered ahead of the device when the write started
+        """
+        # Histogram.observe inlined; this runs once per chunk on every device
+        self.writes += 1
+        self.bytes_delivered += nbytes
+        histogram = self.write_seconds
+        histogram.counts[bisect.bisect_left(histogram.bounds, duration)] += 1
+        histogram.sum += duration
+        histogram = self.buffer_fill
+        histogram.counts[bisect.bisect_left(histogram.bounds, fill)] += 1
+        histogram.sum += fill
+
+    def record_underrun(self):
+        self.underruns += 1
+
+    def record_error(self):
+        self.errors += 1
+
+    def record_rejoin(self, startup_seconds):
+        """Record a device coming back after a failure and how long its stream took to restart."""
+        self.rejoins += 1
+        self.rejoin_seconds = startup_seconds
+
+    def snapshot(self):
+        return {
+            "writes": self.writes,
+            "bytes_delivered": self.bytes_delivered,
+            "underruns": self.underruns,
+            "errors": self.errors,
+            "rejoins": self.rejoins,
+            "rejoin_seconds": self.rejoin_seconds,
+            "write_seconds": self.write_seconds.snapshot(),
+            "buffer_fill_chunks": self.buffer_fill.snapshot(),
+        }
+
+
+def _prometheus_histogram(lines, name, device, histogram):
+    cumulative = 0
+    for bound, count in zip(list(histogram["bounds"]) + ["+Inf"], histogram["counts"]):
+        cumulative += count
+        lines.append(f'{name}_bucket{{device="{device}",le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{device="{device}"}} {histogram["sum"]}')
+    lines.append(f'{name}_count{{device="{device}"}} {histogram["count"]}')
+
+
+class MetricsRegistry:
+    """Holds the metrics of every device and exports them."""
+
+    def __init__(self):
+        self.devices = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, cfg, path=None):
+        """
+        Create a registry exporting as described by the "metrics" config
+        section, or None if no export path is configured.
+        """
+        options = cfg["metrics"]
+        path = path or options["path"]
+        if not path:
+            return None
+        registry = cls()
+        registry.start_exporter(path, options["format"], options["interval_s"])
+        return registry
+
+    def device(self, device_index):
+        """Return the metrics of a device, creating them on first use."""
+        with self._lock:
+            if device_index not in self.devices:
+                self.devices[device_index] = DeviceMetrics(device_index)
+            return self.devices[device_index]
+
+    def snapshot(self):
+        """Return the current metrics of all devices as a dict."""
+        with self._lock:
+            devices = list(self.devices.items())
+        return {
+            "timestamp": time.time(),
+            "devices": {str(idx): metrics.snapshot() for idx, metrics in devices},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Render the current metrics in the Prometheus text exposition format."""
+        devices = self.snapshot()["devices"]
+        lines = []
+        counters = [
+            ("bt_audio_writes_total", "writes", "Writes to the device"),
+            ("bt_audio_bytes_delivered_total", "bytes_delivered", "Audio bytes handed to the device"),
+            ("bt_audio_underruns_total", "underruns", "Times the device waited for audio"),
+            ("bt_audio_write_errors_total", "errors", "Failed writes to the device"),
+            ("bt_audio_rejoins_total", "rejoins", "Times the device came back after a failure"),
+        ]
+        for name, key, help_text in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for device, metrics in devices.items():
+                lines.append(f'{name}{{device="{device}"}} {metrics[key]}')
+
+        name = "bt_audio_rejoin_seconds"
+        lines.append(f"# HELP {name} Time from reopening the device to its first write at the last rejoin")
+        lines.append(f"# TYPE {name} gauge")
+        for device, metrics in devices.items():
+            if metrics["rejoin_seconds"] is not None:
+                lines.append(f'{name}{{device="{device}"}} {metrics["rejoin_seconds"]}')
+
+        histograms = [
+            ("bt_audio_write_duration_seconds", "write_seconds", "Duration of each write"),
+            ("bt_audio_buffer_fill_chunks", "buffer_fill_chunks", "Chunks buffered ahead of the device"),
+        ]
+        for name, key, help_text in histograms:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for device, metrics in devices.items():
+                _prometheus_histogram(lines, name, device, metrics[key])
+        return "\n".join(lines) + "\n"
+
+    def export(self, path, fmt="json"):
+        """Write the current metrics to a file, replacing it atomically."""
+        text = self.to_prometheus() if fmt == "prometheus" else self.to_json()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    def start_exporter(self, path, fmt="json", interval=5.0):
+        """Export to path every interval seconds from a background thread."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown metrics format: {fmt}")
+
+        def run():
+            while not self._stop.wait(interval):
+                self.export(path, fmt)
+            # One last export so the file reflects the complete run
+            self.export(path, fmt)
+
+        self._stop.clear()
+        self._exporter = threading.Thread(target=run, daemon=True)
+        self._exporter.start()
+
+    def stop_exporter(self):
+        if self._exporter is not None:
+            self._stop.set()
+            self._exporter.join()
+            self._exporter = None
@@ -1,12 +1,24 @@
 """
 Module for audio playback functionality.
 """
-import wave
-import pyaudio
 import threading
+import time
 import os
 
-def play_audio(device_index, wav_path, p=None):
+from bluetooth_audio_player import backends
+from bluetooth_audio_player import device_discovery
+from bluetooth_audio_player import dsp
+from bluetooth_audio_player.callback_engine import run_callback_engine
+from bluetooth_audio_player.ring_buffer import ChunkRing
+from bluetooth_audio_player.sources import open_wav
+from bluetooth_audio_player.supervisor import PlaybackSession
+from bluetooth_audio_player.sync import StartGate
+
+ENGINES = ("threads", "callback", "processes")
+DEFAULT_RING_SLOTS = 64
+
+def play_audio(device_index, wav_path, p=None, chunk_size=1024, buffer_size=None, start=None,
+               end=None):
     """
     Play audio on a specific device.
     
@@ -14,17 +26,21 @@ def play_audio(device_index, wav_path, p=None):
         device_index: Index of the audio device
         wav_path: Path to the WAV file to play
         p: PyAudio instance (optional)
+        chunk_size: Frames read and written at a time
+        buffer_size: Frames per stream buffer (optional, PortAudio's choice if omitted)
+        start: Seconds into the file to start at (optional)
+        end: Seconds into the file to stop at (optional)
     """
     wf = None
     stream = None
     own_pyaudio = False
     
     try:
-        wf = wave.open(wav_path, 'rb')
+        wf = open_wav(wav_path, start, end)
         
         # Create PyAudio instance if not provided
         if p is None:
-            p = pyaudio.PyAudio()
+            p = backends.open_backend()
             own_pyaudio = True
         
         # Get audio format details
@@ -37,25 +53,19 @@ def play_audio(device_index, wav_path, p=None):
         print(f"Opening stream on device {device_index} with format {format_type}")
         
         try:
-            stream = p.open(
-                format=format_type,
-                channels=channels,
-                rate=rate,
-                output=True,
-                output_device_index=device_index
-            )
+            stream = _open_output_stream(p, device_index, (width, channels, rate), buffer_size)
             
             print(f"Stream opened successfully for device {device_index}")
             
             # Read and play audio data in chunks
-            chunk_size = 1024
             data = wf.readframes(chunk_size)
             
             print(f"Starting data playback on device {device_index}")
             
             while data:
                 try:
-                    stream.write(data)
+                    # PyAudio only accepts bytes, not views of the mapped file
+                    stream.write(bytes(data))
                     data = wf.readframes(chunk_size)
                 except Exception as e:
                     print(f"Error writing to stream on device {device_index}: {e}")
@@ -94,45 +104,568 @@ def play_audio(device_index, wav_path, p=None):
                 
         print(f"Playback completed on device {device_index}")
 
-def play_audio_to_multiple_devices(wav_path, device_indices):
+class _RateGroups:
+    """
+    Devices grouped by the sample rate their streams are opened at.
+
+    Each group has its own ring. The decoder reads the source once and,
+    for every group running at a different rate, resamples each chunk once
+    for all of the group's devices.
+    """
+    
+    def __init__(self, audio_format, device_rates, make_ring, native_rate=None):
+        """
+        Args:
+            audio_format: Tuple of (sample width, channels, frame rate) of the source
+            device_rates: Dict of device index to the rate it is opened at
+            make_ring: Callable creating the ring for a rate
+            native_rate: Callable returning a device's native rate, for devices
+                that join later (optional)
+        """
+        self.audio_format = audio_format
+        self.rates = dict(device_rates)
+        self.native_rate = native_rate
+        width, channels, source_rate = audio_format
+        self.rings = {}
+        self.resamplers = {}
+        for rate in sorted(set(self.rates.values()), key=lambda rate: rate != source_rate):
+            self.rings[rate] = make_ring(rate)
+            if rate != source_rate:
+                self.resamplers[rate] = dsp.Resampler(source_rate, rate, channels)
+        # Devices joining later fall back to the source rate, or the first group
+        self.default_rate = next(iter(self.rings))
+        self.ring = self.rings[self.default_rate]
+    
+    def rate_for(self, device_index):
+        if device_index not in self.rates:
+            native = self.native_rate(device_index) if self.native_rate else None
+            self.rates[device_index] = native if native in self.rings else self.default_rate
+        return self.rates[device_index]
+    
+    def ring_for(self, device_index):
+        return self.rings[self.rate_for(device_index)]
+    
+    def format_for(self, device_index):
+        return self.audio_format[:2] + (self.rate_for(device_index),)
+    
+    def outputs(self):
+        """List of (ring, resampler or None) for the decoder to fill."""
+        return [(ring, self.resamplers.get(rate)) for rate, ring in self.rings.items()]
+    
+    def wait_for_fill(self, count):
+        for ring in self.rings.values():
+            ring.wait_for_fill(count)
+    
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+    
+    def release(self):
+        """Free rings held in shared memory."""
+        for ring in self.rings.values():
+            if hasattr(ring, "release"):
+                ring.release()
+
+def _decode_to_ring(wf, ring, chunk_size=1024, stage=None, cancel=None, outputs=None, control=None):
+    """
+    Read the audio source once and publish every chunk to the shared ring.
+    
+    Zero-copy sources return views of the mapped file. PyAudio's write only
+    takes bytes, so each chunk is materialised here exactly once and that one
+    object is shared by every device.
+    
+    Args:
+        wf: Open wave-compatible reader
+        ring: ChunkRing shared by all device sinks
+        chunk_size: Number of frames per chunk
+        stage: DspStage converting each chunk to 16-bit PCM (optional)
+        cancel: threading.Event that stops playback on every device when set (optional)
+        outputs: List of (ring, Resampler or None) to publish to instead of
+            ring, each resampling chunks for its devices (optional)
+        control: PlaybackControl whose seek requests are carried out here (optional)
+    """
+    outputs = outputs or [(ring, None)]
+    try:
+        data = wf.readframes(chunk_size)
+        while data:
+            if cancel is not None and cancel.is_set():
+                for target, _ in outputs:
+                    target.abort()
+                break
+            seek = control.take_seek() if control is not None else None
+            if seek is not None and _seek_source(wf, seek, outputs, control):
+                data = wf.readframes(chunk_size)
+                if not data:
+                    break
+            if stage is not None:
+                data = stage.process(data)
+            elif type(data) is not bytes:
+                data = bytes(data)
+            for target, resampler in outputs:
+                chunk = resampler.process(data) if resampler is not None else data
+                if chunk:
+                    target.put(chunk)
+            if all(target.closed for target, _ in outputs):
+                break
+            data = wf.readframes(chunk_size)
+        if not data:
+            # The end of the audio, so release what the resamplers held back
+            for target, resampler in outputs:
+                if resampler is not None:
+                    target.put(resampler.flush())
+    except Exception as e:
+        print(f"Error reading audio data: {e}")
+    finally:
+        for target, _ in outputs:
+            target.close()
+        if control is not None:
+            control.decoded()
+
+def _seek_source(wf, seconds, outputs, control):
+    """
+    Move the source to a position and drop everything decoded before it.
+    Returns False if the source cannot seek.
+    """
+    if not hasattr(wf, "setpos") or not hasattr(wf, "getnframes"):
+        control.emit("error", message="This source cannot seek")
+        return False
+    position = min(int(seconds * wf.getframerate()), wf.getnframes())
+    try:
+        wf.setpos(position)
+    except Exception as e:
+        control.emit("error", message=f"Seek failed: {e}")
+        return False
+    for target, resampler in outputs:
+        target.discard()
+        if resampler is not None:
+            resampler.reset()
+    control.seeked(position / wf.getframerate())
+    return True
+
+def _open_output_stream(p, device_index, audio_format, frames_per_buffer=None):
+    """Open a blocking output stream, with a given buffer size if one is set."""
+    width, channels, rate = audio_format
+    options = {}
+    if frames_per_buffer:
+        options["frames_per_buffer"] = frames_per_buffer
+    return p.open(
+        format=p.get_format_from_width(width),
+        channels=channels,
+        rate=rate,
+        output=True,
+        output_device_index=device_index,
+        **options
+    )
+
+def _play_from_ring(device_index, reader, audio_format, p, sync=None, gain=None, metrics=None,
+                    frames_per_buffer=None, tuner=None, on_started=None, ready=None, control=None,
+                    start_gate=None):
+    """
+    Play chunks from a shared ring on a specific device.
+    
+    Returns True once the ring is drained, False if the device failed. The
+    reader stays attached either way; the caller detaches it when done.
+    
+    Args:
+        device_index: Index of the audio device
+        reader: This device's read cursor on the shared ring
+        audio_format: Tuple of (sample width, channels, frame rate)
+        p: PyAudio instance
+        sync: DriftMonitor used to measure and correct clock drift (optional)
+        gain: Linear gain applied to this device's copy of the audio (optional)
+        metrics: DeviceMetrics recording this device's write loop (optional)
+        frames_per_buffer: Stream buffer size in frames (optional)
+        tuner: BufferTuner that grows the stream buffer after underflows (optional)
+        on_started: Called once the first chunk has been written (optional)
+        ready: Called once the stream is open, before anything is written; it
+            may block to hold the start back (optional)
+        control: PlaybackControl for pausing, live gain and progress (optional)
+        start_gate: StartGate holding the first write back until every
+            device can start at the same moment (optional)
+    """
+    stream = None
+    clock = None
+    finished = False
+    width, channels, rate = audio_format
+    frame_size = width * channels
+    
+    try:
+        stream = _open_output_stream(p, device_index, audio_format, frames_per_buffer)
+        
+        print(f"Stream opened successfully for device {device_index}")
+        
+        if sync is not None:
+            clock = sync.add_device(device_index, rate)
+            clock.set_latency(stream.get_output_latency())
+        if tuner is not None:
+            tuner.restart(stream.get_write_available())
+        if ready is not None:
+            ready()
+        
+        skip = 0
+        if start_gate is not None:
+            start_gate.arrive(device_index)
+            # A device that missed the shared start skips what the others have played meanwhile
+            skip = start_gate.started(device_index, rate) * frame_size
+        
+        if reader.delay:
+            delay, skip = reader.delay[skip:], max(skip - len(reader.delay), 0)
+            if delay:
+                stream.write(delay)
+        
+        skipped = 0
+        while True:
+            # Wait before taking a chunk, so a seek made while paused drops it with the rest
+            if control is not None and control.wait_if_paused():
+                if clock:
+                    # Time spent paused is not clock drift
+                    clock.reset()
+                if tuner is not None:
+                    # Nor is the buffer running dry meanwhile an underflow
+                    tuner.restart()
+            data = reader.get_nowait()
+            if data is None:
+                data = reader.get()
+                if data is None:
+                    finished = True
+                    break
+                if metrics is not None:
+                    metrics.record_underrun()
+                if clock:
+                    # The device waited on the decoder, which is not clock drift
+                    clock.reset()
+                if tuner is not None:
+                    # Nor is it a buffer too small
+                    tuner.restart()
+            
+            if skip:
+                data, skip = data[skip:], max(skip - len(data), 0)
+                if not data:
+                    continue
+            
+            if tuner is not None and tuner.needs_growth() and tuner.grow():
+                # Let the other devices carry on while the stream is reopened, then rejoin them
+                reader.suspend()
+                stream.stop_stream()
+                stream.close()
+                stream = _open_output_stream(p, device_index, audio_format, tuner.frames)
+                tuner.restart(stream.get_write_available())
+                if clock:
+                    clock.set_latency(stream.get_output_latency())
+                    clock.reset()
+                continue
+            
+            if clock and reader.dropped_chunks != skipped:
+                # Audio skipped after falling behind is not clock drift either
+                skipped = reader.dropped_chunks
+                clock.reset()
+            
+            if control is not None:
+                gain = control.gain(device_index, gain)
+            if gain is not None:
+                data = dsp.apply_gain(data, gain)
+            if clock:
+                data, frames = clock.apply(data, frame_size)
+            if tuner is not None:
+                tuner.check_buffer(stream.get_write_available())
+            if metrics is not None:
+                fill = reader.pending()
+            started = time.perf_counter()
+            try:
+                stream.write(data)
+            except Exception as e:
+                if metrics is not None:
+                    metrics.record_error()
+                print(f"Error writing to stream on device {device_index}: {e}")
+                break
+            write_time = time.perf_counter() - started
+            if metrics is not None:
+                metrics.record_write(write_time, len(data), fill)
+            if tuner is not None:
+                tuner.record_write(write_time, len(data) // frame_size, rate)
+            if control is not None:
+                control.advance(device_index, len(data) // frame_size, rate)
+            if on_started is not None:
+                on_started()
+                on_started = None
+            if clock:
+                clock.update(frames)
+                sync.maybe_report()
+        
+        print(f"Closing stream for device {device_index}")
+        
+    except Exception as e:
+        print(f"Error creating stream for device {device_index}: {e}")
+    
+    finally:
+        if stream:
+            try:
+                stream.stop_stream()
+                stream.close()
+            except:
+                pass
+    
+    return finished
+
+def _build_delays(latency_offsets, audio_format):
+    """Turn per-device offsets in milliseconds into blocks of leading silence."""
+    width, channels, rate = audio_format
+    delays = {}
+    for idx, offset_ms in latency_offsets.items():
+        delay_frames = int(round(offset_ms * rate / 1000))
+        if delay_frames > 0:
+            delays[idx] = bytes(delay_frames * width * channels)
+    return delays
+
+def _negotiate_rates(p, device_indices, source_rate):
+    """
+    Choose the rate each device is opened at: its native rate where the
+    audio can be resampled to it in process, otherwise the source rate.
+    """
+    native = {idx: device_discovery.get_native_rate(idx, p) or source_rate for idx in device_indices}
+    other_rates = sorted(set(native.values()) - {source_rate})
+    if not other_rates:
+        return native
+    if not dsp.available():
+        print("Warning: NumPy is not installed, devices run at the source rate and resample themselves")
+        return {idx: source_rate for idx in device_indices}
+    for rate in other_rates:
+        indices = ", ".join(str(idx) for idx, device_rate in native.items() if device_rate == rate)
+        print(f"Resampling in process from {source_rate} Hz to {rate} Hz for device(s) {indices}")
+    return native
+
+def _run_thread_engine(p, groups, readers, sync=None, gains=None, metrics=None,
+                       buffer_sizes=None, tuners=None, delays=None, recovery=None, discover=None,
+                       control=None, start_gate=None):
+    """
+    Play the rate groups' rings with one blocking-write thread per device,
+    reopening devices that fail and adding ones that are discovered while playing.
+    """
+    gains = gains or {}
+    buffer_sizes = buffer_sizes or {}
+    tuners = tuners or {}
+    
+    def play(idx, reader, on_started):
+        device_metrics = metrics.device(idx) if metrics is not None else None
+        try:
+            return _play_from_ring(idx, reader, groups.format_for(idx), p, sync, gains.get(idx),
+                                   device_metrics, buffer_sizes.get(idx), tuners.get(idx),
+                                   on_started, control=control, start_gate=start_gate)
+        finally:
+            if start_gate is not None:
+                # A device that failed before starting must not hold the others back
+                start_gate.leave(idx)
+    
+    if recovery is None:
+        session = PlaybackSession(groups.ring, play, delays, metrics, max_attempts=0,
+                                  ring_for=groups.ring_for)
+    else:
+        session = PlaybackSession.from_config(groups.ring, play, recovery, delays, metrics,
+                                              groups.ring_for)
+    
+    print(f"Starting playback on {len(readers)} devices...")
+    for idx, reader in readers:
+        session.add_device(idx, reader)
+    if discover is not None and recovery is not None and recovery["hotplug_interval_s"]:
+        session.watch(discover, recovery["hotplug_interval_s"])
+    
+    # Wait for all devices, including any that join along the way
+    print("Waiting for playback to complete...")
+    try:
+        session.wait()
+    finally:
+        session.stop()
+
+def play_audio_to_multiple_devices(wav_path, device_indices, preroll_ms=200, engine="threads",
+                                   p=None, sync=None, latency_offsets=None, device_gains=None,
+                                   channel_map=None, chunk_size=1024, metrics=None,
+                                   buffer_size=None, buffer_tuners=None, recovery=None,
+                                   discover=None, cancel=None, ring_slots=DEFAULT_RING_SLOTS,
+                                   native_rates=False, processes=None, start=None, end=None,
+                                   control=None, start_tolerance_ms=5.0):
     """
     Play audio to multiple devices simultaneously.
     
+    The audio is read once by a single decoder thread which fills a shared
+    ring buffer; every device consumes the same chunks through its own read
+    cursor. Devices start once ``preroll_ms`` of audio has been decoded
+    and every device's stream is open, all at the same moment.
+    
     Args:
-        wav_path: Path to the WAV file to play
+        wav_path: Path to the WAV file to play, or an open reader such as the
+            one returned by audio_processor.stream_audio_file
         device_indices: List of device indices to play on
+        preroll_ms: Milliseconds of audio to buffer before playback starts
+        engine: "threads" for one blocking-write thread per device,
+            "callback" for non-blocking callback streams fed by the decoder, or
+            "processes" for device threads sharded over worker processes
+        p: PyAudio instance or other backend from the backends module
+            (optional, a PyAudio instance is created and terminated here if omitted)
+        sync: DriftMonitor that keeps the devices' clocks in line (optional)
+        latency_offsets: Dict of device index to milliseconds by which that
+            device is delayed, to line up speakers with different latencies
+        device_gains: Dict of device index to linear gain (needs NumPy)
+        channel_map: Source channel index for each output channel, e.g. [1, 0]
+            to swap left and right (needs NumPy)
+        chunk_size: Frames per chunk handed to each device
+        metrics: MetricsRegistry collecting per-device metrics (optional)
+        buffer_size: Frames per device stream buffer (optional)
+        buffer_tuners: Dict of device index to BufferTuner, which overrides
+            buffer_size for that device and adapts it to observed underflows
+        recovery: Dict with the "recovery" config options for reopening failed
+            devices and adding new ones (optional, failed devices are dropped if omitted)
+        discover: Callable taking the set of devices already playing and
+            returning new device indices, polled to add devices mid-session (optional)
+        cancel: threading.Event that stops playback early when set, discarding
+            audio already buffered (optional)
+        ring_slots: Chunks the decoder may run ahead of the slowest device;
+            live input keeps this small so that latency stays low
+        native_rates: Open every device at its native sample rate, resampling
+            in process once per rate rather than leaving it to the system for
+            every stream (needs NumPy)
+        processes: Worker processes for the "processes" engine (defaults to one per core)
+        start: Seconds into the file to start at; readers passed in are
+            expected to be positioned already (optional)
+        end: Seconds into the file to stop at (optional)
+        control: controller.PlaybackControl to pause, seek, stop and change
+            volume while playing, and to receive progress events (optional)
+        start_tolerance_ms: How far apart the devices may start; one that
+            misses the shared start by more skips ahead to stay in line
     """
     if not device_indices:
         print("No devices specified for playback")
         return
     
+    if engine not in ENGINES:
+        print(f"Unknown playback engine: {engine}")
+        return
+    
+    # Readers passed in by the caller stay open; files opened here are closed here
+    own_reader = isinstance(wav_path, (str, os.PathLike))
+    if own_reader:
+        try:
+            wf = open_wav(os.fspath(wav_path), start, end)
+        except Exception as e:
+            print(f"Error opening audio file {wav_path}: {e}")
+            return
+    else:
+        wf = wav_path
+    
+    audio_format = (wf.getsampwidth(), wf.getnchannels(), wf.getframerate())
+    print(f"Audio format: width={audio_format[0]}, channels={audio_format[1]}, rate={audio_format[2]}")
+    
+    if control is not None:
+        cancel = cancel or control.cancel
+        if engine == "processes":
+            control.unsupported("Pause, seek and volume need the threads or callback engine")
+    
+    # Formats the devices cannot take directly are converted in process, once for all devices
+    stage = None
+    gains = {idx: gain for idx, gain in (device_gains or {}).items() if gain != 1.0}
+    # Volume changes while playing need NumPy loaded, whatever the format
+    needs_dsp = bool(gains or channel_map or control) or dsp.needs_processing(wf)
+    if needs_dsp and dsp.available():
+        stage = dsp.stage_for(wf, channel_map=channel_map)
+        if stage is not None:
+            audio_format = (2, stage.out_channels, audio_format[2])
+            print(f"Converting in process to 16-bit, {stage.out_channels} channel(s)")
+    elif gains or channel_map:
+        print("Warning: NumPy is not installed, ignoring device gains and channel map")
+        gains = {}
+    
     # Create a single PyAudio instance to be shared
-    p = pyaudio.PyAudio()
+    own_pyaudio = p is None
+    if own_pyaudio:
+        p = backends.open_backend()
+    
+    source_rate = audio_format[2]
+    device_rates = {idx: source_rate for idx in device_indices}
+    native_rate = None
+    if native_rates:
+        device_rates = _negotiate_rates(p, device_indices, source_rate)
+        native_rate = lambda idx: device_discovery.get_native_rate(idx, p)
+    
+    # Delayed devices hold their chunks back in the ring, so it must be deep enough for them
+    offsets = latency_offsets or {}
+    max_delay_s = max((ms / 1000 for ms in offsets.values()), default=0)
+    slots = ring_slots + max(-(-int(max_delay_s * source_rate) // chunk_size), 0)
+    if engine == "processes":
+        # Imported here so that the other engines start without multiprocessing
+        from bluetooth_audio_player.shared_ring import SharedChunkRing
+        width, channels, _ = audio_format
+        # Twice the chunk size leaves room for the resamplers' uneven output
+        make_ring = lambda rate: SharedChunkRing(
+            slots, 2 * width * channels * -(-chunk_size * rate // source_rate), len(device_indices))
+    else:
+        make_ring = lambda rate: ChunkRing(slots=slots)
+    groups = _RateGroups(audio_format, device_rates, make_ring, native_rate)
+    delays = {}
+    for idx, offset_ms in offsets.items():
+        delays.update(_build_delays({idx: offset_ms}, groups.format_for(idx)))
+    
+    preroll_chunks = int(preroll_ms * source_rate / 1000 / chunk_size)
+    preroll_chunks = min(max(preroll_chunks, 1), slots - 1)
+    decoder = threading.Thread(target=_decode_to_ring,
+                               args=(wf, groups.ring, chunk_size, stage, cancel, groups.outputs(),
+                                     control if engine != "processes" else None))
     
     try:
-        # Create a thread for each device
-        threads = []
-        for idx in device_indices:
-            thread = threading.Thread(target=play_audio, args=(idx, wav_path, p))
-            thread.daemon = False
-            threads.append(thread)
-        
-        # Start all threads
-        print(f"Starting playback on {len(threads)} devices...")
-        for thread in threads:
-            thread.start()
-        
-        # Wait for all threads to complete
-        print("Waiting for playback to complete...")
-        for thread in threads:
-            thread.join()
+        # Register every cursor before decoding starts so no device misses the beginning
+        readers = [(idx, groups.ring_for(idx).add_reader(f"device {idx}", delays.get(idx, b'')))
+                   for idx in device_indices]
+        
+        if control is not None and engine != "processes":
+            control.bind(groups.rings.values())
+        
+        # Decode a short pre-roll before any device starts
+        decoder.start()
+        groups.wait_for_fill(preroll_chunks)
+        
+        tuners = buffer_tuners or {}
+        buffer_sizes = {idx: tuners[idx].frames if idx in tuners else buffer_size
+                        for idx in device_indices}
+        if engine == "callback":
+            if discover is not None:
+                print("Note: devices only join a running session with the threads engine")
+            formats = {idx: groups.format_for(idx) for idx in device_indices}
+            run_callback_engine(p, readers, audio_format, chunk_size, sync, gains, metrics,
+                                buffer_sizes, tuners, formats, control,
+                                StartGate(device_indices, start_tolerance_ms))
+        elif engine == "processes":
+            from bluetooth_audio_player.process_engine import run_process_engine
+            if discover is not None or recovery is not None:
+                print("Note: failed devices are not reopened and devices do not join "
+                      "with the processes engine")
+            formats = {idx: groups.format_for(idx) for idx in device_indices}
+            run_process_engine(p, list(groups.rings.values()), readers, formats, sync, gains,
+                               metrics, buffer_sizes, tuners, processes,
+                               control.started if control is not None else None)
+        else:
+            _run_thread_engine(p, groups, readers, sync, gains, metrics, buffer_sizes,
+                               tuners, delays, recovery, discover, control,
+                               StartGate(device_indices, start_tolerance_ms))
         
         print("Playback completed on all devices")
+        if sync is not None:
+            sync.report()
     
     finally:
+        # Stop the decoder if every device stopped early
+        groups.close()
+        if decoder.is_alive():
+            decoder.join()
+        groups.release()
+        
         # Clean up PyAudio
-        try:
-            p.terminate()
-            print("PyAudio terminated")
-        except:
-            pass
\ No newline at end of file
+        if own_pyaudio:
+            try:
+                p.terminate()
+                print("PyAudio terminated")
+            except:
+                pass
+        
+        if own_reader:
+            try:
+                wf.close()
+            except:
+                pass
@@ -0,0 +1,198 @@
+"""
+Gapless playlist playback.
+
+A PlaylistReader joins several tracks into one continuous ``wave``-style
+reader, so the playback engine keeps its device streams open from the first
+track to the last. The next track is opened (and converted if needed) in the
+background while the current one plays, and a chunk that crosses a track
+boundary is filled from both tracks, so transitions are sample-accurate with
+no silence in between.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bluetooth_audio_player import utils
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.oga', '.opus', '.aac', '.m4a', '.wma', '.aiff', '.aif'}
+
+
+def expand_tracks(paths):
+    """Expand directories into the audio files they contain, in name order."""
+    tracks = []
+    for path in paths:
+        if os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                full_path = os.path.join(path, entry)
+                if os.path.isfile(full_path) and Path(entry).suffix.lower() in AUDIO_EXTENSIONS:
+                    tracks.append(full_path)
+        else:
+            tracks.append(path)
+    return tracks
+
+
+class PlaylistReader:
+    """Reads a sequence of tracks as one continuous stream of frames."""
+
+    def __init__(self, tracks, open_track):
+        """
+        Args:
+            tracks: List of audio file paths
+            open_track: Callable taking a path and returning a tuple of
+                (reader, temporary file to delete afterwards or None); the
+                reader must produce the same format for every track, and
+                None is returned for tracks that cannot be played
+        """
+        self._tracks = list(tracks)
+        self._open_track = open_track
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._next_index = 0
+        self._next = None
+        self._current = None
+        self._current_temp = None
+        self._lock = threading.Lock()
+        self._ended = False
+        self.track_index = -1
+
+        if not self._advance():
+            self.close()
+            raise ValueError("No playable tracks in playlist")
+        self._format = self._format_of(self._current)
+
+    @staticmethod
+    def _format_of(reader):
+        return (reader.getsampwidth(), reader.getnchannels(), reader.getframerate())
+
+    def append(self, tracks):
+        """
+        Add tracks to the end of the playlist while it plays.
+        Returns False if playback already went past the last track.
+        """
+        with self._lock:
+            if self._ended:
+                return False
+            self._tracks.extend(tracks)
+            if self._next is None:
+                self._prefetch()
+            return True
+
+    def queued(self):
+        """Tracks after the one playing, including one that is being prepared."""
+        with self._lock:
+            return list(self._tracks[self.track_index + 1:])
+
+    @property
+    def current_track(self):
+        return self._tracks[self.track_index] if self.track_index >= 0 else None
+
+    def _prefetch(self):
+        if self._next_index < len(self._tracks):
+            path = self._tracks[self._next_index]
+            self._next = (self._next_index, self._executor.submit(self._open_track, path))
+            self._next_index += 1
+        else:
+            self._next = None
+
+    def _advance(self):
+        """Switch to the next playable track. Returns False at the end of the playlist."""
+        self._close_current()
+        with self._lock:
+            if self._next is None:
+                self._prefetch()
+
+        while True:
+            with self._lock:
+                if self._next is None:
+                    # Tracks appended from now on would never be played
+                    self._ended = True
+                    return False
+                index, future = self._next
+                # Start on the following track right away so it is ready in time
+                self._prefetch()
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error preparing track {self._tracks[index]}: {e}")
+                result = None
+
+            if result is None or result[0] is None:
+                print(f"Skipping track: {self._tracks[index]}")
+                continue
+
+            reader, temp_path = result
+            if self.track_index >= 0 and self._format_of(reader) != self._format:
+                print(f"Skipping track with a different format: {self._tracks[index]}")
+                reader.close()
+                if temp_path:
+                    utils.clean_temp_files(temp_path)
+                continue
+
+            self._current = reader
+            self._current_temp = temp_path
+            self.track_index = index
+            print(f"Now playing track {index + 1}/{len(self._tracks)}: {self._tracks[index]}")
+            return True
+
+    def _close_current(self):
+        if self._current is not None:
+            try:
+                self._current.close()
+            except Exception:
+                pass
+            self._current = None
+        if self._current_temp:
+            utils.clean_temp_files(self._current_temp)
+            self._current_temp = None
+
+    def getsampwidth(self):
+        return self._format[0]
+
+    def getnchannels(self):
+        return self._format[1]
+
+    def getframerate(self):
+        return self._format[2]
+
+    def readframes(self, n):
+        """Read up to n frames, continuing into the next track at a boundary."""
+        if self._current is None:
+            return b''
+        data = self._current.readframes(n)
+        frame_size = self._format[0] * self._format[1]
+        missing = n - len(data) // frame_size
+
+        if missing <= 0:
+            return data
+
+        # Track ended inside this chunk: top it up from the next track without a gap
+        parts = [bytes(data)] if data else []
+        while missing > 0 and self._advance():
+            data = self._current.readframes(missing)
+            if data:
+                parts.append(bytes(data))
+            missing -= len(data) // frame_size
+        return b''.join(parts)
+
+    def close(self):
+        self._close_current()
+        with self._lock:
+            self._ended = True
+            pending, self._next = self._next, None
+        if pending is not None:
+            # Release a track that was prefetched but never played
+            _, future = pending
+            if future.cancel():
+                future = None
+        else:
+            future = None
+        if future is not None:
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            if result and result[0] is not None:
+                result[0].close()
+                if result[1]:
+                    utils.clean_temp_files(result[1])
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,247 @@
+"""
+Multi-process playback engine.
+
+With dozens of devices the thread engine's sinks all compete for one
+interpreter lock and one core's worth of scheduling. This engine shards the
+devices over a pool of worker processes, each running the usual blocking
+write loop for its share in threads of its own. The decoder still runs
+once, in the parent, publishing into SharedChunkRing blocks every worker
+reads from.
+
+Workers open their own audio backend, since PortAudio sessions cannot be
+shared between processes. Every device waits on a barrier once its stream
+is open; when all have arrived the parent publishes a start time on the
+monotonic clock, which all processes share, and every device starts
+writing at that moment. Drift is corrected inside each worker against the
+same clock. Per-device metrics, clocks and buffer tuners are sent back to
+the parent when the devices finish.
+"""
+import os
+import time
+import queue
+import types
+import threading
+import multiprocessing
+
+from bluetooth_audio_player import backends
+from bluetooth_audio_player import dsp
+from bluetooth_audio_player.metrics import DeviceMetrics
+from bluetooth_audio_player.shared_ring import POLL_INTERVAL, SharedChunkRing
+from bluetooth_audio_player.sync import DriftMonitor
+
+# Seconds between every device being ready and the first write, so all see the start time in time
+START_MARGIN_S = 0.05
+
+# Seconds to wait for the workers to start and open their devices
+START_TIMEOUT_S = 15.0
+
+
+def _wait_for_start(ring, barrier):
+    """Wait until every device is ready, then until the start time the parent publishes."""
+    try:
+        barrier.wait(START_TIMEOUT_S)
+    except threading.BrokenBarrierError:
+        pass
+    start_at = ring.start_time()
+    # A short file may be decoded and closed before the start time is published
+    while start_at is None and not ring.aborted:
+        time.sleep(POLL_INTERVAL)
+        start_at = ring.start_time()
+    if start_at is not None and start_at > time.monotonic():
+        time.sleep(start_at - time.monotonic())
+
+
+def _play_device(entry, ring, p, sync, barrier, results):
+    # Imported here since playback imports this module
+    from bluetooth_audio_player import playback
+
+    idx = entry["index"]
+    reader = ring.open_reader(entry["handle"])
+    metrics = DeviceMetrics(idx) if entry["metrics"] else None
+    arrived = []
+    offsets = []
+
+    def ready():
+        arrived.append(True)
+        _wait_for_start(ring, barrier)
+        if ring.start_time() is not None:
+            offsets.append(time.monotonic() - ring.start_time())
+
+    try:
+        finished = playback._play_from_ring(idx, reader, entry["format"], p, sync, entry["gain"],
+                                            metrics, entry["buffer_size"], entry["tuner"],
+                                            ready=ready)
+    finally:
+        if not arrived:
+            # A device that failed to open still counts, so the others are not held up
+            _wait_for_start(ring, barrier)
+        reader.detach()
+    results.put(("device", idx, {
+        "finished": finished,
+        "metrics": metrics,
+        "clock": sync.clocks.get(idx) if sync is not None else None,
+        "tuner": entry["tuner"],
+        "stalls": reader.stalls,
+        "dropped_chunks": reader.dropped_chunks,
+        "start_offset": offsets[0] if offsets else None,
+    }))
+
+
+def _worker(entries, backend_spec, sync_options, barrier, results):
+    """Play a shard of the devices; runs in a worker process."""
+    name, options = backend_spec
+    p = backends.open_backend(name, **options)
+    if any(entry["gain"] is not None for entry in entries):
+        dsp.available()
+    sync = DriftMonitor(**sync_options) if sync_options is not None else None
+    rings = {}
+    threads = []
+    try:
+        for entry in entries:
+            ring_name = entry["handle"].ring_name
+            if ring_name not in rings:
+                rings[ring_name] = SharedChunkRing(name=ring_name)
+            thread = threading.Thread(target=_play_device,
+                                      args=(entry, rings[ring_name], p, sync, barrier, results))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        # Simulated streams are inspected by benchmarks, which only see the parent's backend
+        streams = [types.SimpleNamespace(
+            device_index=stream.device_index, rate=stream.rate, frames_written=stream.frames_written,
+            underruns=stream.underruns, first_write=stream.first_write, failed=stream.failed)
+            for stream in getattr(p, "streams", [])]
+        results.put(("streams", None, streams))
+    finally:
+        for ring in rings.values():
+            ring.release()
+        p.terminate()
+
+
+def run_process_engine(p, rings, readers, formats, sync=None, gains=None, metrics=None,
+                       buffer_sizes=None, tuners=None, processes=None, on_started=None):
+    """
+    Play shared rings on all devices, sharded over worker processes.
+
+    Args:
+        p: Audio backend of the parent, recreated in every worker
+        rings: SharedChunkRings the readers belong to
+        readers: List of (device index, SharedReaderHandle) tuples
+        formats: Dict of device index to (sample width, channels, frame rate)
+        sync: DriftMonitor that keeps the devices' clocks in line (optional)
+        gains: Dict of device index to linear gain (optional)
+        metrics: MetricsRegistry collecting per-device metrics (optional)
+        buffer_sizes: Dict of device index to frames per stream buffer (optional)
+        tuners: Dict of device index to BufferTuner (optional)
+        processes: Number of worker processes (defaults to one per core)
+        on_started: Called once the devices have been given their start time (optional)
+
+    Raises RuntimeError if a worker process died before reporting all of its devices.
+    """
+    gains = gains or {}
+    buffer_sizes = buffer_sizes or {}
+    tuners = tuners if tuners is not None else {}
+    count = max(min(processes or os.cpu_count() or 1, len(readers)), 1)
+    sync_options = None
+    if sync is not None:
+        sync_options = {"max_drift_ms": sync.max_drift_ms, "warmup_s": sync.warmup_s,
+                        "correct": sync.correct}
+
+    entries = [{
+        "index": idx,
+        "handle": handle,
+        "format": formats[idx],
+        "gain": gains.get(idx),
+        "buffer_size": buffer_sizes.get(idx),
+        "tuner": tuners.get(idx),
+        "metrics": metrics is not None,
+    } for idx, handle in readers]
+
+    # Spawned rather than forked: a forked PortAudio session is not safe to use
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(len(entries) + 1)
+    results = context.Queue()
+    shards = [entries[shard::count] for shard in range(count)]
+    workers = [context.Process(target=_worker, daemon=True,
+                               args=(shard, backends.backend_spec(p), sync_options, barrier,
+                                     results))
+               for shard in shards]
+    reported = set()
+
+    print(f"Starting playback on {len(entries)} devices in {count} worker process(es)...")
+    for worker in workers:
+        worker.start()
+    try:
+        # Devices of workers that died never reach the barrier, so only wait for the living
+        deadline = time.monotonic() + START_TIMEOUT_S
+        while time.monotonic() < deadline:
+            expected = sum(len(shard) for shard, worker in zip(shards, workers) if worker.is_alive())
+            if barrier.n_waiting >= expected:
+                break
+            time.sleep(POLL_INTERVAL)
+        try:
+            if barrier.n_waiting < len(entries):
+                barrier.abort()
+            barrier.wait(POLL_INTERVAL)
+        except threading.BrokenBarrierError:
+            print("Warning: Not every device was ready, starting the rest")
+        start_at = time.monotonic() + START_MARGIN_S
+        for ring in rings:
+            ring.set_start(start_at)
+        if on_started is not None:
+            on_started()
+
+        print("Waiting for playback to complete...")
+        pending = len(entries) + count
+        offsets = []
+        while pending:
+            try:
+                kind, idx, result = results.get(timeout=0.5)
+            except queue.Empty:
+                if sync is not None:
+                    sync.maybe_report()
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+            pending -= 1
+            if kind == "device":
+                reported.add(idx)
+            if kind == "streams":
+                if isinstance(p, backends.SimulatedBackend):
+                    p.streams.extend(result)
+                continue
+            if result["metrics"] is not None:
+                metrics.devices[idx] = result["metrics"]
+            if result["clock"] is not None:
+                sync.clocks[idx] = result["clock"]
+            if result["tuner"] is not None:
+                tuners[idx] = result["tuner"]
+            if result["start_offset"] is not None:
+                offsets.append(result["start_offset"])
+            if result["stalls"]:
+                print(f"Device {idx} fell behind {result['stalls']} time(s), "
+                      f"{result['dropped_chunks']} chunks skipped")
+            print(f"Playback completed on device {idx}")
+        if offsets:
+            print(f"Start skew across {len(offsets)} devices: "
+                  f"{(max(offsets) - min(offsets)) * 1000:.2f} ms")
+    finally:
+        # Stops the workers if playback was interrupted here
+        for ring in rings:
+            if not ring.closed:
+                ring.abort()
+        for worker in workers:
+            worker.join()
+
+    failed = []
+    for shard, worker in zip(shards, workers):
+        missing = [entry["index"] for entry in shard if entry["index"] not in reported]
+        if worker.exitcode or missing:
+            print(f"Worker process {worker.pid} exited with code {worker.exitcode}")
+            failed.extend(missing)
+    if failed:
+        raise RuntimeError("No playback result from device(s) "
+                           + ", ".join(str(idx) for idx in sorted(failed))
+                           + ", their worker process failed")
@@ -0,0 +1,231 @@
+"""
+Shared ring buffer used to fan decoded audio out to several playback sinks.
+
+A single writer publishes audio chunks into a fixed number of slots and every
+sink consumes them through its own read cursor. Chunks are stored by
+reference, so all sinks share the same immutable ``bytes`` object and no
+audio data is copied per device.
+"""
+import threading
+import time
+
+
+class RingReader:
+    """
+    Read cursor of a single sink on a ChunkRing.
+
+    ``delay`` is a block of silence the sink plays once before its first
+    chunk. The chunks it holds back stay in the ring, which therefore acts as
+    the delay line for that device without any per-chunk work.
+    """
+
+    def __init__(self, ring, name, seq, delay=b''):
+        self.ring = ring
+        self.name = name
+        self.seq = seq
+        self.delay = delay
+        self.lagging = False
+        self.suspended = False
+        self.stalls = 0
+        self.dropped_chunks = 0
+
+    def get(self):
+        """
+        Return the next chunk for this reader.
+
+        Blocks until a chunk is available and returns None once the ring is
+        closed and drained.
+        """
+        return self.ring._get(self, block=True)
+
+    def get_nowait(self):
+        """Return the next chunk if one is ready, otherwise None without waiting."""
+        return self.ring._get(self, block=False)
+
+    def pending(self):
+        """Number of chunks published but not yet read; read without locking, so approximate."""
+        return self.ring.write_seq - self.seq
+
+    def exhausted(self):
+        """Check whether the ring is closed and this reader has consumed everything."""
+        return self.ring._exhausted(self)
+
+    def suspend(self):
+        """
+        Stop holding the writer back while the sink is unavailable. The next
+        read resumes at the position the other readers have reached.
+        """
+        self.ring._suspend(self)
+
+    def detach(self):
+        """Stop holding the writer back; call when the sink is finished."""
+        self.ring.remove_reader(self)
+
+
+class ChunkRing:
+    """
+    Fixed-size ring of audio chunks with one writer and many readers.
+
+    The writer blocks while the slowest reader is a full ring behind. If a
+    reader holds the writer back for longer than ``stall_timeout`` seconds it
+    is marked as lagging and reported, the writer carries on without it, and
+    the reader is resynchronised with the other sinks on its next read. A
+    suspended reader is treated the same way without waiting for a stall,
+    except that while every reader is suspended the writer waits for them.
+    While the ring is held, e.g. while playback is paused, the writer waits
+    for room without ever marking a reader as lagging.
+    """
+
+    def __init__(self, slots=64, stall_timeout=1.0):
+        if slots < 2:
+            raise ValueError("A ring needs at least two slots")
+        self.slots = slots
+        self.stall_timeout = stall_timeout
+        self.write_seq = 0
+        self.closed = False
+        self.aborted = False
+        self.held = False
+
+        self._buffer = [None] * slots
+        self._readers = []
+        self._lock = threading.Lock()
+        self._data_ready = threading.Condition(self._lock)
+        self._space_free = threading.Condition(self._lock)
+
+    def add_reader(self, name, delay=b''):
+        """Register a new read cursor positioned at the oldest unread chunk."""
+        with self._lock:
+            reader = RingReader(self, name, self._floor(), delay)
+            self._readers.append(reader)
+            return reader
+
+    def remove_reader(self, reader):
+        """Unregister a read cursor."""
+        with self._lock:
+            if reader in self._readers:
+                self._readers.remove(reader)
+                self._space_free.notify_all()
+
+    def put(self, chunk):
+        """
+        Publish a chunk, waiting for room if a reader is a full ring behind.
+
+        Returns False if the ring has been closed and the chunk was discarded.
+        """
+        with self._lock:
+            deadline = None
+            while not self.closed and self.write_seq - self._floor() >= self.slots:
+                if self.held:
+                    # Readers that are not reading on purpose are not falling behind
+                    deadline = None
+                    self._space_free.wait()
+                    continue
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.stall_timeout
+                elif now >= deadline:
+                    self._mark_lagging()
+                    deadline = None
+                    continue
+                self._space_free.wait(deadline - now)
+
+            if self.closed:
+                return False
+            self._buffer[self.write_seq % self.slots] = chunk
+            self.write_seq += 1
+            self._data_ready.notify_all()
+            return True
+
+    def wait_for_fill(self, count, timeout=None):
+        """
+        Block until ``count`` chunks have been published or the ring is closed.
+
+        Returns True if the fill level was reached or the stream ended, False
+        on timeout.
+        """
+        with self._lock:
+            return self._data_ready.wait_for(
+                lambda: self.closed or self.write_seq >= count, timeout)
+
+    def close(self):
+        """Signal end of stream; readers drain what is left and then stop."""
+        with self._lock:
+            self.closed = True
+            self._data_ready.notify_all()
+            self._space_free.notify_all()
+
+    def abort(self):
+        """Stop the stream at once; readers get nothing more, even chunks already published."""
+        with self._lock:
+            self.closed = True
+            self.aborted = True
+            self._data_ready.notify_all()
+            self._space_free.notify_all()
+
+    def hold(self, held=True):
+        """Hold or release the ring; while held, full rings never skip stalled readers."""
+        with self._lock:
+            self.held = held
+            self._space_free.notify_all()
+
+    def discard(self):
+        """
+        Drop every chunk not read yet, e.g. after a seek; readers continue
+        with the next chunk published.
+        """
+        with self._lock:
+            for reader in self._readers:
+                reader.seq = self.write_seq
+            self._space_free.notify_all()
+
+    def _suspend(self, reader):
+        with self._lock:
+            reader.suspended = True
+            self._space_free.notify_all()
+
+    def _floor(self):
+        """Sequence number of the slowest reader still holding the writer back."""
+        active = [r.seq for r in self._readers if not r.lagging and not r.suspended]
+        if active:
+            return min(active)
+        suspended = [r.seq for r in self._readers if r.suspended]
+        if suspended:
+            # No device is playing, so keep the position until one comes back
+            return min(suspended)
+        return max(self.write_seq - self.slots + 1, 0)
+
+    def _mark_lagging(self):
+        for reader in self._readers:
+            if reader.suspended:
+                continue
+            if not reader.lagging and self.write_seq - reader.seq >= self.slots:
+                reader.lagging = True
+                reader.stalls += 1
+                print(f"Warning: {reader.name} is falling behind, "
+                      f"skipping ahead to keep the other devices playing")
+
+    def _exhausted(self, reader):
+        with self._lock:
+            return self.aborted or self.closed and reader.seq >= self.write_seq
+
+    def _get(self, reader, block):
+        with self._lock:
+            if self.aborted:
+                return None
+            if reader.lagging or reader.suspended:
+                # Rejoin the healthy readers; whatever lies between is dropped
+                resync_seq = max(self._floor(), reader.seq)
+                reader.dropped_chunks += resync_seq - reader.seq
+                reader.seq = resync_seq
+                reader.lagging = False
+                reader.suspended = False
+
+            while reader.seq >= self.write_seq:
+                if self.closed or not block:
+                    return None
+                self._data_ready.wait()
+
+            chunk = self._buffer[reader.seq % self.slots]
+            reader.seq += 1
+            self._space_free.notify_all()
+            return chunk
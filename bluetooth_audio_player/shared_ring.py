@@ -0,0 +1,299 @@
+"""
+Chunk ring in shared memory, for device sinks running in other processes.
+
+SharedChunkRing offers the writer side of ChunkRing (put, close, abort,
+wait_for_fill, add_reader) so the decoder fills it the same way, but the
+chunks and every cursor live in one ``multiprocessing.shared_memory``
+block that worker processes attach to by name. Each chunk is published
+once; readers copy it out of the slot they are at.
+
+There are no locks across processes. The header is an array of 64-bit
+integers. The writer alone writes the write sequence and the flags, and
+each reader alone writes its own sequence. A reader's state is the one
+field both sides write, under a fixed protocol: the writer only ever
+turns ACTIVE into LAGGING, and the reader turns LAGGING back into ACTIVE
+or sets DETACHED when it is done. A reader may also mark itself LAGGING to
+stop holding the writer back while its sink is unavailable. If a reader detaches while the writer
+marks it, it may be left LAGGING instead of DETACHED, which holds the
+writer back just as little. Both sides poll with short sleeps while they
+wait. The writer only reuses the slot a reader is at after marking that
+reader as lagging, so a reader checks its state after every copy; one
+that fell so far behind discards the chunk and skips ahead like a lagging
+ChunkRing reader.
+"""
+import time
+from multiprocessing import shared_memory
+
+# Header fields, in 64-bit integers
+SLOTS, SLOT_BYTES, MAX_READERS, WRITE_SEQ, CLOSED, ABORTED, START_AT = range(7)
+HEADER_FIELDS = 7
+
+# Reader states
+FREE, ACTIVE, LAGGING, DETACHED = range(4)
+
+# Seconds to sleep between polls while waiting for data or room
+POLL_INTERVAL = 0.002
+
+
+class SharedChunkRing:
+    """
+    Fixed-size ring of audio chunks in shared memory, with one writer and
+    up to max_readers readers in any process.
+    """
+
+    def __init__(self, slots=64, slot_bytes=4096, max_readers=8, stall_timeout=1.0, name=None):
+        """
+        Args:
+            slots: Number of chunks the ring holds
+            slot_bytes: Largest chunk a slot holds; longer chunks take several
+            max_readers: Number of read cursors that can be added
+            stall_timeout: Seconds a reader may hold the writer back before it is skipped
+            name: Name of an existing ring to attach to; the other sizes are
+                then read from it
+        """
+        self.stall_timeout = stall_timeout
+        if name is None:
+            if slots < 2:
+                raise ValueError("A ring needs at least two slots")
+            size = (HEADER_FIELDS + slots + 2 * max_readers) * 8 + slots * slot_bytes
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+            header = self._shm.buf.cast('q')
+            header[SLOTS], header[SLOT_BYTES], header[MAX_READERS] = slots, slot_bytes, max_readers
+            header.release()
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            header = self._shm.buf[:HEADER_FIELDS * 8].cast('q')
+            slots, slot_bytes, max_readers = header[SLOTS], header[SLOT_BYTES], header[MAX_READERS]
+            header.release()
+
+        self.name = self._shm.name
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.max_readers = max_readers
+        fields = HEADER_FIELDS + slots + 2 * max_readers
+        self._ints = self._shm.buf[:fields * 8].cast('q')
+        self._data = self._shm.buf[fields * 8:fields * 8 + slots * slot_bytes]
+        self._lengths = HEADER_FIELDS
+        self._seqs = HEADER_FIELDS + slots
+        self._states = HEADER_FIELDS + slots + max_readers
+        self._reader_names = []
+
+    @property
+    def write_seq(self):
+        return self._ints[WRITE_SEQ]
+
+    @property
+    def closed(self):
+        return bool(self._ints[CLOSED])
+
+    @property
+    def aborted(self):
+        return bool(self._ints[ABORTED])
+
+    def add_reader(self, name, delay=b''):
+        """
+        Register a read cursor at the oldest unread chunk. Returns a
+        SharedReaderHandle, which can be sent to another process and opened there.
+        """
+        if len(self._reader_names) >= self.max_readers:
+            raise ValueError("No free reader slots left in the shared ring")
+        slot = len(self._reader_names)
+        self._reader_names.append(name)
+        self._ints[self._seqs + slot] = self._floor()
+        self._ints[self._states + slot] = ACTIVE
+        return SharedReaderHandle(self.name, slot, name, delay)
+
+    def put(self, chunk):
+        """
+        Publish a chunk, waiting for room if a reader is a full ring behind.
+        Chunks longer than a slot are split over several.
+
+        Returns False if the ring has been closed and the chunk was discarded.
+        """
+        for start in range(0, len(chunk), self.slot_bytes):
+            if not self._put_slot(chunk[start:start + self.slot_bytes]):
+                return False
+        return True
+
+    def _put_slot(self, data):
+        deadline = None
+        while not self.closed and self.write_seq - self._floor() >= self.slots:
+            now = time.monotonic()
+            if not self._ints[START_AT]:
+                # Readers still starting up in other processes are not falling behind
+                pass
+            elif deadline is None:
+                deadline = now + self.stall_timeout
+            elif now >= deadline:
+                self._mark_lagging()
+                deadline = None
+                continue
+            time.sleep(POLL_INTERVAL)
+
+        if self.closed:
+            return False
+        seq = self.write_seq
+        slot = seq % self.slots
+        offset = slot * self.slot_bytes
+        self._data[offset:offset + len(data)] = data
+        self._ints[self._lengths + slot] = len(data)
+        # Publishing the sequence last makes the chunk visible only once it is complete
+        self._ints[WRITE_SEQ] = seq + 1
+        return True
+
+    def wait_for_fill(self, count, timeout=None):
+        """
+        Block until ``count`` chunks have been published or the ring is closed.
+        Returns True if the fill level was reached or the stream ended, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed and self.write_seq < count:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def close(self):
+        """Signal end of stream; readers drain what is left and then stop."""
+        self._ints[CLOSED] = 1
+
+    def abort(self):
+        """Stop the stream at once; readers get nothing more, even chunks already published."""
+        self._ints[ABORTED] = 1
+        self._ints[CLOSED] = 1
+
+    def set_start(self, start_at):
+        """Publish the shared start time, a time.monotonic() value, for readers in other processes."""
+        self._ints[START_AT] = int(start_at * 1e9)
+
+    def start_time(self):
+        """The start time published by the writer, or None if there is none yet."""
+        start_at = self._ints[START_AT]
+        return start_at / 1e9 if start_at else None
+
+    def open_reader(self, handle):
+        """Open a reader registered in another process through its handle."""
+        return SharedRingReader(self, handle.slot, handle.name, handle.delay)
+
+    def _floor(self):
+        """Sequence number of the slowest reader still holding the writer back."""
+        active = [self._ints[self._seqs + slot] for slot in range(len(self._reader_names))
+                  if self._ints[self._states + slot] == ACTIVE]
+        if active:
+            return min(active)
+        return max(self.write_seq - self.slots + 1, 0)
+
+    def _mark_lagging(self):
+        write_seq = self.write_seq
+        for slot, name in enumerate(self._reader_names):
+            if (self._ints[self._states + slot] == ACTIVE
+                    and write_seq - self._ints[self._seqs + slot] >= self.slots):
+                self._ints[self._states + slot] = LAGGING
+                print(f"Warning: {name} is falling behind, skipping ahead to keep the other devices playing")
+
+    def release(self):
+        """Detach from the shared memory, freeing it if this process created the ring."""
+        self._ints.release()
+        self._data.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class SharedReaderHandle:
+    """Picklable reference to a reader slot of a SharedChunkRing."""
+
+    def __init__(self, ring_name, slot, name, delay=b''):
+        self.ring_name = ring_name
+        self.slot = slot
+        self.name = name
+        self.delay = delay
+
+
+class SharedRingReader:
+    """
+    Read cursor of one device on a SharedChunkRing, with the interface of a
+    RingReader so the usual device loops can play from it.
+    """
+
+    def __init__(self, ring, slot, name, delay=b''):
+        self.ring = ring
+        self.slot = slot
+        self.name = name
+        self.delay = delay
+        self.stalls = 0
+        self.dropped_chunks = 0
+        self._suspended = False
+        self._seq_index = ring._seqs + slot
+        self._state_index = ring._states + slot
+
+    @property
+    def seq(self):
+        return self.ring._ints[self._seq_index]
+
+    def get(self):
+        """Return the next chunk, waiting for the writer; None once the ring is drained."""
+        while True:
+            chunk = self.get_nowait()
+            if chunk is not None or self.exhausted():
+                return chunk
+            time.sleep(POLL_INTERVAL)
+
+    def get_nowait(self):
+        """Return the next chunk if one is ready, else None."""
+        ring = self.ring
+        ints = ring._ints
+        if ring.aborted:
+            return None
+        if ints[self._state_index] == LAGGING:
+            self._resync()
+        seq = ints[self._seq_index]
+        if seq >= ring.write_seq:
+            return None
+
+        slot = seq % ring.slots
+        offset = slot * ring.slot_bytes
+        chunk = bytes(ring._data[offset:offset + ints[ring._lengths + slot]])
+        if ints[self._state_index] == LAGGING:
+            # The writer only reuses a reader's slot after marking it, so the copy may be torn
+            return self.get_nowait()
+        ints[self._seq_index] = seq + 1
+        return chunk
+
+    def _resync(self):
+        """Rejoin the healthy readers; whatever lies between is dropped."""
+        ring = self.ring
+        if not self._suspended:
+            self.stalls += 1
+        self._suspended = False
+        resync_seq = max(ring.write_seq - ring.slots + 1, self.seq)
+        others = [ring._ints[ring._seqs + slot] for slot in range(ring.max_readers)
+                  if slot != self.slot and ring._ints[ring._states + slot] == ACTIVE]
+        if others:
+            resync_seq = max(min(others), resync_seq)
+        self.dropped_chunks += resync_seq - self.seq
+        ring._ints[self._seq_index] = resync_seq
+        ring._ints[self._state_index] = ACTIVE
+
+    def pending(self):
+        """Number of chunks published but not yet read by this reader."""
+        return max(self.ring.write_seq - self.seq, 0)
+
+    def exhausted(self):
+        """Check whether the writer has finished and everything has been read."""
+        ring = self.ring
+        return ring.aborted or ring.closed and self.seq >= ring.write_seq
+
+    def suspend(self):
+        """
+        Stop holding the writer back while the sink is unavailable. The next
+        read resumes at the position the other readers have reached.
+        """
+        self._suspended = True
+        self.ring._ints[self._state_index] = LAGGING
+
+    def detach(self):
+        """Stop holding the writer back; call when the sink is finished."""
+        self.ring._ints[self._state_index] = DETACHED
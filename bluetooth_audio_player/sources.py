@@ -0,0 +1,239 @@
+"""
+Audio sources that can stand in for a ``wave`` reader during playback.
+"""
+import mmap
+import wave
+import struct
+import subprocess
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class MmapWavReader:
+    """
+    Zero-copy WAV reader with the interface of a ``wave`` reader.
+
+    The RIFF header is parsed once and the file is memory-mapped, so
+    ``readframes`` returns ``memoryview`` slices of the data chunk instead of
+    allocating a new ``bytes`` object per call, and ``setpos`` is O(1).
+    Besides integer PCM it also accepts IEEE float and WAVE_FORMAT_EXTENSIBLE
+    files, which the ``wave`` module rejects.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError) as e:
+            self._file.close()
+            raise wave.Error(f"cannot map {path}: {e}")
+        try:
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+        self._view = memoryview(self._map)[self._data_start:self._data_start + self._data_size]
+        self._first = 0
+        self._pos = 0
+
+    def _parse_header(self):
+        data = self._map
+        if len(data) < 12 or data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise wave.Error("file does not start with RIFF/WAVE header")
+
+        fmt = None
+        offset = 12
+        while offset + 8 <= len(data):
+            chunk_id = data[offset:offset + 4]
+            chunk_size = struct.unpack_from('<I', data, offset + 4)[0]
+            body = offset + 8
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack_from('<HHIIHH', data, body)
+                format_tag = fmt[0]
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                    # The real format is the first field of the sub-format GUID
+                    format_tag = struct.unpack_from('<H', data, body + 24)[0]
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise wave.Error("data chunk before fmt chunk")
+                self._data_start = body
+                # Streamed files may carry a placeholder size; trust the file length
+                self._data_size = min(chunk_size, len(data) - body)
+                break
+            # Chunks are padded to an even number of bytes
+            offset = body + chunk_size + (chunk_size & 1)
+        else:
+            raise wave.Error("fmt chunk and/or data chunk missing")
+
+        if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+            raise wave.Error(f"unknown format: {format_tag}")
+
+        _, self._channels, self._sample_rate, _, block_align, bits = fmt
+        self.is_float = format_tag == WAVE_FORMAT_IEEE_FLOAT
+        self._sample_width = (bits + 7) // 8
+        self._frame_size = block_align or self._sample_width * self._channels
+        self._nframes = self._data_size // self._frame_size
+        self._data_size = self._nframes * self._frame_size
+
+    def getnchannels(self):
+        return self._channels
+
+    def getsampwidth(self):
+        return self._sample_width
+
+    def getframerate(self):
+        return self._sample_rate
+
+    def getnframes(self):
+        return self._nframes
+    
+    def set_range(self, start=0, end=None):
+        """
+        Narrow the reader to frames [start, end) of the file in O(1). The
+        range then behaves as the whole file: positions count from its start
+        and reading stops at its end.
+        """
+        end = self._first + self._nframes if end is None else min(end, self._first + self._nframes)
+        if start < 0 or start >= end:
+            raise wave.Error("range not within the audio")
+        self._first = start
+        self._nframes = end - start
+        self._pos = 0
+
+    def tell(self):
+        return self._pos
+
+    def setpos(self, pos):
+        """Seek to a frame position in O(1)."""
+        if pos < 0 or pos > self._nframes:
+            raise wave.Error("position not in range")
+        self._pos = pos
+
+    def rewind(self):
+        self._pos = 0
+
+    def readframes(self, n):
+        """Return up to n frames as a memoryview into the mapped file."""
+        start = self._pos
+        end = min(self._pos + n, self._nframes)
+        self._pos = end
+        return self._view[(self._first + start) * self._frame_size:(self._first + end) * self._frame_size]
+
+    def close(self):
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Slices still handed out keep the mapping alive until released
+                pass
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_wav(path, start=None, end=None):
+    """
+    Open a WAV file for zero-copy reading.
+    
+    Args:
+        path: WAV file to open
+        start: Seconds into the file to start at (optional)
+        end: Seconds into the file to stop at (optional)
+    """
+    wf = MmapWavReader(path)
+    if start is not None or end is not None:
+        rate = wf.getframerate()
+        try:
+            wf.set_range(int(round((start or 0) * rate)),
+                         None if end is None else int(round(end * rate)))
+        except Exception:
+            wf.close()
+            raise
+    return wf
+
+
+class PcmPipeReader:
+    """
+    Read raw interleaved PCM from a pipe with the same interface as a
+    ``wave`` reader, so the playback engine can consume it unchanged.
+    """
+
+    def __init__(self, pipe, sample_width, channels, sample_rate, process=None):
+        """
+        Args:
+            pipe: Binary file object delivering raw PCM
+            sample_width: Bytes per sample
+            channels: Number of interleaved channels
+            sample_rate: Frames per second
+            process: Subprocess producing the data (optional), stopped on close
+        """
+        self._pipe = pipe
+        self._process = process
+        self._sample_width = sample_width
+        self._channels = channels
+        self._sample_rate = sample_rate
+        self._frame_size = sample_width * channels
+        self._frames_read = 0
+
+    def getsampwidth(self):
+        return self._sample_width
+
+    def getnchannels(self):
+        return self._channels
+
+    def getframerate(self):
+        return self._sample_rate
+
+    def tell(self):
+        return self._frames_read
+
+    def readframes(self, n):
+        """Read up to n whole frames; returns b'' at end of stream."""
+        data = self._pipe.read(n * self._frame_size)
+        if not data:
+            return b''
+        partial = len(data) % self._frame_size
+        if partial:
+            data = data[:-partial]
+        self._frames_read += len(data) // self._frame_size
+        return data
+
+    def close(self):
+        """Close the pipe and stop the producing process if there is one."""
+        # Stopping a decoder that is still running is expected when playback ends early
+        stopped_early = self._process is not None and self._process.poll() is None
+
+        try:
+            self._pipe.close()
+        except Exception:
+            pass
+
+        if self._process is None:
+            return
+
+        if stopped_early:
+            self._process.terminate()
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+        if not stopped_early and self._process.returncode != 0:
+            print(f"Decoder exited with code {self._process.returncode}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
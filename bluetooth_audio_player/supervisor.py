@@ -0,0 +1,171 @@
+"""
+Device supervision for the thread engine.
+
+A device whose stream fails is not dropped for the rest of the session. Its
+ring cursor is suspended so it never holds the other devices back, and the
+device is reopened with exponential backoff. Once it is back it resumes at
+the position the other devices have reached rather than where it stopped.
+Devices discovered while playing join a running session the same way.
+"""
+import time
+import threading
+
+
+class PlaybackSession:
+    """Runs and supervises one playback thread per device on a shared ring."""
+
+    def __init__(self, ring, play, delays=None, metrics=None, max_attempts=5,
+                 initial_backoff_s=0.5, max_backoff_s=8.0, ring_for=None):
+        """
+        Args:
+            ring: ChunkRing shared by all devices, or the first of several
+                filled by the same decoder
+            play: Callable taking (device index, reader, on_started) that plays
+                the reader on the device and returns True once the ring is
+                drained or False if the device failed
+            delays: Dict of device index to leading silence, for devices that join later
+            metrics: MetricsRegistry recording rejoins (optional)
+            max_attempts: Reopen attempts before a failed device is given up;
+                0 drops a device on its first failure
+            initial_backoff_s: Wait before the first reopen attempt, doubled for each further one
+            max_backoff_s: Longest wait between attempts
+            ring_for: Callable taking a device index and returning the ring a
+                device that joins later reads from (optional, ring if omitted)
+        """
+        self.ring = ring
+        self.play = play
+        self.delays = delays or {}
+        self.metrics = metrics
+        self.max_attempts = max_attempts
+        self.initial_backoff_s = initial_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.ring_for = ring_for or (lambda device_index: ring)
+        self.devices = set()
+        self._threads = []
+        self._playing = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, ring, play, options, delays=None, metrics=None, ring_for=None):
+        """Create a session using the "recovery" config section."""
+        max_attempts = options["max_attempts"] if options["enabled"] else 0
+        return cls(ring, play, delays, metrics, max_attempts,
+                   options["initial_backoff_s"], options["max_backoff_s"], ring_for)
+
+    def add_device(self, device_index, reader=None):
+        """
+        Start playing on a device. Without a reader one is registered at the
+        current playback position, which is how devices join mid-session.
+        Returns False if the device is already playing or playback has ended.
+        """
+        with self._lock:
+            if device_index in self.devices or self.ring.closed and reader is None:
+                return False
+            self.devices.add(device_index)
+            if reader is None:
+                reader = self.ring_for(device_index).add_reader(
+                    f"device {device_index}", self.delays.get(device_index, b''))
+            thread = threading.Thread(target=self._supervise, args=(device_index, reader))
+            self._threads.append(thread)
+        thread.start()
+        return True
+
+    def watch(self, discover, interval):
+        """
+        Look for new devices every interval seconds until the session stops.
+
+        Args:
+            discover: Callable taking the set of devices already playing and
+                returning the indices of devices to add
+            interval: Seconds between checks
+        """
+        def run():
+            while not self._stop.wait(interval):
+                with self._lock:
+                    known = set(self.devices)
+                try:
+                    found = discover(known)
+                except Exception as e:
+                    print(f"Error discovering devices: {e}")
+                    continue
+                for idx in found:
+                    if self.add_device(idx):
+                        print(f"Device {idx} joined the running session")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def wait(self):
+        """Block until every device, including ones that joined late, has finished."""
+        joined = 0
+        while True:
+            with self._lock:
+                if joined == len(self._threads):
+                    break
+                thread = self._threads[joined]
+            thread.join()
+            joined += 1
+
+    def stop(self):
+        """Stop watching for devices and retrying failed ones."""
+        self._stop.set()
+
+    def _ended(self):
+        """Check whether the audio has ended for everyone, so a failed device need not return."""
+        with self._lock:
+            return self.ring.closed and self._playing == 0
+
+    def _supervise(self, device_index, reader):
+        state = {"playing": False, "lost_at": None, "attempt_at": None, "attempts": 0}
+        device_metrics = self.metrics.device(device_index) if self.metrics is not None else None
+
+        def on_started():
+            with self._lock:
+                self._playing += 1
+            state["playing"] = True
+            if state["lost_at"] is not None:
+                now = time.perf_counter()
+                startup_ms = (now - state["attempt_at"]) * 1000
+                print(f"Device {device_index} rejoined at the current position after "
+                      f"{now - state['lost_at']:.1f} s offline "
+                      f"({state['attempts']} attempt(s), {startup_ms:.0f} ms to first write)")
+                if device_metrics is not None:
+                    device_metrics.record_rejoin(startup_ms / 1000)
+            state["lost_at"] = None
+            state["attempts"] = 0
+
+        try:
+            while True:
+                state["attempt_at"] = time.perf_counter()
+                finished = self.play(device_index, reader, on_started)
+                if state["playing"]:
+                    state["playing"] = False
+                    with self._lock:
+                        self._playing -= 1
+                if finished:
+                    break
+
+                # Let the other devices carry on without this one
+                reader.suspend()
+                if state["lost_at"] is None:
+                    state["lost_at"] = time.perf_counter()
+                if state["attempts"] >= self.max_attempts or self._stop.is_set() or self._ended():
+                    print(f"Giving up on device {device_index}")
+                    break
+                backoff = min(self.initial_backoff_s * 2 ** state["attempts"], self.max_backoff_s)
+                state["attempts"] += 1
+                print(f"Device {device_index} lost, reopening in {backoff:.1f} s "
+                      f"(attempt {state['attempts']} of {self.max_attempts})")
+                if self._stop.wait(backoff):
+                    break
+        finally:
+            reader.detach()
+            if state["lost_at"] is not None:
+                # A device given up on may be rediscovered and join again
+                with self._lock:
+                    self.devices.discard(device_index)
+
+            if reader.stalls:
+                print(f"Device {device_index} fell behind {reader.stalls} time(s), "
+                      f"{reader.dropped_chunks} chunks skipped")
+            print(f"Playback completed on device {device_index}")
@@ -0,0 +1,314 @@
+"""
+Inter-device drift measurement and compensation.
+
+Bluetooth sinks run on their own clocks, so devices fed as fast as they
+accept data slowly drift apart. Each device gets a DeviceClock that tracks
+how much of the audio it has played against a shared master clock
+(``time.monotonic``). Once the drift exceeds a tolerance the sink inserts or
+drops single frames until the device is back in line.
+
+StartGate lines the devices up at the start: all streams are opened first
+and then start together at one moment on the same clock.
+"""
+import time
+import threading
+
+# Weight of each new measurement in the smoothed skew estimate
+SMOOTHING = 0.05
+
+# Seconds between every device being ready and the shared start
+START_MARGIN_S = 0.03
+
+# Seconds to wait for every device to open before starting the ones that did
+START_TIMEOUT_S = 10.0
+
+
+class DeviceClock:
+    """Playback position of one device measured against the master clock."""
+
+    def __init__(self, device_index, sample_rate, max_drift_frames, warmup_s):
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.max_drift_frames = max_drift_frames
+        self.warmup_s = warmup_s
+        self.latency_frames = 0
+        self.content_frames = 0
+        self.inserted_frames = 0
+        self.dropped_frames = 0
+
+        self._start = None
+        self._skew = None
+        self._baseline = None
+
+    def set_latency(self, latency_s):
+        """Record the output latency reported by the stream, in seconds."""
+        self.latency_frames = latency_s * self.sample_rate
+
+    def reset(self):
+        """
+        Start measuring afresh, e.g. after the device ran dry waiting for data.
+        Time spent starved is not clock drift and must not be corrected for.
+        """
+        self.content_frames = 0
+        self._start = None
+        self._skew = None
+        self._baseline = None
+
+    def update(self, content_frames, now=None):
+        """
+        Account for audio handed to the device.
+
+        Call right after a write returns (or at the start of a stream
+        callback) with the number of source frames the chunk covered.
+        """
+        if now is None:
+            now = time.monotonic()
+        self.content_frames += content_frames
+        if self._start is None:
+            self._start = now
+            return
+
+        # Whatever is still buffered in the device has been handed over but not played
+        played = self.content_frames - self.latency_frames
+        expected = (now - self._start) * self.sample_rate
+        skew = played - expected
+
+        if self._skew is None:
+            self._skew = skew
+        else:
+            self._skew += SMOOTHING * (skew - self._skew)
+
+        # Constant offsets settle during warm-up; only changes after it count as drift
+        if self._baseline is None and now - self._start >= self.warmup_s:
+            self._baseline = self._skew
+
+    def drift_frames(self):
+        """Smoothed drift since warm-up in frames; positive means the device runs ahead."""
+        if self._baseline is None:
+            return 0.0
+        return self._skew - self._baseline
+
+    def drift_ms(self):
+        return self.drift_frames() * 1000.0 / self.sample_rate
+
+    def correction(self):
+        """
+        Return the frame correction for the next chunk.
+
+        +1 asks the sink to repeat a frame (device ahead), -1 to drop one
+        (device behind), 0 for no change.
+        """
+        if self.max_drift_frames is None:
+            return 0
+        drift = self.drift_frames()
+        if drift > self.max_drift_frames:
+            return 1
+        if drift < -self.max_drift_frames:
+            return -1
+        return 0
+
+    def apply(self, data, frame_size):
+        """
+        Apply the pending correction to a chunk.
+        Returns the chunk to write and the number of source frames it covers.
+        """
+        content_frames = len(data) // frame_size
+        step = self.correction()
+        if step > 0:
+            self.inserted_frames += 1
+            return data[:frame_size] + data, content_frames
+        if step < 0 and content_frames > 1:
+            self.dropped_frames += 1
+            return data[frame_size:], content_frames
+        return data, content_frames
+
+
+class DriftMonitor:
+    """Creates per-device clocks and reports their skew."""
+
+    def __init__(self, max_drift_ms=2.0, warmup_s=2.0, correct=True, report_interval=None):
+        """
+        Args:
+            max_drift_ms: Drift tolerated before frames are inserted or dropped
+            warmup_s: Seconds after a device starts before drift is measured
+            correct: Whether to correct drift or only measure it
+            report_interval: Seconds between printed skew reports (None disables)
+        """
+        self.max_drift_ms = max_drift_ms
+        self.warmup_s = warmup_s
+        self.correct = correct
+        self.report_interval = report_interval
+        self.clocks = {}
+        self._last_report = time.monotonic()
+
+    @classmethod
+    def from_config(cls, cfg, report_interval=None):
+        """Create a monitor from the "sync" config section, or None if disabled."""
+        options = cfg["sync"]
+        if not options["enabled"]:
+            return None
+        return cls(options["max_drift_ms"], options["warmup_s"],
+                   options["correct"], report_interval)
+
+    def add_device(self, device_index, sample_rate):
+        """Create and register the clock for a device."""
+        max_drift_frames = None
+        if self.correct:
+            max_drift_frames = self.max_drift_ms * sample_rate / 1000.0
+        clock = DeviceClock(device_index, sample_rate, max_drift_frames, self.warmup_s)
+        self.clocks[device_index] = clock
+        return clock
+
+    def skews(self):
+        """Return the current drift of every device in milliseconds."""
+        return {idx: clock.drift_ms() for idx, clock in self.clocks.items()}
+
+    def maybe_report(self):
+        """Print a skew report if the report interval has elapsed."""
+        if self.report_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        print("Device drift:")
+        for idx, clock in self.clocks.items():
+            print(f"  Device {idx}: {clock.drift_ms():+.2f} ms "
+                  f"({clock.inserted_frames} frames inserted, {clock.dropped_frames} dropped)")
+
+
+class StartGate:
+    """
+    Starts every device of a session at one shared moment.
+
+    Devices open their streams at their own pace, so starting each as soon
+    as it is open spreads them out by however long the slowest open takes.
+    Every device arrives at the gate once its stream is open and its first
+    audio is buffered; when the last one arrives a start time a short margin
+    ahead is set on the monotonic clock and they all wait for it. A device
+    that still starts later than the tolerance allows skips the audio it
+    missed, so it plays in line with the others from its first frame.
+    """
+
+    def __init__(self, device_indices, tolerance_ms=5.0, margin_s=START_MARGIN_S,
+                 timeout_s=START_TIMEOUT_S):
+        """
+        Args:
+            device_indices: Devices that start together
+            tolerance_ms: How late a device may start before it skips ahead
+            margin_s: Seconds between the last device arriving and the start,
+                so every waiting device is scheduled in time
+            timeout_s: Seconds to wait for slow devices before starting the rest
+        """
+        self.tolerance_ms = tolerance_ms
+        self.margin_s = margin_s
+        self.timeout_s = timeout_s
+        self.start_at = None
+        self.offsets = {}
+        self.skipped = {}
+        self._expected = set(device_indices)
+        self._waiting = set(device_indices)
+        self._opened = time.monotonic()
+        self._reported = False
+        self._cond = threading.Condition()
+
+    def _release(self):
+        self.start_at = time.monotonic() + self.margin_s
+        self._waiting.clear()
+        self._cond.notify_all()
+
+    def arrive(self, device_index, wait=True):
+        """
+        Mark a device as ready and, with wait, block until the shared start
+        time. Devices that were not expected, such as ones rejoining later,
+        pass straight through.
+        """
+        with self._cond:
+            if device_index in self._waiting:
+                self._waiting.discard(device_index)
+                if not self._waiting:
+                    self._release()
+            if not wait or device_index not in self._expected:
+                return
+            deadline = self._opened + self.timeout_s
+            while self.start_at is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print("Warning: Not every device was ready in time, starting the rest")
+                    self._release()
+                    break
+                self._cond.wait(remaining)
+        self.wait()
+
+    def _all_started(self):
+        """Check, under the lock, whether the report is due now."""
+        if self._reported or not self.offsets or len(self.offsets) < len(self._expected):
+            return False
+        self._reported = True
+        return True
+
+    def leave(self, device_index):
+        """
+        Stop waiting for a device that failed before it started, so it does
+        not hold the others back. If it comes back it joins like a new device.
+        """
+        with self._cond:
+            if device_index in self.offsets:
+                return
+            self._expected.discard(device_index)
+            if device_index in self._waiting:
+                self._waiting.discard(device_index)
+                if not self._waiting:
+                    self._release()
+            done = self._all_started()
+        if done:
+            self.report()
+
+    def wait(self):
+        """Sleep until the start time, once it is set."""
+        if self.start_at is not None:
+            wait = self.start_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+    def started(self, device_index, sample_rate):
+        """
+        Record the moment a device starts playing, right before its first
+        write. Returns the number of frames it should skip because it
+        started late by more than the tolerance (0 for devices not expected).
+        """
+        now = time.monotonic()
+        with self._cond:
+            if device_index not in self._expected or device_index in self.offsets:
+                return 0
+            late = now - self.start_at if self.start_at is not None else 0.0
+            frames = 0
+            if late * 1000 > self.tolerance_ms:
+                frames = int(round(late * sample_rate))
+            self.offsets[device_index] = late
+            self.skipped[device_index] = frames / sample_rate
+            done = self._all_started()
+        if done:
+            self.report()
+        return frames
+
+    def skew_ms(self, aligned=False):
+        """
+        Spread of the devices' start times in milliseconds; with aligned, of
+        their positions in the audio after late devices skipped ahead.
+        """
+        offsets = [offset - (self.skipped[idx] if aligned else 0.0)
+                   for idx, offset in self.offsets.items()]
+        if not offsets:
+            return 0.0
+        return (max(offsets) - min(offsets)) * 1000
+
+    def report(self):
+        late = sum(1 for skipped in self.skipped.values() if skipped)
+        line = f"Start skew across {len(self.offsets)} devices: {self.skew_ms():.2f} ms"
+        if late:
+            line += (f", {self.skew_ms(aligned=True):.2f} ms in the audio after {late} late "
+                     f"device(s) skipped ahead")
+        print(f"{line} (tolerance {self.tolerance_ms:g} ms)")
@@ -0,0 +1,134 @@
+"""
+Adaptive per-device buffer sizing.
+
+A larger ``frames_per_buffer`` makes a stream more tolerant of scheduling
+hiccups at the cost of latency. In adaptive mode every device starts from a
+small, low-latency buffer. Each underflow doubles it, and so does a write
+that stalled for longer than the buffer holds. After a clean run it is
+halved for as long as the smaller buffer would still have covered the
+longest stall seen and is not known to underflow, so over a few runs each
+device settles on the smallest buffer it plays cleanly with. A size known
+to underflow is retried after a number of clean runs, in case whatever
+caused it has gone away. The result is stored per device name in the config.
+"""
+
+# Clean runs after which the largest size known to underflow is halved
+FLOOR_DECAY_RUNS = 5
+
+
+class BufferTuner:
+    """Tracks underflows of one device and picks its next buffer size."""
+
+    def __init__(self, device_index, frames, floor=0, min_frames=256, max_frames=16384, clean_runs=0):
+        """
+        Args:
+            device_index: Index of the audio device
+            frames: Buffer size to start with, in frames
+            floor: Largest buffer size known to underflow on this device
+            min_frames: Smallest buffer size to try
+            max_frames: Largest buffer size to grow to
+            clean_runs: Runs without an underflow since floor last changed
+        """
+        self.device_index = device_index
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.frames = min(max(frames, min_frames), max_frames)
+        self.floor = floor
+        self.clean_runs = clean_runs
+        self.underflows = 0
+        self.longest_stall = 0.0
+        self.capacity = None
+        self._unanswered = False
+        self._primed = False
+
+    @classmethod
+    def from_config(cls, cfg, device_index, device_name):
+        """Create a tuner from the saved size of a device, starting small if there is none."""
+        options = cfg["playback"]
+        saved = cfg["buffer_sizes"].get(device_name, {})
+        return cls(device_index, saved.get("frames", options["min_buffer_size"]),
+                   saved.get("floor", 0), options["min_buffer_size"], options["max_buffer_size"],
+                   saved.get("clean_runs", 0))
+
+    def restart(self, capacity=None):
+        """
+        Begin watching a stream afresh, e.g. after it was reopened or starved
+        of audio by the decoder, which is no fault of the buffer size.
+
+        Args:
+            capacity: Free buffer space of the newly opened, empty stream in frames
+        """
+        if capacity is not None:
+            self.capacity = capacity
+        self._primed = False
+
+    def check_buffer(self, available):
+        """
+        Check a blocking stream's free buffer space just before a write.
+        A completely empty buffer after the first write means the device ran
+        out of audio.
+        """
+        if self._primed and self.capacity and available >= self.capacity:
+            self.record_underflow()
+        self._primed = True
+
+    def record_write(self, seconds, frames, rate):
+        """
+        Note how long a blocking write took. Beyond the time the device needs
+        to play the written frames, a write only blocks when the device stalls;
+        a stall longer than the buffer holds left it without audio.
+
+        Args:
+            seconds: Duration of the write
+            frames: Number of frames written
+            rate: Sample rate of the stream
+        """
+        stall = seconds - frames / rate
+        if stall <= 0:
+            return
+        self.longest_stall = max(self.longest_stall, stall * rate)
+        if stall * rate > self.frames and not self._unanswered:
+            self.record_underflow()
+
+    def needs_growth(self):
+        """Check whether an underflow has been seen since the buffer last grew."""
+        return self._unanswered
+
+    def record_underflow(self):
+        """Note that the device ran out of audio at the current size."""
+        self.underflows += 1
+        self._unanswered = True
+
+    def grow(self):
+        """
+        Double the buffer after an underflow.
+        Returns the new size, or None if it is already at the maximum.
+        """
+        self._unanswered = False
+        self.floor = max(self.floor, self.frames)
+        if self.frames >= self.max_frames:
+            return None
+        self.frames = min(self.frames * 2, self.max_frames)
+        print(f"Device {self.device_index} underflowed, buffer grown to {self.frames} frames")
+        return self.frames
+
+    def settle(self):
+        """Return the size to start with next time, based on how this run went."""
+        if self._unanswered:
+            self.grow()
+        if self.underflows:
+            self.clean_runs = 0
+            return self.frames
+        self.clean_runs += 1
+        if self.floor and self.clean_runs >= FLOOR_DECAY_RUNS:
+            self.floor = self.floor // 2 if self.floor // 2 >= self.min_frames else 0
+            self.clean_runs = 0
+        frames = self.frames
+        while frames // 2 >= self.min_frames and frames // 2 > self.floor and frames // 2 > self.longest_stall:
+            frames //= 2
+        return frames
+
+    def to_config(self):
+        """The entry stored under "buffer_sizes" for this device."""
+        frames = self.settle()
+        return {"frames": frames, "floor": self.floor, "clean_runs": self.clean_runs}
@@ -2,14 +2,109 @@
 Utility functions for the Bluetooth audio player.
 """
 import os
+import json
+import math
 import platform
 import sys
 import shutil
+import subprocess
+from contextlib import contextmanager
+
+# Tool probes already made by this process, by tool name
+_tool_versions = {}
+
+# Optional JSON file remembering probes across runs
+_probe_cache_path = None
+
+def set_probe_cache(path):
+    """
+    Remember tool probes in a JSON file so later runs skip them.
+    Entries are invalidated when the tool's executable changes.
+
+    Args:
+        path: Path of the cache file, or None to probe every run
+    """
+    global _probe_cache_path
+    _probe_cache_path = path
+
+def _load_probe_cache():
+    try:
+        with open(_probe_cache_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_probe_cache(cache):
+    try:
+        tmp_path = _probe_cache_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=4)
+        os.replace(tmp_path, _probe_cache_path)
+    except OSError as e:
+        print(f"Warning: Could not save tool cache: {e}")
+
+def tool_version(name):
+    """
+    Get the first line of a tool's -version output, probing it at most once
+    per process. Returns None if the tool is not installed or fails to run.
+
+    Args:
+        name: Command name, e.g. "ffmpeg"
+    """
+    if name in _tool_versions:
+        return _tool_versions[name]
+
+    path = shutil.which(name)
+    version = None
+    if path is not None:
+        stat = os.stat(path)
+        # A different executable or an upgrade in place changes the key
+        key = f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        cache = _load_probe_cache() if _probe_cache_path else {}
+        entry = cache.get(name)
+        if entry is not None and entry.get("key") == key:
+            version = entry["version"]
+        else:
+            try:
+                result = subprocess.run([path, "-version"], stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True, check=True)
+                lines = result.stdout.splitlines()
+                version = lines[0] if lines else name
+            except (subprocess.SubprocessError, OSError):
+                version = None
+            if _probe_cache_path and version is not None:
+                cache[name] = {"key": key, "version": version}
+                _save_probe_cache(cache)
+
+    _tool_versions[name] = version
+    return version
 
 def is_tool_available(name):
     """Check if a command-line tool is available."""
     return shutil.which(name) is not None
 
+def parse_time(text):
+    """
+    Parse a time given as seconds ("90.5") or as minutes and seconds, with
+    optional hours ("1:30", "1:02:03.5"). Returns seconds as a float.
+    
+    Raises ValueError for anything else, including negative parts and
+    "nan" or "inf", which FFmpeg and the seek arithmetic cannot use.
+    """
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        value = float(part)
+        if not math.isfinite(value) or value < 0 or part.strip().startswith('-'):
+            raise ValueError(f"invalid time: {text}")
+        seconds = seconds * 60 + value
+    return seconds
+
+def format_time(seconds):
+    """Format seconds as m:ss.s, the inverse of parse_time."""
+    # Rounded first, so that 59.96 becomes 1:00.0 rather than 0:60.0
+    minutes, seconds = divmod(round(seconds, 1), 60)
+    return f"{int(minutes)}:{seconds:04.1f}"
+
 def clean_temp_files(file_path):
     """Remove temporary files."""
     if os.path.exists(file_path):
@@ -22,6 +117,27 @@ def clean_temp_files(file_path):
             return False
     return False
 
+@contextmanager
+def file_lock(lock_path):
+    """Hold an exclusive lock on lock_path, shared across processes."""
+    with open(lock_path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
 def get_system_info():
     """Get and print system information."""
     system_info = {
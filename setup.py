@@ -25,9 +25,13 @@ setup(
     install_requires=[
         "pyaudio>=0.2.11",
     ],
+    extras_require={
+        "dsp": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "bt-audio-multiplexer=bluetooth_audio_player.main:main",
+            "bt-audio-ctl=bluetooth_audio_player.client:main",
         ],
     },
 )
\ No newline at end of file